@@ -7,6 +7,9 @@ import threading
 import math
 import random
 
+from protocolo import aplicar_delta
+from protocolo_binario import encode_message, decode_message
+
 
 class Lanzador:
     def __init__(self, host="wss://juegoothelloia.onrender.com", nombre="IA_EXPERTA"):
@@ -17,6 +20,9 @@ class Lanzador:
         self.color_jugador = None
         self.tablero = np.zeros((8, 8), dtype=int)
         self.turno_actual = 1
+        self.estado = None  # Último game_state completo (base para aplicar deltas)
+        self.salientes = []  # Mensajes a enviar tras procesar el mensaje actual
+        self.binario = False  # Protocolo binario negociado (se activa al enviar el hello)
 
         # Visual
         self.celda = 75
@@ -35,15 +41,22 @@ class Lanzador:
 
                 await self.enviar_mensaje({"type": "join", "name": self.nombre})
                 async for msg in websocket:
-                    data = json.loads(msg)
+                    data = decode_message(msg) if isinstance(msg, bytes) else json.loads(msg)
                     self.procesar_mensaje(data)
+                    while self.salientes:
+                        await self.enviar_mensaje(self.salientes.pop(0))
         except Exception as e:
             print(f"❌ Error al conectar al servidor: {e}")
 
     async def enviar_mensaje(self, mensaje):
         try:
             if self.ws:
-                await self.ws.send(json.dumps(mensaje))
+                if self.binario:
+                    await self.ws.send(encode_message(mensaje))
+                else:
+                    await self.ws.send(json.dumps(mensaje))
+                if mensaje.get("type") == "hello" and "binary" in mensaje.get("features", []):
+                    self.binario = True
         except Exception as e:
             print(f"❌ Error enviando mensaje: {e}")
 
@@ -56,16 +69,28 @@ class Lanzador:
         if tipo == "welcome":
             self.color_jugador = data["player_color"]
             print(f"🎮 {data['message']}")
+            pedidas = [f for f in ("delta", "binary") if f in data.get("features", [])]
+            if pedidas:
+                self.salientes.append({"type": "hello", "features": pedidas})
         elif tipo == "waiting":
             print("⌛ Esperando segundo jugador...")
         elif tipo == "game_start":
             self.juego_activo = True
             estado = data["game_state"]
+            self.estado = estado
             self.tablero = np.array(estado["board"])
             self.turno_actual = estado["current_player"]
             print("✅ ¡Juego iniciado!")
-        elif tipo == "game_update":
-            estado = data["game_state"]
+        elif tipo in ("game_update", "game_delta"):
+            if tipo == "game_delta":
+                estado = aplicar_delta(self.estado, data)
+                if estado is None:
+                    print("⚠️ Hueco en la secuencia de deltas, pidiendo estado completo")
+                    self.salientes.append({"type": "sync"})
+                    return
+            else:
+                estado = data["game_state"]
+            self.estado = estado
             self.tablero = np.array(estado["board"])
             self.turno_actual = estado["current_player"]
 
@@ -1,247 +1,187 @@
+# WebServidor.py - Servidor Othello multi-sala sobre WebSocket
+#
+# El motor es el de servidor_multisala.py (salas actor, emparejamiento FIFO,
+# sesiones, espectadores, diario, archivo, métricas, heartbeat y límites):
+# aquí solo cambia el transporte. Cada conexión WebSocket es un ClientHandler
+# cuyos mensajes salen como marcos de texto (JSON) o binarios según lo
+# negociado en el hello, así que un proceso atiende miles de partidas.
+#
+# Compatible con WebLanzador.py: al conectarse se recibe welcome/waiting
+# (o game_start si había un oponente esperando), 'join' se responde con 'ack'
+# y 'move' se juega en la sala del jugador. Para observar una partida se
+# manda 'spectate' (ver servidor_multisala.py).
+#
+# Por conexión se desactivan el keepalive propio de websockets (una tarea por
+# conexión; el heartbeat ya lo hace la rueda de temporizadores del servidor) y
+# permessage-deflate (decenas de KB de estado zlib por conexión para mensajes
+# de pocos bytes).
+#
+# Detrás de un proxy (Render) todas las conexiones llegan desde su IP: con
+# TRUST_PROXY=1 el límite por IP usa la dirección que agrega el proxy en
+# X-Forwarded-For.
 import asyncio
-import websockets
 import json
-import numpy as np
 import os
+import time
 
+import websockets
 
-class OthelloGame:
-    def __init__(self):
-        self.board = np.zeros((8, 8), dtype=int)
-        self.current_player = 1
-        self.game_over = False
-        self.winner = None
-        # Posición inicial
-        self.board[3][3] = 2
-        self.board[4][4] = 2
-        self.board[3][4] = 1
-        self.board[4][3] = 1
-
-    def get_valid_moves(self, player):
-        valid_moves = []
-        for r in range(8):
-            for c in range(8):
-                if self.is_valid_move(r, c, player):
-                    valid_moves.append([r, c])
-        return valid_moves
-
-    def is_valid_move(self, row, col, player):
-        if self.board[row][col] != 0:
-            return False
-        opp = 3 - player
-        dirs = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        for dr, dc in dirs:
-            r, c = row+dr, col+dc
-            found = False
-            while 0 <= r < 8 and 0 <= c < 8:
-                if self.board[r][c] == opp:
-                    found = True
-                    r += dr
-                    c += dc
-                elif self.board[r][c] == player and found:
-                    return True
-                else:
-                    break
-        return False
-
-    def make_move(self, row, col, player):
-        if not self.is_valid_move(row, col, player):
-            return False
-        self.board[row][col] = player
-        opp = 3 - player
-        dirs = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        for dr, dc in dirs:
-            r, c = row+dr, col+dc
-            flips = []
-            while 0 <= r < 8 and 0 <= c < 8:
-                if self.board[r][c] == opp:
-                    flips.append((r, c))
-                    r += dr
-                    c += dc
-                elif self.board[r][c] == player:
-                    for fr, fc in flips:
-                        self.board[fr][fc] = player
-                    break
-                else:
-                    break
-        return True
-
-    def get_scores(self):
-        black = int(np.sum(self.board == 1))
-        white = int(np.sum(self.board == 2))
-        return {"black": black, "white": white}
-
-    def check_game_over(self):
-        if not self.get_valid_moves(1) and not self.get_valid_moves(2):
-            self.game_over = True
-            scores = self.get_scores()
-            if scores["black"] > scores["white"]:
-                self.winner = 1
-            elif scores["white"] > scores["black"]:
-                self.winner = 2
-            else:
-                self.winner = 0
-            return True
-        return False
-
-    def get_state(self):
-        return {
-            "board": self.board.tolist(),
-            "current_player": int(self.current_player),
-            "valid_moves": self.get_valid_moves(self.current_player),
-            "scores": self.get_scores(),
-            "game_over": self.game_over,
-            "winner": self.winner
-        }
-
-
-class GameServer:
-    def __init__(self):
-        self.clients = []
-        self.player_colors = {}
-        self.game = None
-
-    async def handler(self, websocket):
-        if len(self.clients) >= 2:
-            await websocket.send(json.dumps({
-                "type": "error",
-                "message": "Servidor lleno"
-            }))
-            await websocket.close()
-            return
-
-        self.clients.append(websocket)
-        color = len(self.clients)
-        self.player_colors[websocket] = color
-
-        await websocket.send(json.dumps({
-            "type": "welcome",
-            "player_color": color,
-            "message": f"Eres el jugador {'Negro' if color == 1 else 'Blanco'}"
-        }))
-
-        if len(self.clients) == 1:
-            await websocket.send(json.dumps({
-                "type": "waiting",
-                "message": "Esperando segundo jugador..."
-            }))
-        elif len(self.clients) == 2:
-            self.game = OthelloGame()
-            msg = {
-                "type": "game_start",
-                "message": "¡Juego iniciado!",
-                "game_state": self.game.get_state()
-            }
-            await asyncio.gather(*[c.send(json.dumps(msg)) for c in self.clients])
-
+from limitador import DEMORAR, DESCARTAR, RateLimited
+from protocolo_binario import FrameReader, SharedMessage, encode_message, decode_message
+from registro import get_logger
+from servidor_multisala import ClientHandler, OthelloServerMultiRoom
+
+log = get_logger()
+
+
+class WebSocketClientHandler(ClientHandler):
+    """Conexión WebSocket de un jugador o espectador: un marco por mensaje"""
+    transport = 'ws'
+
+    def __init__(self, websocket, server):
+        address = websocket.remote_address
+        forwarded = websocket.request_headers.get('X-Forwarded-For') if server.trust_proxy else None
+        if forwarded:
+            # La última dirección es la que vio el proxy (las anteriores las manda el cliente)
+            address = (forwarded.split(',')[-1].strip(), 0)
+        super().__init__(None, None, server, address)
+        self.websocket = websocket
+
+    def encode(self, message):
+        """Texto JSON o bytes del protocolo binario (SharedMessage: codificado una vez)"""
+        if isinstance(message, SharedMessage):
+            return message.websocket(self.binary)
+        if self.binary:
+            return encode_message(message)
+        return json.dumps(message)
+
+    async def write_messages(self):
+        """Envía lo encolado, un marco WebSocket por mensaje"""
         try:
-            async for data in websocket:
-                message = json.loads(data)
-                await self.process_message(websocket, message)
+            while self.active:
+                await self.outbound_ready.wait()
+                self.outbound_ready.clear()
+                messages = self.outbound.drain_messages()
+                if messages:
+                    self.metrics.queue_depth.observe(len(messages))
+                for data in messages:
+                    self.metrics.bytes_out.inc(len(data))
+                    await self.websocket.send(data)
+        except asyncio.CancelledError:
+            pass
         except websockets.ConnectionClosed:
-            await self.disconnect(websocket)
+            self.disconnect()
+        except Exception as e:
+            log.error('send_error', client=self.peer, error=repr(e))
+            self.disconnect()
+
+    async def admit(self):
+        """Consulta el límite antes de decodificar: True si el mensaje pasa.
+
+        Mientras espera fichas no se leen más marcos; websockets deja de leer
+        el socket al llenar su cola y el cliente queda frenado por TCP.
+        """
+        while self.active:
+            action = self.limit.check()
+            if action is None:
+                return True
+            if action == DESCARTAR:
+                return False
+            await asyncio.sleep(self.limit.wait)
+        return False
 
-    # ==========================================================
-    # 🔧 Mensajes procesados (join + move)
-    # ==========================================================
-    async def process_message(self, websocket, message):
+    async def receive_messages(self):
+        """Recibe mensajes del cliente hasta que cierre la conexión"""
         try:
-            tipo = message.get("type")
-
-            if tipo == "join":
-                nombre = message.get("name", "IA")
-                await websocket.send(json.dumps({
-                    "type": "ack",
-                    "message": f"Jugador {nombre} conectado correctamente"
-                }))
-                return
-
-            if tipo == "move":
-                await self.handle_move(websocket, message)
-                return
-
-            await websocket.send(json.dumps({
-                "type": "error",
-                "message": f"Tipo de mensaje desconocido: {tipo}"
-            }))
+            async for data in self.websocket:
+                self.metrics.bytes_in.inc(len(data))
+                self.last_seen = self.server.timers.now()
+                if self.limit and not await self.admit():
+                    continue
+                try:
+                    message = decode_message(data) if isinstance(data, bytes) else json.loads(data)
+                except ValueError as e:
+                    log.warning('decode_error', client=self.peer, error=str(e))
+                    continue
+                self.handle_message(message)
+            log.info('client_closed', client=self.peer)
+        except (websockets.ConnectionClosed, ConnectionResetError, BrokenPipeError) as e:
+            # Los cortes sin handshake de cierre también son un cliente que se fue
+            log.info('client_closed', client=self.peer, error=repr(e))
+        except asyncio.CancelledError:
+            pass
+        except RateLimited as e:
+            log.warning('rate_limited', client=self.peer, error=str(e))
         except Exception as e:
-            await websocket.send(json.dumps({
-                "type": "error",
-                "message": f"Error interno del servidor: {str(e)}"
-            }))
-            import traceback
-            traceback.print_exc()
-
-    # ==========================================================
-    # 🔥 Lógica de movimientos
-    # ==========================================================
-    async def handle_move(self, websocket, message):
-        if not self.game or self.game.game_over:
-            await websocket.send(json.dumps({
-                "type": "move_response",
-                "success": False,
-                "message": "Juego no activo"
-            }))
-            return
-
-        color = self.player_colors.get(websocket)
-        if color != self.game.current_player:
-            await websocket.send(json.dumps({
-                "type": "move_response",
-                "success": False,
-                "message": "No es tu turno"
-            }))
-            return
-
-        r, c = message.get("row"), message.get("col")
-        if r is None or c is None:
-            await websocket.send(json.dumps({
-                "type": "move_response",
-                "success": False,
-                "message": "Movimiento inválido (faltan coordenadas)"
-            }))
-            return
-
-        if self.game.make_move(r, c, color):
-            print(f"🎯 Jugador {color} movió a ({r},{c})")  # 🆕 Log en consola
-            self.game.current_player = 3 - self.game.current_player
-            self.game.check_game_over()
-            update = {
-                "type": "game_update",
-                "game_state": self.game.get_state()
-            }
-            await asyncio.gather(*[c.send(json.dumps(update)) for c in self.clients])
-        else:
-            await websocket.send(json.dumps({
-                "type": "move_response",
-                "success": False,
-                "message": "Movimiento inválido"
-            }))
-
-    # ==========================================================
-    # 🔻 Desconexión
-    # ==========================================================
-    async def disconnect(self, websocket):
-        if websocket in self.clients:
-            self.clients.remove(websocket)
-            for c in self.clients:
-                await c.send(json.dumps({
-                    "type": "opponent_disconnected",
-                    "message": "Tu oponente se desconectó"
-                }))
-            self.game = None
-            self.player_colors = {}
+            log.error('receive_error', client=self.peer, error=repr(e))
+
+        self.disconnect()
+
+    def handle_message(self, message):
+        if message.get('type') == 'join':
+            # Como el servidor de una sola partida: el join se confirma
+            self.send_message({
+                'type': 'ack',
+                'message': f"Jugador {message.get('name', 'IA')} conectado correctamente"
+            })
+        super().handle_message(message)
+
+    def close(self):
+        """Cierra el WebSocket (el async for de receive_messages termina)"""
+        asyncio.ensure_future(self.websocket.close())
+
+
+class OthelloWebServer(OthelloServerMultiRoom):
+    """Servidor multi-sala cuyas conexiones son WebSocket"""
+
+    def __init__(self, host='0.0.0.0', port=5555, trust_proxy=False, **options):
+        super().__init__(host, port, **options)
+        self.trust_proxy = trust_proxy  # Tomar la IP del cliente de X-Forwarded-For
+
+    async def listen(self):
+        self.server = await websockets.serve(
+            self.handle_websocket, self.host, self.port, backlog=self.backlog,
+            max_size=FrameReader.MAX_FRAME, compression=None, ping_interval=None)
+
+    async def handle_websocket(self, websocket):
+        """Atiende una conexión WebSocket durante toda su vida"""
+        start = time.perf_counter()
+        client_handler = WebSocketClientHandler(websocket, self)
+        self.register(client_handler)
+
+        # Intentar emparejar inmediatamente
+        self.match_player(client_handler)
+        self.metrics.accept_seconds.observe(time.perf_counter() - start)
+
+        await client_handler.receive_messages()
 
 
 # ==============================================================
 # MAIN
 # ==============================================================
-async def main():
+if __name__ == "__main__":
+    # Render define el puerto en la variable de entorno PORT
     port = int(os.environ.get("PORT", 5555))
-    async with websockets.serve(GameServer().handler, "0.0.0.0", port):
-        print(f"🚀 Servidor WebSocket corriendo en puerto {port}")
-        await asyncio.Future()  # Mantenerlo activo
 
-
-if __name__ == "__main__":
-    asyncio.run(main())
+    # Las mismas variables que servidor_multisala.py (JOURNAL_DIR, ARCHIVE_PATH,
+    # METRICS_PORT, LOG_*, MOVE_TIMEOUT, HANDSHAKE_TIMEOUT, RATE_LIMIT_ACTION,
+    # BOT_WAIT, BOT_DIFFICULTY, ANALYSIS_WORKERS)
+    # TRUST_PROXY=1 toma la IP del cliente de X-Forwarded-For
+    metrics_port = os.environ.get("METRICS_PORT")
+    move_timeout = os.environ.get("MOVE_TIMEOUT")
+    handshake_timeout = os.environ.get("HANDSHAKE_TIMEOUT")
+    bot_wait = os.environ.get("BOT_WAIT")
+    analysis_workers = os.environ.get("ANALYSIS_WORKERS")
+    server = OthelloWebServer(host="0.0.0.0", port=port,
+                              trust_proxy=os.environ.get("TRUST_PROXY") == "1",
+                              journal_dir=os.environ.get("JOURNAL_DIR"),
+                              archive_path=os.environ.get("ARCHIVE_PATH"),
+                              metrics_port=int(metrics_port) if metrics_port else None,
+                              move_timeout=float(move_timeout) if move_timeout else None,
+                              handshake_timeout=float(handshake_timeout) if handshake_timeout else None,
+                              rate_action=os.environ.get("RATE_LIMIT_ACTION", DEMORAR),
+                              bot_wait=float(bot_wait) if bot_wait else None,
+                              bot_difficulty=os.environ.get("BOT_DIFFICULTY", "medium"),
+                              analysis={'workers': int(analysis_workers)} if analysis_workers else None)
+    print(f"🚀 Servidor WebSocket multi-sala corriendo en puerto {port}")
+    server.start()
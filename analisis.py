@@ -0,0 +1,236 @@
+# analisis.py - Servicio de análisis de posiciones por lotes (pistas y revisión)
+#
+# Las pistas ('hint') y la revisión de partidas ('analyze') piden el mejor
+# movimiento de una posición. Calcular un minimax por pedido no escala, así
+# que el servicio:
+#   - identifica cada posición por sus máscaras de 64 bits (negras, blancas),
+#     el jugador y la profundidad: esa tupla es la clave de caché y de
+#     deduplicación
+#   - responde desde una caché LRU si ya la analizó
+#   - si la posición ya está en cola o calculándose, el pedido espera ese
+#     mismo resultado (muchas salas / espectadores pidiendo la misma posición
+#     cuestan un solo análisis)
+#   - junta lo pendiente en lotes de hasta LOTE posiciones (esperando a lo sumo
+#     ESPERA_LOTE segundos) y manda cada lote a un pool de procesos, con a lo
+#     sumo un lote por proceso: la cola queda acá, donde se puede medir y acotar
+#
+# El análisis usa la evaluación de OthelloAI (lanzador.py) con alfa-beta y
+# devuelve la variante principal: con la misma profundidad, el mejor
+# movimiento y el puntaje coinciden con OthelloAI.minimax_move.
+#
+# Resultado (el servidor lo manda como {"type": "analysis", ...}):
+#
+#   {"best_move": [2, 3], "score": 14, "pv": [[2, 3], [2, 2], [3, 2]], "depth": 3}
+#
+# Con la cola llena (MAX_COLA posiciones) el pedido se rechaza (AnalysisBusy).
+import asyncio
+import time
+from collections import OrderedDict, deque
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from bots import BOT_WORKERS, PRIORIDAD, make_pool
+from lanzador import OthelloAI
+from protocolo_binario import board_to_masks, masks_to_board
+from registro import get_logger
+
+log = get_logger()
+
+ANALISIS_WORKERS = BOT_WORKERS
+LOTE = 16  # Posiciones por lote
+ESPERA_LOTE = 0.005  # Segundos que se espera a completar un lote
+CACHE = 50000  # Posiciones analizadas que se guardan (LRU)
+MAX_COLA = 1024  # Posiciones esperando un proceso antes de rechazar pedidos
+PROFUNDIDAD = 3
+PROFUNDIDAD_MAXIMA = 4
+
+_ai = None  # OthelloAI de cada proceso del pool
+
+
+class AnalysisBusy(Exception):
+    """La cola de análisis está llena"""
+
+
+def principal_variation(ai, board, depth, is_maximizing, player_color, alpha, beta):
+    """Como OthelloAI.minimax, pero retorna (puntaje, variante principal)"""
+    if depth == 0:
+        return int(ai.evaluate_board(board, player_color)), []
+
+    current_player = player_color if is_maximizing else 3 - player_color
+    valid_moves = ai.get_valid_moves_from_board(board, current_player)
+    if not valid_moves:
+        return int(ai.evaluate_board(board, player_color)), []
+
+    best_score = -float('inf') if is_maximizing else float('inf')
+    best_line = []
+    for row, col in valid_moves:
+        temp_board = ai.simulate_move(board, row, col, current_player)
+        score, line = principal_variation(ai, temp_board, depth - 1, not is_maximizing,
+                                          player_color, alpha, beta)
+        if is_maximizing:
+            if score > best_score:
+                best_score, best_line = score, [[row, col]] + line
+            alpha = max(alpha, score)
+        else:
+            if score < best_score:
+                best_score, best_line = score, [[row, col]] + line
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best_score, best_line
+
+
+def analyze_batch(batch):
+    """Corre en el pool: analiza una lista de claves (negras, blancas, jugador, profundidad)"""
+    global _ai
+    if _ai is None:
+        _ai = OthelloAI('hard')
+    results = []
+    for black, white, player, depth in batch:
+        board = np.array(masks_to_board(black, white))
+        score, line = principal_variation(_ai, board, depth, True, player, -float('inf'), float('inf'))
+        results.append({
+            'best_move': line[0] if line else None,
+            'score': score,
+            'pv': line,
+            'depth': depth
+        })
+    return results
+
+
+class AnalysisService:
+    """API en proceso: request()/analyze() con caché LRU, deduplicación y lotes"""
+
+    def __init__(self, metrics, workers=ANALISIS_WORKERS, batch_size=LOTE, batch_wait=ESPERA_LOTE,
+                 cache_size=CACHE, max_queue=MAX_COLA, depth=PROFUNDIDAD, max_depth=PROFUNDIDAD_MAXIMA,
+                 niceness=PRIORIDAD):
+        self.metrics = metrics
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.cache_size = cache_size
+        self.max_queue = max_queue
+        self.depth = depth  # Si el pedido no dice otra
+        self.max_depth = max_depth
+        self.niceness = niceness
+        self.cache = OrderedDict()  # {clave: resultado}, la más reciente al final
+        self.pending = {}  # {clave: Future} en cola o calculándose
+        self.queue = deque()  # Claves esperando lote
+        self.computing = 0  # Posiciones en el pool
+        self.executor = None
+        self.task = None
+        self.wakeup = None
+        self.slots = None  # Semáforo: un lote por proceso
+
+    def start(self):
+        """Arranca el pool y la tarea que arma los lotes"""
+        if self.task is None:
+            self.executor = make_pool(self.workers, self.niceness)
+            self.wakeup = asyncio.Event()
+            self.slots = asyncio.Semaphore(self.workers)
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def key(self, board, player, depth=None):
+        """Clave de la posición; valida el tablero, el jugador y la profundidad"""
+        if len(board) != 8 or any(len(row) != 8 or any(cell not in (0, 1, 2) for cell in row) for row in board):
+            raise ValueError("El tablero debe ser de 8x8 con valores 0, 1 o 2")
+        if player not in (1, 2):
+            raise ValueError("El jugador debe ser 1 o 2")
+        depth = self.depth if depth is None else depth
+        if not isinstance(depth, int) or depth < 1:
+            raise ValueError("La profundidad debe ser un entero positivo")
+        black, white = board_to_masks(board)
+        return black, white, player, min(depth, self.max_depth)
+
+    def request(self, board, player, depth=None):
+        """Future con el resultado (ya resuelto si estaba en caché).
+
+        Lanza ValueError si la posición es inválida y AnalysisBusy si la cola
+        está llena. El resultado se comparte entre pedidos: no modificarlo.
+        """
+        key = self.key(board, player, depth)
+        self.metrics.analysis_requests.inc()
+        loop = asyncio.get_running_loop()
+
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            self.metrics.analysis_cache_hits.inc()
+            future = loop.create_future()
+            future.set_result(result)
+            return future
+
+        future = self.pending.get(key)
+        if future is not None:
+            self.metrics.analysis_coalesced.inc()
+            return future
+
+        if len(self.queue) >= self.max_queue:
+            self.metrics.analysis_rejected.inc()
+            raise AnalysisBusy(f"Hay {len(self.queue)} posiciones esperando análisis")
+        self.start()
+        future = self.pending[key] = loop.create_future()
+        self.queue.append(key)
+        self.wakeup.set()
+        return future
+
+    async def analyze(self, board, player, depth=None):
+        """Resultado del análisis (cancelar la espera no cancela el cálculo compartido)"""
+        return await asyncio.shield(self.request(board, player, depth))
+
+    async def run(self):
+        """Arma lotes con lo encolado; a lo sumo un lote por proceso del pool"""
+        while True:
+            while not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            if len(self.queue) < self.batch_size:
+                await asyncio.sleep(self.batch_wait)
+            await self.slots.acquire()
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            asyncio.get_running_loop().create_task(self.compute(batch))
+
+    async def compute(self, batch):
+        """Manda un lote al pool y reparte los resultados"""
+        start = time.perf_counter()
+        executor = self.executor
+        self.computing += len(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(executor, analyze_batch, batch)
+        except Exception as e:
+            log.error('analysis_error', positions=len(batch), error=repr(e))
+            if isinstance(e, BrokenProcessPool) and self.executor is executor:
+                # Murió un proceso (p. ej. por memoria): los próximos lotes van a un pool nuevo
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = make_pool(self.workers, self.niceness)
+            for key in batch:
+                future = self.pending.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.computing -= len(batch)
+            self.slots.release()
+
+        self.metrics.analysis_batch_size.observe(len(batch))
+        self.metrics.analysis_batch_seconds.observe(time.perf_counter() - start)
+        for key, result in zip(batch, results):
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            future = self.pending.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.queue.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,214 @@
+# archivo_partidas.py - Archivo compacto de partidas terminadas
+#
+# Dos archivos:
+#   partidas.dat  cabecera (magic, versión, tamaño de registro) y luego un
+#                 registro de tamaño fijo por partida
+#   partidas.idx  un offset uint64 por partida; una partida es visible para los
+#                 lectores solo cuando su offset está escrito (el registro va antes)
+#
+# Registro (89 bytes, little-endian):
+#   sala (16, UUID) | terminada_en (float64, epoch) | negras (1) | blancas (1) |
+#   ganador (1, 0 empate / 1 / 2 / 255 sin ganador) | flags (1) |
+#   cantidad de movimientos (1) | movimientos (60, casilla fila*8+col, 255 relleno)
+#
+# La lectura usa mmap: ArchiveReader no carga el archivo en memoria y expone
+# los registros como un arreglo estructurado de numpy para recorrer o muestrear
+# millones de partidas.
+#
+# Uso: python archivo_partidas.py partidas.dat [--muestra N]
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+import uuid
+
+import numpy as np
+
+from protocolo import calcular_volteos, movimientos_validos
+
+MAGIC = b'OTHA'
+VERSION = 1
+MAX_MOVES = 60
+NO_MOVE = 255
+NO_WINNER = 255
+
+FLAG_FINISHED = 0x01  # Terminó por reglas
+FLAG_ABANDONED = 0x02  # Un jugador se fue antes del final
+
+HEADER = struct.Struct('<4sHH')
+RECORD = struct.Struct(f'<16sdBBBBB{MAX_MOVES}s')
+OFFSET = struct.Struct('<Q')
+
+RECORD_DTYPE = np.dtype([
+    ('room', 'S16'),
+    ('finished_at', '<f8'),
+    ('black', 'u1'),
+    ('white', 'u1'),
+    ('winner', 'u1'),
+    ('flags', 'u1'),
+    ('count', 'u1'),
+    ('moves', 'u1', (MAX_MOVES,)),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+def index_path(path):
+    return os.path.splitext(path)[0] + '.idx'
+
+
+class GameArchive:
+    """Escritor: agrega una partida por registro (abre en modo append)"""
+
+    def __init__(self, path):
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.data = open(path, 'ab')
+        self.index = open(index_path(path), 'ab')
+        if new:
+            self.data.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            self.data.flush()
+        self.games = 0
+
+    def append(self, room_id, game, flags=FLAG_FINISHED):
+        """Guarda la partida de un OthelloGame (usa game.moves)"""
+        moves = bytes(game.moves[:MAX_MOVES])
+        scores = game.get_scores()
+        winner = getattr(game, 'winner', None)
+        if winner is None and flags & FLAG_FINISHED:
+            winner = 1 if scores['black'] > scores['white'] else 2 if scores['white'] > scores['black'] else 0
+        record = RECORD.pack(
+            uuid.UUID(room_id).bytes, time.time(), scores['black'], scores['white'],
+            NO_WINNER if winner is None else winner, flags, len(moves),
+            moves.ljust(MAX_MOVES, bytes((NO_MOVE,))))
+
+        offset = self.data.tell()
+        self.data.write(record)
+        self.data.flush()
+        self.index.write(OFFSET.pack(offset))
+        self.index.flush()
+        self.games += 1
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class ArchiveReader:
+    """Lector por mmap: acceso aleatorio sin cargar el archivo en memoria"""
+
+    def __init__(self, path):
+        self.path = path
+        # Primero el índice: todo lo que indexa ya está en partidas.dat
+        self.index = None
+        self.offsets = np.zeros(0, dtype='<u8')
+        if os.path.getsize(index_path(path)) >= OFFSET.size:
+            with open(index_path(path), 'rb') as f:
+                self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            count = len(self.index) // OFFSET.size
+            self.offsets = np.frombuffer(self.index, dtype='<u8', count=count)
+
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} no es un archivo de partidas v{VERSION}")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        room, finished_at, black, white, winner, flags, count, moves = \
+            RECORD.unpack_from(self.data, int(self.offsets[i]))
+        return {
+            'room_id': str(uuid.UUID(bytes=room)),
+            'finished_at': finished_at,
+            'scores': {'black': black, 'white': white},
+            'winner': None if winner == NO_WINNER else winner,
+            'flags': flags,
+            'moves': [[square // 8, square % 8] for square in moves[:count]],
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sample(self, n, rng=random):
+        """n partidas al azar (sin repetir)"""
+        return [self[i] for i in rng.sample(range(len(self)), min(n, len(self)))]
+
+    def records(self):
+        """Todas las partidas indexadas como arreglo estructurado de numpy.
+
+        Si los registros están contiguos desde la cabecera (lo normal) es una
+        vista sobre el mmap. Un corte entre el registro y su offset deja un
+        registro sin indexar (o uno a medias) en partidas.dat: entonces se
+        copian los registros de cada offset del índice.
+        """
+        count = len(self)
+        contiguous = HEADER.size + np.arange(count, dtype='<u8') * RECORD.size
+        if np.array_equal(self.offsets, contiguous):
+            return np.frombuffer(self.data, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+        raw = np.frombuffer(self.data, dtype=np.uint8)
+        rows = raw[self.offsets.astype(np.intp)[:, None] + np.arange(RECORD.size)]
+        return rows.view(RECORD_DTYPE).reshape(count)
+
+    def close(self):
+        # Soltar las vistas de numpy antes de cerrar los mmap
+        self.offsets = None
+        if self.index is not None:
+            self.index.close()
+        self.data.close()
+
+
+def replay(moves):
+    """Recorre las posiciones de una partida: (tablero, jugador, movimiento).
+
+    Los pases no se guardan: se deducen porque el jugador de turno no tiene
+    movimientos válidos.
+    """
+    board = [[0] * 8 for _ in range(8)]
+    board[3][3] = board[4][4] = 2
+    board[3][4] = board[4][3] = 1
+    player = 1
+    for row, col in moves:
+        if not movimientos_validos(board, player):
+            player = 3 - player
+        yield [list(line) for line in board], player, (row, col)
+        for r, c in calcular_volteos(board, row, col, player):
+            board[r][c] = player
+        board[row][col] = player
+        player = 3 - player
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estadísticas del archivo de partidas")
+    parser.add_argument('archivo')
+    parser.add_argument('--muestra', type=int, default=0, help="mostrar N partidas al azar")
+    args = parser.parse_args(argv)
+
+    reader = ArchiveReader(args.archivo)
+    records = reader.records()
+    total = len(records)
+    print(f"📚 {args.archivo}: {total} partidas")
+    if total:
+        finished = records['flags'] & FLAG_FINISHED != 0
+        winners = records['winner'][finished]
+        print(f"   🏁 Terminadas: {int(finished.sum())}  Abandonadas: {total - int(finished.sum())}")
+        print(f"   ⚫ Gana negro: {int((winners == 1).sum())}  ⚪ Gana blanco: {int((winners == 2).sum())}  "
+              f"🤝 Empates: {int((winners == 0).sum())}")
+        print(f"   🎯 Movimientos promedio: {records['count'].mean():.1f}")
+
+    for game in reader.sample(args.muestra):
+        moves = ' '.join(f"{'abcdefgh'[c]}{r + 1}" for r, c in game['moves'])
+        print(f"\n🎮 {game['room_id'][:8]}  {game['scores']['black']}-{game['scores']['white']}  {moves}")
+
+    del records
+    reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
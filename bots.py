@@ -0,0 +1,251 @@
+# bots.py - Rivales IA alojados en el servidor para las salas que esperan demasiado
+#
+# Si un jugador lleva bot_wait segundos esperando oponente, el servidor sienta
+# un bot en su sala: un jugador sin conexión que GameRoom trata como a
+# cualquier ClientHandler. Los movimientos los calcula OthelloAI (lanzador.py)
+# en un pool de procesos: el bucle de eventos solo copia el tablero y espera
+# el resultado, nunca corre la búsqueda.
+#
+# Para que los bots no le quiten CPU a las salas de humanos:
+#   - el pool tiene pocos procesos (BOT_WORKERS) y corren con prioridad baja (nice)
+#   - cada dificultad tiene un presupuesto de CPU por movimiento (PRESUPUESTOS):
+#     'hard' profundiza de a un nivel, no empieza uno que no termine a tiempo
+#     y corta el que esté buscando si se acaba el presupuesto (juega lo que
+#     encontró el último nivel completo): el proceso queda libre a tiempo
+#   - si el movimiento no llega dentro del presupuesto (más la espera en el
+#     pool) el bot juega al azar entre los movimientos válidos
+#   - hay un máximo de partidas con bot a la vez; al llegar al máximo las
+#     salas siguen esperando y se vuelve a intentar tras otro bot_wait
+#
+# El jugador elige la dificultad en su join ({"type": "join", "bot": "hard"};
+# "bot": true es la del servidor) o rechaza el bot con "bot": false. Otro
+# valor se responde con un error y no cambia nada.
+import asyncio
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from lanzador import OthelloAI
+from protocolo_binario import SharedMessage
+from registro import get_logger
+
+log = get_logger()
+
+ESPERA_BOT = 20  # Segundos esperando oponente antes de sentar un bot
+MAX_PARTIDAS_BOT = 100
+BOT_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+PRIORIDAD = 10  # nice de los procesos del pool
+
+# Segundos de CPU por movimiento: easy juega al azar, medium es greedy y hard
+# hace minimax con profundización iterativa hasta PROFUNDIDAD_MAXIMA
+PRESUPUESTOS = {'easy': 0.01, 'medium': 0.05, 'hard': 0.5}
+PROFUNDIDAD_MAXIMA = 6
+RAMIFICACION = 6  # Cuánto más cuesta (aprox.) cada nivel de minimax que el anterior
+MARGEN_POOL = 1.0  # Segundos de espera en el pool tolerados además del presupuesto
+
+_ais = {}  # Una BotAI por dificultad en cada proceso del pool
+
+
+class SearchTimeout(Exception):
+    """Se acabó el presupuesto en medio de un nivel de minimax"""
+
+
+class BotAI(OthelloAI):
+    """OthelloAI cuyo minimax se corta al pasar deadline (segundos de CPU, None = sin límite)"""
+    deadline = None
+
+    def minimax(self, board, depth, is_maximizing, player_color, alpha, beta):
+        if self.deadline is not None and time.process_time() > self.deadline:
+            raise SearchTimeout()
+        return super().minimax(board, depth, is_maximizing, player_color, alpha, beta)
+
+
+def init_worker(niceness=PRIORIDAD):
+    """Inicializa un proceso del pool con prioridad baja y atado a la vida del servidor"""
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):
+        pass  # Windows o sin permisos
+    threading.Thread(target=watch_parent, args=(os.getppid(),), daemon=True).start()
+
+
+def watch_parent(parent):
+    """Termina el proceso si el servidor murió sin cerrar el pool (p. ej. con SIGTERM)"""
+    while os.getppid() == parent:
+        time.sleep(1)
+    os._exit(0)
+
+
+def make_pool(workers, niceness=PRIORIDAD):
+    """Pool de procesos spawn (el servidor ya tiene hilos) con prioridad baja"""
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker, initargs=(niceness,))
+
+
+def compute_move(board, player, difficulty, budget):
+    """Corre en el pool: movimiento de OthelloAI dentro de budget segundos de CPU"""
+    ai = _ais.get(difficulty)
+    if ai is None:
+        ai = _ais[difficulty] = BotAI(difficulty)
+    valid_moves = ai.get_valid_moves_from_board(board, player)
+    if not valid_moves:
+        return None
+    if difficulty != 'hard':
+        move = ai.choose_move(valid_moves, board, player)
+    else:
+        start = time.process_time()
+        # El nivel 1 siempre termina (solo evalúa); los siguientes se cortan al pasar el presupuesto
+        ai.deadline = None
+        move = None
+        try:
+            for depth in range(1, PROFUNDIDAD_MAXIMA + 1):
+                level_start = time.process_time()
+                move = ai.minimax_move(valid_moves, board, player, depth)
+                now = time.process_time()
+                if now - start + (now - level_start) * RAMIFICACION > budget:
+                    break
+                ai.deadline = start + budget
+        except SearchTimeout:
+            pass  # move es el del último nivel completo
+    return [int(move[0]), int(move[1])]
+
+
+class BotPool:
+    """Pool de procesos que calcula los movimientos de los bots, con cupo de partidas"""
+
+    def __init__(self, metrics, difficulty='medium', workers=BOT_WORKERS,
+                 max_games=MAX_PARTIDAS_BOT, budgets=None, niceness=PRIORIDAD):
+        self.budgets = dict(budgets or PRESUPUESTOS)
+        if difficulty not in self.budgets:
+            raise ValueError(f"Dificultad de bot desconocida: {difficulty}")
+        self.metrics = metrics
+        self.difficulty = difficulty  # Si el jugador no pide otra
+        self.workers = workers
+        self.max_games = max_games
+        self.niceness = niceness
+        self.executor = None
+        self.games = 0  # Partidas con bot en curso
+        self.pending = 0  # Movimientos pedidos al pool sin respuesta
+
+    def start(self):
+        """Arranca los procesos"""
+        if self.executor is None:
+            self.executor = make_pool(self.workers, self.niceness)
+            # El primer movimiento no debería pagar el arranque de los procesos
+            for _ in range(self.workers):
+                self.executor.submit(os.getpid)
+
+    def available(self):
+        return self.games < self.max_games
+
+    def seat(self, server, difficulty):
+        """BotPlayer nuevo (ocupa un lugar del cupo hasta que deja la sala)"""
+        self.start()
+        self.games += 1
+        self.metrics.bot_games.inc()
+        return BotPlayer(server, self, difficulty)
+
+    async def move(self, board, player, difficulty):
+        """Movimiento calculado en el pool, o None si no llegó a tiempo"""
+        budget = self.budgets[difficulty]
+        start = time.perf_counter()
+        executor = self.executor
+        self.pending += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                executor, compute_move, board, player, difficulty, budget)
+            return await asyncio.wait_for(future, budget + MARGEN_POOL)
+        except asyncio.TimeoutError:
+            self.metrics.bot_fallbacks.inc()
+            return None
+        except BrokenProcessPool as e:
+            # Murió un proceso (p. ej. por memoria): se rehace el pool para los próximos
+            log.error('bot_pool_broken', error=repr(e))
+            if self.executor is executor:
+                self.close()
+                self.start()
+            self.metrics.bot_fallbacks.inc()
+            return None
+        finally:
+            self.pending -= 1
+            self.metrics.bot_move_seconds.observe(time.perf_counter() - start)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class BotPlayer:
+    """Jugador sin conexión sentado en una sala; mueve con OthelloAI desde el pool.
+
+    Tiene lo que GameRoom y el servidor usan de un ClientHandler (send_message,
+    player_color, room, features...). Los mensajes de la sala solo le avisan
+    que algo cambió: el estado lo lee de room.game.
+    """
+    transport = 'bot'
+    binary = False
+
+    def __init__(self, server, pool, difficulty):
+        self.server = server
+        self.pool = pool
+        self.difficulty = difficulty
+        self.peer = f'bot:{difficulty}'
+        self.player_color = None
+        self.room = None
+        self.spectating = None
+        self.active = True
+        self.profile = {'name': f'Bot ({difficulty})', 'kind': 'ai'}
+        self.features = {'delta'}  # Un delta basta como aviso y no arma el estado completo
+        self.thinking = None  # Tarea esperando el movimiento del pool
+
+    def send_message(self, message):
+        if not self.active:
+            return False
+        if isinstance(message, SharedMessage):
+            message = message.message
+        msg_type = message.get('type')
+        if msg_type in ('game_start', 'game_update', 'game_delta', 'opponent_returned'):
+            self.play()
+        elif msg_type == 'opponent_disconnected':
+            # Se sale después: quien lo avisa todavía está recorriendo la sala
+            asyncio.get_running_loop().call_soon(self.leave)
+        return True
+
+    def play(self):
+        """Empieza a pensar si es su turno"""
+        room = self.room
+        if room is None:
+            return
+        if room.game.game_over:
+            asyncio.get_running_loop().call_soon(self.leave)
+            return
+        if room.game.current_player != self.player_color or (self.thinking and not self.thinking.done()):
+            return
+        self.thinking = asyncio.get_running_loop().create_task(self.think(room, room.game.seq))
+
+    async def think(self, room, seq):
+        game = room.game
+        move = await self.pool.move(game.board.copy(), self.player_color, self.difficulty)
+        if self.room is not room or game.seq != seq or game.game_over:
+            return  # La partida siguió sin él (abandono, tiempo de turno)
+        if move is None:
+            valid_moves = game.get_valid_moves(self.player_color)
+            if not valid_moves:
+                return
+            move = random.choice(valid_moves)
+        room.submit(self, {'type': 'move', 'row': move[0], 'col': move[1]})
+
+    def leave(self):
+        """Deja la sala y libera su lugar en el cupo de partidas con bot"""
+        if not self.active:
+            return
+        self.active = False
+        self.pool.games -= 1
+        if self.thinking:
+            self.thinking.cancel()
+        self.server.remove_bot(self)
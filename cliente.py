@@ -3,10 +3,12 @@ import pygame
 import sys
 import numpy as np
 import socket
-import json
 import threading
 import time
 
+from protocolo import aplicar_delta
+from protocolo_binario import FrameReader, encode
+
 # Constantes
 WIDTH, HEIGHT = 800, 800
 BOARD_SIZE = 8
@@ -36,6 +38,10 @@ class GameClient:
         self.connection_status = "Desconectado"
         self.last_error = ""
         self.waiting_for_opponent = True
+        self.session = None  # Token del welcome para retomar la partida tras un corte
+        self.server_features = []
+        self.resuming = False
+        self.provisional_welcome = None
 
         # Estado inicial del tablero
         self.initialize_default_board()
@@ -62,7 +68,7 @@ class GameClient:
         self.default_board[mid - 1][mid] = 1
         self.default_board[mid][mid - 1] = 1
 
-    def connect(self):
+    def connect(self, resume=False):
         try:
             self.connection_status = "Conectando..."
             self.last_error = ""
@@ -71,11 +77,24 @@ class GameClient:
             self.socket.settimeout(10)
             self.socket.connect((self.host, self.port))
             self.socket.settimeout(0.5)
+            self.binary = False
+            self.frame_reader = FrameReader()
 
             self.connected = True
             self.connection_status = "Conectado al servidor"
             print("✅ ¡Conectado al servidor!")
 
+            if resume:
+                # Sin esperar el welcome: el asiento provisional de la conexión nueva se libera
+                self.resuming = True
+                self.provisional_welcome = None
+                self.negotiate(self.server_features)
+                self.send_message({
+                    'type': 'resume',
+                    'session': self.session,
+                    'seq': self.game_state.get('seq') if self.game_state else None
+                })
+
             # Iniciar hilo para recibir mensajes
             receive_thread = threading.Thread(target=self.receive_messages)
             receive_thread.daemon = True
@@ -90,41 +109,66 @@ class GameClient:
             return False
 
     def receive_messages(self):
-        buffer = ""
         while self.connected:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = self.socket.recv(4096)
                 if not data:
                     print("📭 Servidor cerró la conexión")
                     self.connected = False
+                    self.reconnect()
                     break
 
-                buffer += data
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    if message_str.strip():
-                        try:
-                            message = json.loads(message_str)
-                            self.handle_message(message)
-                        except json.JSONDecodeError as e:
-                            print(f"❌ Error decodificando JSON: {e}")
+                self.frame_reader.feed(data)
+                while True:
+                    try:
+                        message = self.frame_reader.next_message()
+                    except ValueError as e:
+                        print(f"❌ Error decodificando mensaje: {e}")
+                        continue
+                    if message is None:
+                        break
+                    self.handle_message(message)
 
             except socket.timeout:
                 continue
             except Exception as e:
                 print(f"❌ Error recibiendo mensajes: {e}")
                 self.connected = False
+                self.reconnect()
                 break
 
+    def reconnect(self, attempts=5):
+        """Si había una partida en curso, vuelve a conectarse y retoma la sesión"""
+        if not self.session or not self.game_state or self.game_state.get('game_over'):
+            return
+        for attempt in range(attempts):
+            print(f"🔄 Retomando la partida (intento {attempt + 1})...")
+            if self.connect(resume=True):
+                return
+            time.sleep(min(2 ** attempt, 10))
+
     def handle_message(self, message):
         msg_type = message.get('type')
         print(f"📨 Mensaje recibido del servidor: {msg_type}")
 
+        if self.resuming and msg_type in ('welcome', 'waiting', 'game_start', 'game_update', 'game_delta'):
+            # Del asiento provisional, hasta que llegue 'resumed' (el welcome sirve si la sesión expiró)
+            if msg_type == 'welcome':
+                self.provisional_welcome = message
+            return
+
         if msg_type == 'welcome':
+            self.session = message.get('session')
+            self.server_features = message.get('features', [])
             self.player_color = message['player_color']
             self.connection_status = f"Jugador {'Negro' if self.player_color == 1 else 'Blanco'}"
             self.waiting_for_opponent = True
             print(f"🎯 {message['message']}")
+            self.negotiate(message.get('features', []))
+
+        elif msg_type == 'hello_ack':
+            self.frame_reader.binary = message.get('protocol') == 'binary'
+            print(f"🔧 Protocolo negociado: {message.get('protocol')}")
 
         elif msg_type == 'waiting':
             self.waiting_for_opponent = True
@@ -143,24 +187,66 @@ class GameClient:
             print("🔄 Juego actualizado")
             print(f"🎯 Movimientos válidos: {len(self.game_state['valid_moves'])} movimientos")
 
+        elif msg_type == 'game_delta':
+            new_state = aplicar_delta(self.game_state, message)
+            if new_state is None:
+                print("⚠️ Hueco en la secuencia de deltas, pidiendo estado completo")
+                self.send_message({'type': 'sync'})
+                return
+            self.game_state = new_state
+            self.waiting_for_opponent = False
+            print(f"🔄 Juego actualizado (delta {message['seq']})")
+
         elif msg_type == 'move_response':
             print(f"📢 Respuesta de movimiento: {message['message']}")
             if not message['success']:
                 print(f"❌ Movimiento fallido: {message['message']}")
 
+        elif msg_type == 'resumed':
+            self.resuming = False
+            self.player_color = message['player_color']
+            self.waiting_for_opponent = False
+            self.connection_status = f"Jugador {'Negro' if self.player_color == 1 else 'Blanco'}"
+            print(f"🔁 Partida retomada (jugada {message['seq']})")
+
+        elif msg_type == 'resume_failed':
+            self.resuming = False
+            self.session = None
+            self.game_state = None
+            self.waiting_for_opponent = True
+            print("⚠️ " + message['message'])
+            if self.provisional_welcome:
+                # Se queda con el asiento que le dio la conexión nueva
+                self.handle_message(self.provisional_welcome)
+
+        elif msg_type == 'opponent_away':
+            self.connection_status = "Oponente reconectándose..."
+            print("⏸️ " + message['message'])
+
+        elif msg_type == 'opponent_returned':
+            self.connection_status = f"Jugador {'Negro' if self.player_color == 1 else 'Blanco'}"
+            print("▶️ " + message['message'])
+
         elif msg_type == 'opponent_disconnected':
             self.waiting_for_opponent = True
             self.connection_status = "Oponente desconectado"
             print("⚠️ " + message['message'])
 
+        elif msg_type == 'move_timeout':
+            self.connection_status = "Ganaste por tiempo" if message['winner'] == self.player_color \
+                else "Perdiste por tiempo"
+            print("⏰ " + message['message'])
+
+        elif msg_type == 'ping':
+            self.send_message({'type': 'pong'})
+
     def send_message(self, message):
         if not self.connected:
             print("❌ No conectado, no se puede enviar mensaje")
             return False
 
         try:
-            message_str = json.dumps(message) + '\n'
-            self.socket.send(message_str.encode('utf-8'))
+            self.socket.sendall(encode(message, self.binary))
             print(f"📤 Mensaje enviado: {message['type']}")
             return True
         except Exception as e:
@@ -172,6 +258,14 @@ class GameClient:
         message = {'type': 'move', 'row': row, 'col': col}
         return self.send_message(message)
 
+    def negotiate(self, server_features):
+        """Pide actualizaciones delta, protocolo binario y heartbeat si el servidor los soporta"""
+        wanted = [feature for feature in ('delta', 'binary', 'heartbeat') if feature in server_features]
+        if wanted:
+            self.send_message({'type': 'hello', 'features': wanted})
+            # Desde el hello se envía en binario; se recibe en binario tras el hello_ack
+            self.binary = 'binary' in wanted
+
     def draw_waiting_screen(self):
         self.screen.fill(BACKGROUND)
 
@@ -390,7 +484,10 @@ class GameClient:
                         running = False
                     elif event.key == pygame.K_r and not self.connected:
                         print("🔄 Intentando reconectar...")
-                        self.connect()
+                        if self.session and self.game_state and not self.game_state.get('game_over'):
+                            self.connect(resume=True)
+                        else:
+                            self.connect()
 
             # Dibujar
             if self.connected and self.game_state and not self.waiting_for_opponent:
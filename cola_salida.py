@@ -0,0 +1,84 @@
+# cola_salida.py - Cola de salida acotada por conexión
+#
+# Los servidores ya no escriben en el socket desde quien genera el mensaje:
+# send_message codifica y encola los bytes, y un escritor por conexión (tarea
+# asyncio en servidor_multisala.py, hilo en servidor.py) saca todo lo
+# pendiente y lo manda en una sola escritura. Así un cliente lento no frena
+# a la sala ni al resto de jugadores.
+#
+# Si un cliente acumula más de max_messages mensajes o max_bytes bytes sin
+# leer, se aplica la política de contrapresión:
+#   'disconnect' - se cierra la conexión
+#   'resync'     - se descarta lo pendiente y se encola el estado completo
+#                  de la partida (el cliente se pone al día con un solo mensaje)
+import threading
+from collections import deque
+
+POLITICA_DESCONECTAR = 'disconnect'
+POLITICA_RESYNC = 'resync'
+POLITICAS = (POLITICA_DESCONECTAR, POLITICA_RESYNC)
+
+MAX_MENSAJES = 256
+MAX_BYTES = 256 * 1024
+
+
+class OutboundQueue:
+    """Mensajes ya codificados (bytes, o texto en WebSocket) esperando ser escritos.
+
+    Es segura entre hilos: en servidor.py encolan los hilos de los clientes
+    y vacía el hilo escritor.
+    """
+
+    def __init__(self, max_messages=MAX_MENSAJES, max_bytes=MAX_BYTES):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.chunks = deque()
+        self.pending_bytes = 0
+        self.lock = threading.Lock()
+
+        # Estadísticas
+        self.messages = 0  # Mensajes encolados
+        self.writes = 0  # Escrituras (varios mensajes por escritura)
+        self.overflows = 0  # Veces que se superó el límite
+
+    def push(self, data):
+        """Encola bytes; retorna False si la cola está llena (no se encolan)"""
+        with self.lock:
+            if len(self.chunks) >= self.max_messages or self.pending_bytes + len(data) > self.max_bytes:
+                self.overflows += 1
+                return False
+            self.chunks.append(data)
+            self.pending_bytes += len(data)
+            self.messages += 1
+            return True
+
+    def drain(self):
+        """Saca todo lo pendiente como un solo bloque de bytes (b'' si no hay nada)"""
+        with self.lock:
+            if not self.chunks:
+                return b''
+            data = b''.join(self.chunks)
+            self.chunks.clear()
+            self.pending_bytes = 0
+            self.writes += 1
+            return data
+
+    def drain_messages(self):
+        """Saca lo pendiente como lista de mensajes (WebSocket: un marco por mensaje)"""
+        with self.lock:
+            if not self.chunks:
+                return []
+            messages = list(self.chunks)
+            self.chunks.clear()
+            self.pending_bytes = 0
+            self.writes += 1
+            return messages
+
+    def clear(self):
+        """Descarta lo pendiente"""
+        with self.lock:
+            self.chunks.clear()
+            self.pending_bytes = 0
+
+    def __len__(self):
+        return len(self.chunks)
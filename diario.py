@@ -0,0 +1,362 @@
+# diario.py - Diario (journal) de partidas en disco para sobrevivir reinicios
+#
+# Cada evento (sala creada, jugador sentado, movimiento, sala cerrada) se
+# agrega a un log binario de registros de tamaño fijo:
+#
+#   tipo (1) | sala (16, UUID) | jugador (1) | casilla (1) | turno (1) |
+#   flags (1) | seq (2) | crc32 (4)                        = 27 bytes
+#
+# Los registros se acumulan en memoria y un hilo escritor los vuelca con un
+# solo os.write + os.fsync por lote (group commit): mientras un fsync está en
+# curso, lo que llega se junta para el siguiente.
+#
+# Cada cierto tiempo el servidor toma una instantánea de las salas vivas: el
+# diario pasa a un segmento nuevo (diario.<n>.log), escribe snapshot.json
+# (con el número del primer segmento posterior) y borra los segmentos viejos.
+# Al arrancar se carga la instantánea y se reaplican los segmentos siguientes;
+# un registro final incompleto o con crc inválido (corte a mitad de escritura)
+# se ignora.
+#
+# Uso:
+#   python diario.py    # verifica la recuperación tras instantánea, inicio de partida y corte
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import deque
+from types import SimpleNamespace
+
+from protocolo import calcular_volteos
+
+ROOM_CREATED = 1
+PLAYER_JOINED = 2
+MOVE = 3
+ROOM_CLOSED = 4
+
+FLAG_GAME_OVER = 0x01
+
+RECORD = struct.Struct('>B16sBBBBH')
+CRC = struct.Struct('>I')
+RECORD_SIZE = RECORD.size + CRC.size
+
+SNAPSHOT_FILE = 'snapshot.json'
+
+
+def room_uuid(room_id):
+    """room_id (texto UUID) -> 16 bytes"""
+    return uuid.UUID(room_id).bytes
+
+
+def initial_board():
+    board = [[0] * 8 for _ in range(8)]
+    board[3][3] = board[4][4] = 2
+    board[3][4] = board[4][3] = 1
+    return board
+
+
+class Journal:
+    """Log binario de eventos de las salas con group commit y snapshots"""
+
+    def __init__(self, directory, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Condition()
+        self.items = deque()  # bytearray con registros o ('snapshot', rooms)
+        self.closed = False
+        self.segment = None
+        self.fd = None
+
+        # Estadísticas
+        self.records = 0
+        self.commits = 0
+        self.bytes_written = 0
+
+        self.writer = None
+
+    # ----------------------------------------------------------
+    # Recuperación
+    # ----------------------------------------------------------
+    def segments(self):
+        """Números de segmento presentes en el directorio, en orden"""
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith('diario.') and name.endswith('.log'):
+                try:
+                    numbers.append(int(name[len('diario.'):-len('.log')]))
+                except ValueError:
+                    pass
+        return sorted(numbers)
+
+    def segment_path(self, number):
+        return os.path.join(self.directory, f'diario.{number}.log')
+
+    def recover(self):
+        """Reconstruye las salas vivas: instantánea + registros posteriores.
+
+        Retorna {room_id: estado} donde estado es un dict con board,
+        current_player, seq, game_over y players (colores que se sentaron).
+        Después de recuperar, el diario queda abierto en un segmento nuevo.
+        """
+        rooms = {}
+        first_segment = 0
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            first_segment = snapshot['next_segment']
+            for state in snapshot['rooms']:
+                state['players'] = set(state['players'])
+                rooms[state['room_id']] = state
+
+        replayed = 0
+        for number in self.segments():
+            if number < first_segment:
+                continue
+            with open(self.segment_path(number), 'rb') as f:
+                data = f.read()
+            for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+                body = data[offset:offset + RECORD.size]
+                (crc,) = CRC.unpack_from(data, offset + RECORD.size)
+                if zlib.crc32(body) != crc:
+                    break  # Cola escrita a medias
+                self.apply(rooms, RECORD.unpack(body))
+                replayed += 1
+
+        # Empezar en un segmento nuevo y compactar lo recuperado
+        self.open_segment((self.segments() or [first_segment - 1])[-1] + 1)
+        self.start()
+        self.snapshot(list(rooms.values()))
+        return rooms, replayed
+
+    @staticmethod
+    def apply(rooms, record):
+        """Aplica un registro sobre los estados de sala recuperados"""
+        kind, raw_room, player, square, current, flags, seq = record
+        room_id = str(uuid.UUID(bytes=raw_room))
+
+        if kind == ROOM_CREATED:
+            rooms[room_id] = {
+                'room_id': room_id,
+                'board': initial_board(),
+                'current_player': 1,
+                'seq': 0,
+                'game_over': False,
+                'players': set(),
+                'moves': [],
+            }
+            return
+
+        state = rooms.get(room_id)
+        if state is None:
+            return
+        if kind == PLAYER_JOINED:
+            state['players'].add(player)
+        elif kind == MOVE:
+            row, col = divmod(square, 8)
+            board = state['board']
+            for r, c in calcular_volteos(board, row, col, player):
+                board[r][c] = player
+            board[row][col] = player
+            state['current_player'] = current
+            state['game_over'] = bool(flags & FLAG_GAME_OVER)
+            state['seq'] = seq
+            state.setdefault('moves', []).append(square)
+        elif kind == ROOM_CLOSED:
+            del rooms[room_id]
+
+    # ----------------------------------------------------------
+    # Escritura
+    # ----------------------------------------------------------
+    def open_segment(self, number):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.segment = number
+        self.fd = os.open(self.segment_path(number), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def start(self):
+        """Arranca el hilo escritor (recover() lo llama)"""
+        if self.fd is None:
+            self.open_segment((self.segments() or [-1])[-1] + 1)
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_loop, daemon=True)
+            self.writer.start()
+
+    def append(self, kind, room_id, player=0, square=0, current=0, flags=0, seq=0):
+        """Agrega un registro al lote en curso (no bloquea ni escribe)"""
+        body = RECORD.pack(kind, room_uuid(room_id), player, square, current, flags, seq & 0xFFFF)
+        with self.lock:
+            if self.closed:
+                return
+            if not self.items or not isinstance(self.items[-1], bytearray):
+                self.items.append(bytearray())
+            self.items[-1] += body + CRC.pack(zlib.crc32(body))
+            self.records += 1
+            self.lock.notify()
+
+    def room_created(self, room_id):
+        self.append(ROOM_CREATED, room_id)
+
+    def player_joined(self, room_id, color):
+        self.append(PLAYER_JOINED, room_id, player=color)
+
+    def move(self, room_id, player, row, col, game):
+        self.append(MOVE, room_id, player=player, square=row * 8 + col,
+                    current=int(game.current_player),
+                    flags=FLAG_GAME_OVER if game.game_over else 0, seq=game.seq)
+
+    def room_closed(self, room_id):
+        self.append(ROOM_CLOSED, room_id)
+
+    def snapshot(self, rooms):
+        """Programa una instantánea de las salas vivas (lista de estados)"""
+        rooms = [dict(state, players=sorted(state['players'])) for state in rooms]
+        with self.lock:
+            self.items.append(('snapshot', rooms))
+            self.lock.notify()
+
+    def write_loop(self):
+        """Hilo escritor: un write + fsync por lote de registros"""
+        while True:
+            with self.lock:
+                while not self.items and not self.closed:
+                    self.lock.wait()
+                if not self.items and self.closed:
+                    return
+                items = list(self.items)
+                self.items.clear()
+
+            for item in items:
+                if isinstance(item, bytearray):
+                    os.write(self.fd, item)
+                    self.bytes_written += len(item)
+                    if self.fsync:
+                        os.fsync(self.fd)
+                    self.commits += 1
+                else:
+                    self.write_snapshot(item[1])
+
+    def write_snapshot(self, rooms):
+        """Rota de segmento, guarda snapshot.json y borra los segmentos anteriores"""
+        old_segments = [n for n in self.segments() if n <= self.segment]
+        self.open_segment(self.segment + 1)
+
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'next_segment': self.segment, 'rooms': rooms}, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        for number in old_segments:
+            try:
+                os.remove(self.segment_path(number))
+            except OSError:
+                pass
+
+    def close(self):
+        """Vuelca lo pendiente y cierra el diario"""
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        if self.writer:
+            self.writer.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def stats(self):
+        return {
+            'records': self.records,
+            'commits': self.commits,
+            'bytes': self.bytes_written,
+            'segment': self.segment,
+        }
+
+
+def room_state(room_id, game, players):
+    """Estado de sala para Journal.snapshot a partir de un OthelloGame"""
+    return {
+        'room_id': room_id,
+        'board': game.board.tolist(),
+        'current_player': int(game.current_player),
+        'seq': game.seq,
+        'game_over': game.game_over,
+        'players': set(players),
+        'moves': list(getattr(game, 'moves', [])),
+    }
+
+
+def verificar_recuperacion(directory):
+    """Instantánea con una sala esperando, la partida empieza y el servidor se corta.
+
+    La instantánea la arma el servidor real (servidor_multisala.py). Retorna
+    la lista de errores (vacía si la partida se recupera entera).
+    """
+    from servidor_multisala import OthelloServerMultiRoom
+
+    server = OthelloServerMultiRoom(journal_dir=directory)
+    server.open_journal()
+    journal = server.journal
+    room_id = str(uuid.uuid4())
+    room = server.rooms[room_id] = server.make_room(room_id)
+
+    # Un jugador espera oponente cuando se toma la instantánea
+    room.add_player(SimpleNamespace(room=None, player_color=None))
+    journal.room_created(room_id)
+    journal.player_joined(room_id, 1)
+    journal.snapshot(server.snapshot_states())
+
+    # Llega el oponente y se juega
+    room.add_player(SimpleNamespace(room=None, player_color=None))
+    journal.player_joined(room_id, 2)
+    room.started = True
+    game = room.game
+    for _ in range(3):
+        player = game.current_player
+        row, col = game.get_valid_moves(player)[0]
+        game.make_move(row, col, player)
+        game.current_player = 3 - player
+        journal.move(room_id, player, row, col, game)
+
+    # Corte: lo escrito queda en disco, sin instantánea final
+    journal.close()
+
+    restarted = OthelloServerMultiRoom(journal_dir=directory)
+    restarted.open_journal()
+    restarted.journal.close()
+    restored = restarted.rooms.get(room_id)
+    if restored is None:
+        return ["La sala que esperaba oponente en la instantánea no se recuperó"]
+    errores = []
+    if restored.game.seq != game.seq:
+        errores.append(f"seq {restored.game.seq} != {game.seq}")
+    if restored.game.current_player != game.current_player:
+        errores.append(f"turno {restored.game.current_player} != {game.current_player}")
+    if (restored.game.board != game.board).any():
+        errores.append("El tablero recuperado no coincide")
+    if restored.game.moves != game.moves:
+        errores.append(f"jugadas {restored.game.moves} != {game.moves}")
+    return errores
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        errores = verificar_recuperacion(directory)
+    for error in errores:
+        print(f"❌ {error}")
+    if errores:
+        return 1
+    print("✅ Recuperación OK: instantánea con sala esperando, inicio de partida y corte")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# emparejamiento.py - Matchmaking O(1) con cola FIFO de salas en espera
+#
+# Cada pool de emparejamiento es un OrderedDict {room_id: (sala, instante)}:
+# emparejar saca la sala más antigua (popitem(last=False)) y quitar una sala
+# cuyo jugador se desconectó es un del por clave; ambas operaciones son O(1),
+# sin recorrer la tabla de salas del servidor.
+import time
+from collections import OrderedDict, deque
+
+
+# ==============================================================
+# Funciones de pool: cliente -> clave del pool
+# ==============================================================
+# Los datos del cliente salen de client.profile, que el servidor completa con
+# los campos opcionales del mensaje 'join' (kind, rating, pool).
+
+def pool_unico(client):
+    """Todos los jugadores en un solo pool"""
+    return 'default'
+
+
+def pool_por_tipo(client):
+    """Separa IA de humanos ('ai' / 'human')"""
+    return 'ai' if client.profile.get('kind') == 'ai' else 'human'
+
+
+def pool_por_nivel(bucket_size=200):
+    """Agrupa por rating en buckets de tamaño fijo"""
+    def pool(client):
+        rating = client.profile.get('rating')
+        if rating is None:
+            return 'sin_rating'
+        return f"rating_{int(rating) // bucket_size * bucket_size}"
+    return pool
+
+
+def pool_explicito(fallback=pool_unico):
+    """Usa el pool pedido por el cliente ('pool' en el join) o el de respaldo"""
+    def pool(client):
+        return client.profile.get('pool') or fallback(client)
+    return pool
+
+
+class Matchmaker:
+    """Cola FIFO de salas esperando oponente, separada por pools"""
+
+    def __init__(self, pool_key=None, wait_samples=1000):
+        self.pool_key = pool_key or pool_unico
+        self.pools = {}  # {pool: OrderedDict{room_id: (room, enqueued_at)}}
+        self.matched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=wait_samples)
+
+    def find_room(self, client):
+        """Saca la sala más antigua del pool del cliente, o None si no hay"""
+        queue = self.pools.get(self.pool_key(client))
+        if not queue:
+            return None
+
+        _, (room, enqueued_at) = queue.popitem(last=False)
+        wait = time.monotonic() - enqueued_at
+        self.matched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+        return room
+
+    def enqueue(self, room, client):
+        """Pone una sala al final de la cola del pool de su jugador"""
+        pool = self.pool_key(client)
+        room.pool = pool
+        self.pools.setdefault(pool, OrderedDict())[room.room_id] = (room, time.monotonic())
+
+    def remove(self, room):
+        """Quita una sala de la cola (si estaba esperando)"""
+        queue = self.pools.get(getattr(room, 'pool', None))
+        if queue is not None and queue.pop(room.room_id, None) is not None:
+            return True
+        return False
+
+    def queue_depth(self):
+        """Salas esperando por pool"""
+        return {pool: len(queue) for pool, queue in self.pools.items() if queue}
+
+    def oldest_wait(self):
+        """Segundos que lleva esperando la sala más antigua de cada pool"""
+        now = time.monotonic()
+        oldest = {}
+        for pool, queue in self.pools.items():
+            if queue:
+                _, enqueued_at = next(iter(queue.values()))
+                oldest[pool] = now - enqueued_at
+        return oldest
+
+    def p95_wait(self):
+        """Percentil 95 de las últimas esperas"""
+        recent = sorted(self.recent_waits)
+        return recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+
+    def stats(self):
+        """Métricas de la cola de emparejamiento"""
+        return {
+            'queue_depth': self.queue_depth(),
+            'oldest_wait': self.oldest_wait(),
+            'matched': self.matched,
+            'avg_wait': self.total_wait / self.matched if self.matched else 0.0,
+            'p95_wait': self.p95_wait(),
+            'max_wait': self.max_wait,
+        }
@@ -0,0 +1,650 @@
+# generador_carga.py - Simula muchos jugadores concurrentes contra un servidor
+#
+# Abre N conexiones (TCP con JSON por líneas o WebSocket), recorre el protocolo
+# real welcome/waiting/game_start/move y mide la latencia de ida y vuelta de
+# cada movimiento (desde que se envía hasta que llega la actualización).
+#
+# Uso:
+#   python generador_carga.py --jugadores 1000 --port 5555
+#   python generador_carga.py --transporte ws --url ws://localhost:5555 --jugadores 2
+#   python generador_carga.py --jugadores 500 --politica greedy --pensar exp:0.2
+#   python generador_carga.py --jugadores 200 --espectadores 1000 --delta
+#   python generador_carga.py --jugadores 200 --cortes 0.02 --delta
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import numpy as np
+
+from protocolo import aplicar_delta, calcular_volteos, movimientos_validos
+from protocolo_binario import FrameReader, encode, encode_message, decode_message
+
+
+# ==============================================================
+# Transportes
+# ==============================================================
+class TransporteTCP:
+    """JSON por líneas o marcos binarios sobre TCP (servidor.py, servidor_multisala.py)"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.frames = FrameReader()
+        self.binary = False  # Envío en binario (tras mandar el hello)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    async def conectar(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def recibir_binario(self):
+        """El servidor confirmó el protocolo binario (hello_ack)"""
+        self.frames.binary = True
+
+    async def enviar(self, message):
+        data = encode(message, self.binary)
+        self.bytes_sent += len(data)
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def recibir(self):
+        while True:
+            message = self.frames.next_message()
+            if message is not None:
+                return message
+            data = await self.reader.read(65536)
+            if not data:
+                return None
+            self.bytes_received += len(data)
+            self.frames.feed(data)
+
+    async def cerrar(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+
+
+class TransporteWS:
+    """Mensajes JSON o binarios sobre WebSocket (WebServidor.py)"""
+
+    def __init__(self, url):
+        self.url = url
+        self.ws = None
+        self.binary = False  # Envío en binario (tras mandar el hello)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    async def conectar(self):
+        import websockets
+        self.ws = await websockets.connect(self.url)
+        await self.enviar({"type": "join", "name": "carga"})
+
+    def recibir_binario(self):
+        """En WebSocket cada mensaje indica si es texto o binario"""
+
+    async def enviar(self, message):
+        data = encode_message(message) if self.binary else json.dumps(message)
+        self.bytes_sent += len(data)
+        await self.ws.send(data)
+
+    async def recibir(self):
+        import websockets
+        try:
+            data = await self.ws.recv()
+        except websockets.ConnectionClosed:
+            return None
+        self.bytes_received += len(data)
+        if isinstance(data, bytes):
+            return decode_message(data)
+        return json.loads(data)
+
+    async def cerrar(self):
+        if self.ws:
+            await self.ws.close()
+
+
+# ==============================================================
+# Políticas de movimiento y tiempo de pensar
+# ==============================================================
+POSITION_WEIGHTS = np.array([
+    [100, -20, 10, 5, 5, 10, -20, 100],
+    [-20, -50, -2, -2, -2, -2, -50, -20],
+    [10, -2, 5, 1, 1, 5, -2, 10],
+    [5, -2, 1, 0, 0, 1, -2, 5],
+    [5, -2, 1, 0, 0, 1, -2, 5],
+    [10, -2, 5, 1, 1, 5, -2, 10],
+    [-20, -50, -2, -2, -2, -2, -50, -20],
+    [100, -20, 10, 5, 5, 10, -20, 100]
+])
+
+
+def politica_random(game_state, player_color, rng):
+    return rng.choice(game_state['valid_moves'])
+
+
+def politica_primero(game_state, player_color, rng):
+    return game_state['valid_moves'][0]
+
+
+def politica_greedy(game_state, player_color, rng):
+    """Mejor casilla según la tabla de pesos posicionales"""
+    return max(game_state['valid_moves'], key=lambda m: POSITION_WEIGHTS[m[0]][m[1]])
+
+
+def politica_invalido(game_state, player_color, rng):
+    """Con 10% de probabilidad envía una jugada inválida (prueba la ruta de error)"""
+    if rng.random() < 0.1:
+        valid = {tuple(m) for m in game_state['valid_moves']}
+        libres = [(r, c) for r in range(8) for c in range(8)
+                  if game_state['board'][r][c] == 0 and (r, c) not in valid]
+        if libres:
+            return list(rng.choice(libres))
+    return rng.choice(game_state['valid_moves'])
+
+
+def termina_partida(game_state, row, col, player):
+    """Verifica si jugar (row, col) deja a los dos jugadores sin movimientos"""
+    board = [list(fila) for fila in game_state['board']]
+    flips = calcular_volteos(board, row, col, player)
+    if not flips:
+        return False
+    board[row][col] = player
+    for r, c in flips:
+        board[r][c] = player
+    return not movimientos_validos(board, 1) and not movimientos_validos(board, 2)
+
+
+POLITICAS = {
+    'random': politica_random,
+    'primero': politica_primero,
+    'greedy': politica_greedy,
+    'invalido': politica_invalido,
+}
+
+
+def parse_tiempo_pensar(spec):
+    """Convierte una especificación de tiempo de pensar en una función rng -> segundos.
+
+    Formatos: '0', 'const:0.5', 'uniform:0.1:0.8', 'exp:0.3' (media),
+    'normal:0.5:0.1' (media:desviación, truncada en 0).
+    """
+    partes = spec.split(':')
+    tipo = partes[0]
+    try:
+        if len(partes) == 1:
+            valor = float(tipo)
+            return lambda rng: valor
+        valores = [float(p) for p in partes[1:]]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Tiempo de pensar inválido: {spec}")
+
+    if tipo == 'const':
+        return lambda rng: valores[0]
+    if tipo == 'uniform':
+        return lambda rng: rng.uniform(valores[0], valores[1])
+    if tipo == 'exp':
+        return lambda rng: rng.expovariate(1.0 / valores[0]) if valores[0] > 0 else 0.0
+    if tipo == 'normal':
+        return lambda rng: max(0.0, rng.gauss(valores[0], valores[1]))
+    raise argparse.ArgumentTypeError(f"Distribución desconocida: {tipo}")
+
+
+# ==============================================================
+# Estadísticas
+# ==============================================================
+class LoadStats:
+    """Acumula latencias, errores y partidas completadas"""
+
+    def __init__(self):
+        self.move_latencies = []
+        self.connect_latencies = []
+        self.errors = {}
+        self.games_completed = 0
+        self.moves_sent = 0
+        self.moves_rejected = 0
+        self.disconnects = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.spectator_updates = 0
+        self.spectator_resyncs = 0
+        self.resumes = 0
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    @staticmethod
+    def percentile(values, p):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def report(self, elapsed):
+        ms = lambda s: s * 1000.0
+        lat = self.move_latencies
+        print("\n📊 RESULTADOS")
+        print(f"   ⏱️  Duración: {elapsed:.1f}s")
+        print(f"   🏁 Partidas completadas: {self.games_completed} "
+              f"({self.games_completed / elapsed if elapsed else 0:.2f}/s)")
+        print(f"   🎯 Movimientos enviados: {self.moves_sent} "
+              f"({self.moves_sent / elapsed if elapsed else 0:.1f}/s), rechazados: {self.moves_rejected}")
+        print(f"   📶 RTT movimiento: p50={ms(self.percentile(lat, 50)):.2f}ms "
+              f"p95={ms(self.percentile(lat, 95)):.2f}ms p99={ms(self.percentile(lat, 99)):.2f}ms "
+              f"max={ms(max(lat) if lat else 0):.2f}ms (n={len(lat)})")
+        con = self.connect_latencies
+        print(f"   🔌 Conexión→welcome: p50={ms(self.percentile(con, 50)):.2f}ms "
+              f"p99={ms(self.percentile(con, 99)):.2f}ms")
+        print(f"   📦 Bytes enviados: {self.bytes_sent:,}  recibidos: {self.bytes_received:,}")
+        print(f"   📭 Desconexiones de oponente: {self.disconnects}")
+        if self.resumes:
+            print(f"   🔁 Sesiones retomadas: {self.resumes}")
+        if self.spectator_updates:
+            print(f"   👀 Actualizaciones a espectadores: {self.spectator_updates:,} "
+                  f"(estados completos: {self.spectator_resyncs:,})")
+        if self.errors:
+            print("   ❌ Errores:")
+            for kind, count in sorted(self.errors.items()):
+                print(f"      {kind}: {count}")
+        else:
+            print("   ✅ Sin errores")
+
+    def as_dict(self, elapsed):
+        lat = self.move_latencies
+        return {
+            'elapsed': elapsed,
+            'games_completed': self.games_completed,
+            'games_per_second': self.games_completed / elapsed if elapsed else 0,
+            'moves_sent': self.moves_sent,
+            'moves_rejected': self.moves_rejected,
+            'move_rtt_p50': self.percentile(lat, 50),
+            'move_rtt_p95': self.percentile(lat, 95),
+            'move_rtt_p99': self.percentile(lat, 99),
+            'errors': dict(self.errors),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'spectator_updates': self.spectator_updates,
+            'resumes': self.resumes,
+        }
+
+
+# ==============================================================
+# Jugador simulado
+# ==============================================================
+class SimulatedPlayer:
+    """Un jugador que recorre el protocolo real y mide latencias"""
+
+    def __init__(self, player_id, make_transport, policy, think_time, stats, deadline, games,
+                 timeout=30.0, use_delta=False, use_binary=False, drop_rate=0.0):
+        self.player_id = player_id
+        self.make_transport = make_transport
+        self.policy = policy
+        self.think_time = think_time
+        self.stats = stats
+        self.deadline = deadline
+        self.games = games
+        self.timeout = timeout
+        self.use_delta = use_delta
+        self.use_binary = use_binary
+        self.drop_rate = drop_rate  # Probabilidad de cortar la conexión tras mover
+        self.rng = random.Random(player_id)
+
+    async def run(self):
+        played = 0
+        while (self.games == 0 or played < self.games) and time.monotonic() < self.deadline:
+            try:
+                finished = await self.play_one()
+            except asyncio.TimeoutError:
+                # TimeoutError hereda de OSError: debe capturarse primero
+                self.stats.error("timeout")
+                continue
+            except (ConnectionError, OSError) as e:
+                self.stats.error(f"conexion: {type(e).__name__}")
+                await asyncio.sleep(0.5)
+                continue
+            except Exception as e:
+                self.stats.error(f"{type(e).__name__}: {e}")
+                continue
+            if finished:
+                played += 1
+
+    async def play_one(self):
+        """Juega una partida completa; retorna True si terminó normalmente"""
+        transport = self.make_transport()
+        start = time.perf_counter()
+        await asyncio.wait_for(transport.conectar(), self.timeout)
+        player_color = None
+        pending_move = None
+        game_state = None
+        session = None
+        resuming = False
+        ending_move = False  # El último movimiento enviado pudo terminar la partida
+        wanted = []
+
+        async def reconnect():
+            """Conexión nueva que retoma la sesión (el delta del movimiento llega en la puesta al día)"""
+            nonlocal transport, pending_move, resuming
+            self.stats.bytes_sent += transport.bytes_sent
+            self.stats.bytes_received += transport.bytes_received
+            await transport.cerrar()
+            transport = self.make_transport()
+            await asyncio.wait_for(transport.conectar(), self.timeout)
+            pending_move = None
+            resuming = True
+            # Sin esperar el welcome: el asiento provisional aún no tiene jugadas
+            if wanted:
+                await transport.enviar({'type': 'hello', 'features': wanted})
+                transport.binary = 'binary' in wanted
+            await transport.enviar({'type': 'resume', 'session': session, 'seq': game_state['seq']})
+
+        async def play_if_my_turn():
+            nonlocal pending_move, ending_move
+            if game_state['current_player'] != player_color or not game_state['valid_moves']:
+                return
+            delay = self.think_time(self.rng)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            row, col = self.policy(game_state, player_color, self.rng)
+            pending_move = time.perf_counter()
+            ending_move = termina_partida(game_state, int(row), int(col), player_color)
+            self.stats.moves_sent += 1
+            await transport.enviar({'type': 'move', 'row': int(row), 'col': int(col)})
+            if session and self.drop_rate and self.rng.random() < self.drop_rate:
+                await reconnect()
+
+        try:
+            while True:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                # Mientras se espera oponente solo aplica el deadline global
+                if pending_move is None:
+                    try:
+                        message = await asyncio.wait_for(transport.recibir(), remaining)
+                    except asyncio.TimeoutError:
+                        return False
+                else:
+                    try:
+                        message = await asyncio.wait_for(transport.recibir(), min(remaining, self.timeout))
+                    except asyncio.TimeoutError:
+                        if time.monotonic() >= self.deadline:
+                            return False
+                        raise
+                if message is None:
+                    self.stats.error("servidor cerró la conexión")
+                    return False
+
+                msg_type = message.get('type')
+                if resuming and msg_type in ('game_start', 'game_update', 'game_delta', 'waiting',
+                                             'opponent_disconnected', 'move_response'):
+                    continue  # Del asiento provisional de la conexión nueva
+
+                if msg_type == 'welcome':
+                    if resuming:
+                        continue
+                    if player_color is not None:
+                        # Un asiento nuevo (el oponente provisional se fue): lo pendiente ya no cuenta
+                        pending_move = None
+                    player_color = message['player_color']
+                    session = message.get('session')
+                    self.stats.connect_latencies.append(time.perf_counter() - start)
+                    wanted = [feature for feature, on in (('delta', self.use_delta), ('binary', self.use_binary),
+                                                          ('heartbeat', True))
+                              if on and feature in message.get('features', [])]
+                    if wanted and not transport.binary:
+                        await transport.enviar({'type': 'hello', 'features': wanted})
+                        transport.binary = 'binary' in wanted
+
+                elif msg_type == 'resumed':
+                    resuming = False
+                    player_color = message['player_color']
+                    self.stats.resumes += 1
+                    if message['seq'] == game_state['seq']:
+                        await play_if_my_turn()
+
+                elif msg_type == 'resume_failed':
+                    if game_state['game_over'] or ending_move:
+                        # La partida terminó mientras no estaba: la sesión ya no existe
+                        if player_color == 1:
+                            self.stats.games_completed += 1
+                        return True
+                    if game_state['seq'] == 0:
+                        # El oponente (provisional) se fue antes de la primera jugada y el
+                        # servidor nos reencoló: la sala ya no existe
+                        self.stats.disconnects += 1
+                        return False
+                    self.stats.error(f"servidor: {message.get('message')}")
+                    return False
+
+                elif msg_type == 'hello_ack':
+                    if message.get('protocol') == 'binary':
+                        transport.recibir_binario()
+
+                elif msg_type == 'ping':
+                    await transport.enviar({'type': 'pong'})
+
+                elif msg_type in ('game_start', 'game_update', 'game_delta'):
+                    if pending_move is not None:
+                        self.stats.move_latencies.append(time.perf_counter() - pending_move)
+                        pending_move = None
+
+                    if msg_type == 'game_delta':
+                        new_state = aplicar_delta(game_state, message)
+                        if new_state is None:
+                            self.stats.error("hueco en deltas")
+                            await transport.enviar({'type': 'sync'})
+                            continue
+                        game_state = new_state
+                    else:
+                        game_state = message['game_state']
+                    if game_state['game_over']:
+                        # Solo el jugador Negro cuenta la partida para no contarla dos veces
+                        if player_color == 1:
+                            self.stats.games_completed += 1
+                        return True
+
+                    await play_if_my_turn()
+
+                elif msg_type == 'move_response':
+                    if not message.get('success'):
+                        self.stats.moves_rejected += 1
+                        if pending_move is not None:
+                            self.stats.move_latencies.append(time.perf_counter() - pending_move)
+                            pending_move = None
+                        # Reintentar con el último estado conocido
+                        if game_state:
+                            await play_if_my_turn()
+
+                elif msg_type == 'opponent_disconnected':
+                    self.stats.disconnects += 1
+                    return False
+
+                elif msg_type == 'error':
+                    self.stats.error(f"servidor: {message.get('message')}")
+                    return False
+        finally:
+            self.stats.bytes_sent += transport.bytes_sent
+            self.stats.bytes_received += transport.bytes_received
+            await transport.cerrar()
+
+
+class SimulatedSpectator:
+    """Observa partidas (servidor_multisala.py) y sigue el estado con los deltas"""
+
+    def __init__(self, make_transport, stats, deadline, timeout=30.0, use_delta=False, use_binary=False):
+        self.make_transport = make_transport
+        self.stats = stats
+        self.deadline = deadline
+        self.timeout = timeout
+        self.use_delta = use_delta
+        self.use_binary = use_binary
+
+    async def run(self):
+        while time.monotonic() < self.deadline:
+            try:
+                await self.watch()
+            except (ConnectionError, OSError) as e:
+                self.stats.error(f"espectador: {type(e).__name__}")
+                await asyncio.sleep(0.5)
+            except Exception as e:
+                self.stats.error(f"espectador: {type(e).__name__}: {e}")
+
+    async def watch(self):
+        """Observa salas hasta el deadline (cambia de sala cuando una termina)"""
+        transport = self.make_transport()
+        await asyncio.wait_for(transport.conectar(), self.timeout)
+        game_state = None
+        try:
+            while True:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    message = await asyncio.wait_for(transport.recibir(), remaining)
+                except asyncio.TimeoutError:
+                    return
+                if message is None:
+                    self.stats.error("espectador: servidor cerró la conexión")
+                    return
+
+                msg_type = message.get('type')
+                if msg_type == 'welcome':
+                    wanted = [feature for feature, on in (('delta', self.use_delta), ('binary', self.use_binary),
+                                                          ('heartbeat', True))
+                              if on and feature in message.get('features', [])]
+                    if wanted:
+                        await transport.enviar({'type': 'hello', 'features': wanted})
+                        transport.binary = 'binary' in wanted
+                    await transport.enviar({'type': 'spectate'})
+
+                elif msg_type == 'hello_ack':
+                    if message.get('protocol') == 'binary':
+                        transport.recibir_binario()
+
+                elif msg_type == 'ping':
+                    await transport.enviar({'type': 'pong'})
+
+                elif msg_type in ('game_start', 'game_update', 'game_delta'):
+                    self.stats.spectator_updates += 1
+                    if msg_type == 'game_delta':
+                        game_state = aplicar_delta(game_state, message) if game_state else None
+                        if game_state is None:
+                            await transport.enviar({'type': 'sync'})
+                            continue
+                    else:
+                        self.stats.spectator_resyncs += 1
+                        game_state = message['game_state']
+                    if game_state['game_over']:
+                        game_state = None
+                        await transport.enviar({'type': 'spectate'})
+
+                elif msg_type in ('room_closed', 'player_disconnected'):
+                    game_state = None
+                    await transport.enviar({'type': 'spectate'})
+
+                elif msg_type == 'error':
+                    # Todavía no hay partidas en curso: reintentar en un momento
+                    await asyncio.sleep(0.2)
+                    await transport.enviar({'type': 'spectate'})
+        finally:
+            self.stats.bytes_received += transport.bytes_received
+            await transport.cerrar()
+
+
+async def run_load(args):
+    stats = LoadStats()
+    policy = POLITICAS[args.politica]
+    think_time = parse_tiempo_pensar(args.pensar)
+    deadline = time.monotonic() + args.duracion
+
+    if args.transporte == 'ws':
+        url = args.url or f"ws://{args.host}:{args.port}"
+        make_transport = lambda: TransporteWS(url)
+    else:
+        make_transport = lambda: TransporteTCP(args.host, args.port)
+
+    players = [SimulatedPlayer(i, make_transport, policy, think_time, stats, deadline,
+                               args.partidas, timeout=args.timeout, use_delta=args.delta,
+                               use_binary=args.binario, drop_rate=args.cortes)
+               for i in range(args.jugadores)]
+
+    start = time.monotonic()
+    spectators = [asyncio.create_task(SimulatedSpectator(make_transport, stats, deadline, timeout=args.timeout,
+                                                         use_delta=args.delta, use_binary=args.binario).run())
+                  for _ in range(args.espectadores)]
+    tasks = []
+    for player in players:
+        tasks.append(asyncio.create_task(player.run()))
+        # Rampa de conexión para no saturar el backlog de accept
+        if args.rampa > 0:
+            await asyncio.sleep(args.rampa / args.jugadores)
+
+    await asyncio.gather(*tasks)
+    # Los espectadores observan mientras haya jugadores
+    for task in spectators:
+        task.cancel()
+    await asyncio.gather(*spectators, return_exceptions=True)
+    return stats, time.monotonic() - start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generador de carga para los servidores Othello")
+    parser.add_argument('--transporte', choices=['tcp', 'ws'], default='tcp')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--url', help="URL WebSocket (por defecto ws://host:port)")
+    parser.add_argument('--jugadores', type=int, default=100, help="conexiones concurrentes")
+    parser.add_argument('--espectadores', type=int, default=0,
+                        help="conexiones que observan partidas en curso (servidor_multisala.py)")
+    parser.add_argument('--partidas', type=int, default=0,
+                        help="partidas por jugador (0 = hasta agotar la duración)")
+    parser.add_argument('--duracion', type=float, default=60.0, help="segundos máximos de prueba")
+    parser.add_argument('--rampa', type=float, default=1.0, help="segundos para abrir todas las conexiones")
+    parser.add_argument('--politica', choices=sorted(POLITICAS), default='random')
+    parser.add_argument('--pensar', default='0', type=str,
+                        help="tiempo de pensar: 0 | const:S | uniform:A:B | exp:MEDIA | normal:MEDIA:DESV")
+    parser.add_argument('--timeout', type=float, default=30.0, help="timeout de respuesta a un movimiento")
+    parser.add_argument('--delta', action='store_true',
+                        help="pedir actualizaciones delta si el servidor las soporta")
+    parser.add_argument('--binario', action='store_true',
+                        help="negociar el protocolo binario si el servidor lo soporta")
+    parser.add_argument('--cortes', type=float, default=0.0,
+                        help="probabilidad de cortar la conexión tras cada movimiento y retomar la sesión")
+    parser.add_argument('--json', action='store_true', help="imprimir también el resumen en JSON")
+    args = parser.parse_args(argv)
+    parse_tiempo_pensar(args.pensar)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("=" * 50)
+    print("📈 GENERADOR DE CARGA OTHELLO")
+    print("=" * 50)
+    destino = args.url or f"{args.host}:{args.port}"
+    print(f"🎯 {args.jugadores} jugadores {args.transporte.upper()} contra {destino}")
+    print(f"🧠 Política: {args.politica}  ⏳ Pensar: {args.pensar}  ⏱️  Duración: {args.duracion}s")
+
+    try:
+        stats, elapsed = asyncio.run(run_load(args))
+    except KeyboardInterrupt:
+        print("\n⏹️  Interrumpido")
+        return 1
+
+    stats.report(elapsed)
+    if args.json:
+        print(json.dumps(stats.as_dict(elapsed)))
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
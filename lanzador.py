@@ -1,14 +1,32 @@
 # ia_visual.py - Cliente IA con interfaz gráfica PyGame
-import pygame
+#
+# Modo headless (sin ventana ni pygame) para correr muchos bots por máquina:
+#   python lanzador.py --headless --host localhost --port 5555 --difficulty hard
+#   python lanzador.py --headless --bots 50 --partidas 0 --think-time 0
 import sys
+import argparse
 import numpy as np
 import socket
-import json
 import threading
 import time
 import random
 import copy
 
+from protocolo import aplicar_delta
+from protocolo_binario import FrameReader, encode
+
+# pygame se importa bajo demanda para que el modo headless no lo necesite
+pygame = None
+
+
+def cargar_pygame():
+    """Importa pygame solo cuando se usa la interfaz gráfica"""
+    global pygame
+    if pygame is None:
+        import pygame as _pygame
+        pygame = _pygame
+    return pygame
+
 # Constantes
 WIDTH, HEIGHT = 800, 800
 BOARD_SIZE = 8
@@ -199,7 +217,7 @@ class OthelloAI:
 
 
 class AIGameClient:
-    def __init__(self, host='localhost', port=5555, difficulty='medium', think_time=1.5):
+    def __init__(self, host='localhost', port=5555, difficulty='medium', think_time=1.5, headless=False):
         self.host = host
         self.port = port
         self.socket = None
@@ -211,11 +229,24 @@ class AIGameClient:
         self.ai = OthelloAI(difficulty=difficulty)
         self.think_time = think_time
         self.difficulty_name = difficulty.upper()
+        self.headless = headless
+        self.opponent_left = False
+        self.receive_thread = None
+
+        # Se activa con cada mensaje o desconexión para despertar el bucle headless
+        self.state_changed = threading.Event()
 
         # Estado inicial del tablero
         self.initialize_default_board()
 
+        # Tiempo para próximo movimiento
+        self.next_move_time = None
+
+        if headless:
+            return
+
         # PyGame
+        cargar_pygame()
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption(f"IA Othello - {self.difficulty_name}")
@@ -224,9 +255,6 @@ class AIGameClient:
         self.small_font = pygame.font.SysFont('Arial', 18)
         self.big_font = pygame.font.SysFont('Arial', 36, bold=True)
 
-        # Tiempo para próximo movimiento
-        self.next_move_time = None
-
     def initialize_default_board(self):
         self.default_board = np.zeros((BOARD_SIZE, BOARD_SIZE), dtype=int)
         mid = BOARD_SIZE // 2
@@ -242,13 +270,15 @@ class AIGameClient:
             self.socket.settimeout(10)
             self.socket.connect((self.host, self.port))
             self.socket.settimeout(0.5)
+            self.binary = False
+            self.frame_reader = FrameReader()
             self.connected = True
             self.connection_status = "Conectado"
             print("✅ ¡Conectado al servidor!")
 
-            receive_thread = threading.Thread(target=self.receive_messages)
-            receive_thread.daemon = True
-            receive_thread.start()
+            self.receive_thread = threading.Thread(target=self.receive_messages)
+            self.receive_thread.daemon = True
+            self.receive_thread.start()
             return True
 
         except Exception as e:
@@ -257,30 +287,32 @@ class AIGameClient:
             return False
 
     def receive_messages(self):
-        buffer = ""
         while self.connected:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = self.socket.recv(4096)
                 if not data:
                     print("📭 Servidor cerró la conexión")
                     self.connected = False
+                    self.state_changed.set()
                     break
 
-                buffer += data
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    if message_str.strip():
-                        try:
-                            message = json.loads(message_str)
-                            self.handle_message(message)
-                        except json.JSONDecodeError as e:
-                            print(f"❌ Error decodificando JSON: {e}")
+                self.frame_reader.feed(data)
+                while True:
+                    try:
+                        message = self.frame_reader.next_message()
+                    except ValueError as e:
+                        print(f"❌ Error decodificando mensaje: {e}")
+                        continue
+                    if message is None:
+                        break
+                    self.handle_message(message)
 
             except socket.timeout:
                 continue
             except Exception as e:
                 print(f"❌ Error recibiendo mensajes: {e}")
                 self.connected = False
+                self.state_changed.set()
                 break
 
     def handle_message(self, message):
@@ -293,6 +325,10 @@ class AIGameClient:
             self.connection_status = f"IA {color_name} - {self.difficulty_name}"
             self.waiting_for_opponent = True
             print(f"🎯 Soy {color_name}")
+            self.negotiate(message.get('features', []))
+
+        elif msg_type == 'hello_ack':
+            self.frame_reader.binary = message.get('protocol') == 'binary'
 
         elif msg_type == 'waiting':
             self.waiting_for_opponent = True
@@ -310,11 +346,36 @@ class AIGameClient:
             print("📊 Tablero actualizado")
             self.schedule_next_move()
 
+        elif msg_type == 'game_delta':
+            new_state = aplicar_delta(self.game_state, message)
+            if new_state is None:
+                print("⚠️ Hueco en la secuencia de deltas, pidiendo estado completo")
+                self.send_message({'type': 'sync'})
+            else:
+                self.game_state = new_state
+                self.waiting_for_opponent = False
+                self.schedule_next_move()
+
         elif msg_type == 'opponent_disconnected':
             self.waiting_for_opponent = True
             self.connection_status = "Oponente desconectado"
+            self.opponent_left = True
             print("⚠️ Oponente desconectado")
 
+        elif msg_type == 'move_timeout':
+            print("⏰ " + message['message'])
+
+        elif msg_type == 'ping':
+            self.send_message({'type': 'pong'})
+
+        self.state_changed.set()
+
+    def is_game_finished(self):
+        """Verifica si la partida actual terminó (fin de juego o abandono del oponente)"""
+        if self.opponent_left:
+            return True
+        return bool(self.game_state and self.game_state['game_over'])
+
     def schedule_next_move(self):
         """Programa el próximo movimiento"""
         if (self.game_state and
@@ -352,13 +413,22 @@ class AIGameClient:
             self.send_move(row, col)
 
     def send_move(self, row, col):
-        message = {'type': 'move', 'row': row, 'col': col}
+        self.send_message({'type': 'move', 'row': row, 'col': col})
+
+    def send_message(self, message):
         try:
-            message_str = json.dumps(message) + '\n'
-            self.socket.send(message_str.encode('utf-8'))
+            self.socket.sendall(encode(message, self.binary))
         except Exception as e:
             print(f"❌ Error enviando: {e}")
 
+    def negotiate(self, server_features):
+        """Pide actualizaciones delta, protocolo binario y heartbeat si el servidor los soporta"""
+        wanted = [feature for feature in ('delta', 'binary', 'heartbeat') if feature in server_features]
+        if wanted:
+            self.send_message({'type': 'hello', 'features': wanted})
+            # Desde el hello se envía en binario; se recibe en binario tras el hello_ack
+            self.binary = 'binary' in wanted
+
     def draw_waiting_screen(self):
         self.screen.fill(BACKGROUND)
 
@@ -511,7 +581,61 @@ class AIGameClient:
         exit_surface = self.small_font.render(exit_text, True, WHITE)
         exit_rect = exit_surface.get_rect(center=(WIDTH // 2, HEIGHT - 50))
         self.screen.blit(exit_surface, exit_rect)
+    def run_headless(self, games=1):
+        """Juega sin interfaz: solo red y búsqueda.
+
+        games indica cuántas partidas jugar antes de salir; con 0 el bot se
+        vuelve a encolar indefinidamente al terminar cada partida.
+        """
+        played = 0
+        while games == 0 or played < games:
+            if not self.connect():
+                return played
+
+            while self.connected and not self.is_game_finished():
+                timeout = None
+                if self.next_move_time:
+                    timeout = max(0.0, self.next_move_time - time.time())
+                self.state_changed.wait(timeout)
+                self.state_changed.clear()
+                self.check_and_make_move()
+
+            if not self.is_game_finished():
+                print("⚠️ Conexión perdida antes de terminar la partida")
+                return played
+
+            played += 1
+            if self.game_state and self.game_state['game_over']:
+                scores = self.game_state['scores']
+                print(f"🏁 Partida {played} terminada - Negro: {scores['black']}  Blanco: {scores['white']}")
+
+            self.reset_for_requeue()
+
+        return played
+
+    def reset_for_requeue(self):
+        """Cierra la conexión y limpia el estado para volver a emparejar"""
+        self.connected = False
+        # El hilo receptor sale en su próximo timeout; esperarlo evita que lea del socket nuevo
+        if self.receive_thread:
+            self.receive_thread.join()
+            self.receive_thread = None
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+        self.player_color = None
+        self.game_state = None
+        self.waiting_for_opponent = True
+        self.next_move_time = None
+        self.opponent_left = False
+        self.connection_status = "Desconectado"
+        self.state_changed.clear()
+
     def run(self):
+        if self.headless:
+            self.run_headless()
+            return
+
         if not self.connect():
             print("⚠️ No se pudo conectar")
 
@@ -542,7 +666,44 @@ class AIGameClient:
         sys.exit()
 
 
+def run_headless_bots(args):
+    """Lanza uno o más bots headless en este proceso (un hilo por bot)"""
+    def bot_worker():
+        client = AIGameClient(args.host, args.port, args.difficulty,
+                              think_time=args.think_time, headless=True)
+        client.run_headless(games=args.partidas)
+
+    threads = [threading.Thread(target=bot_worker, daemon=True) for _ in range(args.bots)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        print("\n⏹️  Deteniendo bots...")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente IA de Othello")
+    parser.add_argument('--headless', action='store_true',
+                        help="sin ventana ni pygame: solo red y búsqueda")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--difficulty', choices=['easy', 'medium', 'hard'], default='medium')
+    parser.add_argument('--think-time', type=float, default=1.5,
+                        help="segundos de espera antes de cada movimiento")
+    parser.add_argument('--partidas', type=int, default=1,
+                        help="partidas por bot antes de salir (0 = reencolar siempre)")
+    parser.add_argument('--bots', type=int, default=1, help="bots headless en este proceso")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.headless:
+        run_headless_bots(args)
+        sys.exit(0)
+
     print("="*50)
     print("🤖 CLIENTE IA VISUAL - OTHELLO")
     print("="*50)
@@ -0,0 +1,129 @@
+# limitador.py - Límite de mensajes por conexión y por IP (token bucket)
+#
+# Cada mensaje entrante gasta una ficha del bucket de su conexión y otra del
+# bucket de su IP (compartido por todas las conexiones de esa dirección). Los
+# buckets se rellenan a 'rate' fichas por segundo hasta 'burst'.
+#
+# FrameReader consulta el límite con cada marco completo, antes de decodificar
+# el JSON, así que un cliente que inunda al servidor no le cuesta más que
+# separar líneas. Sin fichas se aplica la acción configurada:
+#   'drop'       - el mensaje se descarta sin decodificar
+#   'delay'      - el mensaje espera a que haya fichas; mientras tanto el
+#                  servidor no lee más de esa conexión (el cliente queda
+#                  frenado por TCP)
+#   'disconnect' - se cierra la conexión (RateLimited)
+#
+# El generador de carga abre todas sus conexiones desde una IP: con muchos
+# jugadores conviene subir el límite por IP (o desactivarlo, --limite 0).
+import threading
+import time
+
+DESCARTAR = 'drop'
+DEMORAR = 'delay'
+DESCONECTAR = 'disconnect'
+ACCIONES = (DESCARTAR, DEMORAR, DESCONECTAR)
+
+# Mensajes por segundo (sostenido, ráfaga). Un jugador manda muy pocos; la
+# IP deja margen para varias conexiones detrás de un NAT.
+LIMITE_CONEXION = (20, 40)
+LIMITE_IP = (1000, 2000)
+
+
+class RateLimited(Exception):
+    """La conexión superó su límite de mensajes y la acción es desconectar"""
+
+
+class TokenBucket:
+    """Fichas que se rellenan a rate por segundo hasta burst"""
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def refill(self, now):
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+        return self.tokens
+
+    def wait(self):
+        """Segundos hasta la próxima ficha (tras refill)"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class ConnectionLimit:
+    """Límite de una conexión: su bucket y el de su IP"""
+    __slots__ = ('limiter', 'ip', 'bucket', 'ip_bucket', 'wait')
+
+    def __init__(self, limiter, ip, bucket, ip_bucket):
+        self.limiter = limiter
+        self.ip = ip
+        self.bucket = bucket
+        self.ip_bucket = ip_bucket
+        self.wait = 0.0  # Con 'delay': segundos a esperar antes de reintentar
+
+    def check(self):
+        """None si el mensaje pasa (gasta las fichas); si no, la acción a aplicar"""
+        now = self.limiter.clock()
+        if self.bucket.refill(now) >= 1 and self.ip_bucket.refill(now) >= 1:
+            self.bucket.tokens -= 1
+            self.ip_bucket.tokens -= 1
+            return None
+
+        limiter = self.limiter
+        if limiter.action == DESCONECTAR:
+            limiter.disconnected += 1
+            raise RateLimited(f"Más de {self.bucket.rate:g} mensajes por segundo")
+        if limiter.action == DEMORAR:
+            limiter.delayed += 1
+            self.wait = max(self.bucket.wait(), self.ip_bucket.wait())
+        else:
+            limiter.dropped += 1
+        return limiter.action
+
+    def release(self):
+        """La conexión se cerró: suelta el bucket de su IP si era la última"""
+        self.limiter.release(self.ip)
+
+
+class RateLimiter:
+    """Buckets por conexión y por IP con la acción a aplicar al excederse"""
+
+    def __init__(self, rate=LIMITE_CONEXION[0], burst=LIMITE_CONEXION[1], ip_rate=LIMITE_IP[0],
+                 ip_burst=LIMITE_IP[1], action=DEMORAR, clock=time.monotonic):
+        if action not in ACCIONES:
+            raise ValueError(f"Acción de límite desconocida: {action}")
+        self.rate = rate
+        self.burst = burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.action = action
+        self.clock = clock
+        self.ips = {}  # {ip: [TokenBucket, conexiones abiertas]}
+        self.lock = threading.Lock()  # servidor.py abre y cierra conexiones desde varios hilos
+
+        # Estadísticas
+        self.dropped = 0
+        self.delayed = 0
+        self.disconnected = 0
+
+    def connection(self, ip):
+        """ConnectionLimit para una conexión nueva desde ip"""
+        now = self.clock()
+        with self.lock:
+            entry = self.ips.get(ip)
+            if entry is None:
+                entry = self.ips[ip] = [TokenBucket(self.ip_rate, self.ip_burst, now), 0]
+            entry[1] += 1
+        return ConnectionLimit(self, ip, TokenBucket(self.rate, self.burst, now), entry[0])
+
+    def release(self, ip):
+        with self.lock:
+            entry = self.ips.get(ip)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self.ips[ip]
@@ -0,0 +1,247 @@
+# metricas.py - Métricas del servidor en formato de texto de Prometheus
+#
+# Contadores, gauges e histogramas de buckets fijos. Actualizarlos es sumar a
+# un entero o a una posición de una lista: el servidor multi-sala corre en un
+# solo hilo (asyncio), así que no hay locks en el camino caliente. Los gauges
+# que dependen del estado (clientes, salas, colas) se calculan recién cuando
+# alguien consulta el endpoint.
+#
+# MetricsServer atiende GET /metrics en un puerto aparte (HTTP/1.0 mínimo):
+#
+#   curl http://localhost:9100/metrics
+#
+# En modo multi-proceso cada worker expone su propio puerto (base + id del
+# worker) con la etiqueta worker="<id>" para que el scraper los junte.
+import asyncio
+import time
+from bisect import bisect_left
+
+# Segundos: de 50µs a 1s
+BUCKETS_LATENCIA = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# Mensajes pendientes en una cola de salida al vaciarla
+BUCKETS_PROFUNDIDAD = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Counter:
+    """Valor que solo crece; con fn se lee de otro contador al consultar"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, {}, self.fn() if self.fn else self.value
+
+
+class Gauge:
+    """Valor que sube y baja; con fn se calcula al consultar"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield self.name, {}, self.fn() if self.fn else self.value
+
+
+class Histogram:
+    """Conteo por buckets fijos (acumulados al exportar), suma y total"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=BUCKETS_LATENCIA):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # El último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager que observa la duración del bloque"""
+        return _Timer(self)
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket', {'le': format_value(bound)}, cumulative
+        yield f'{self.name}_sum', {}, self.sum
+        yield f'{self.name}_count', {}, self.count
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Conjunto de métricas con etiquetas comunes (p. ej. worker)"""
+
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, fn=None):
+        return self.register(Counter(name, help_text, fn))
+
+    def gauge(self, name, help_text, fn=None):
+        return self.register(Gauge(name, help_text, fn))
+
+    def histogram(self, name, help_text, buckets=BUCKETS_LATENCIA):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        """Texto de exposición de Prometheus (versión 0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{format_labels(self.labels, labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class ServerMetrics:
+    """Métricas del servidor multi-sala (los gauges los conecta el servidor)"""
+
+    def __init__(self, labels=None):
+        self.registry = registry = MetricsRegistry(labels)
+
+        # Latencias
+        self.accept_seconds = registry.histogram(
+            'othello_accept_seconds', 'Desde que se acepta la conexión hasta que se encola el welcome')
+        self.move_seconds = registry.histogram(
+            'othello_move_validation_seconds', 'Validar y aplicar un movimiento')
+        self.broadcast_seconds = registry.histogram(
+            'othello_broadcast_seconds', 'Codificar y encolar una actualización para toda la sala')
+        self.queue_depth = registry.histogram(
+            'othello_outbound_queue_depth', 'Mensajes pendientes en una cola de salida al escribirla',
+            BUCKETS_PROFUNDIDAD)
+
+        # Contadores
+        self.bytes_in = registry.counter('othello_bytes_received_total', 'Bytes recibidos de los clientes')
+        self.bytes_out = registry.counter('othello_bytes_sent_total', 'Bytes escritos a los clientes')
+        self.connections = registry.counter('othello_connections_total', 'Conexiones aceptadas')
+        self.moves = registry.counter('othello_moves_total', 'Movimientos aceptados')
+        self.moves_rejected = registry.counter('othello_moves_rejected_total', 'Movimientos rechazados')
+        self.games_started = registry.counter('othello_games_started_total', 'Partidas iniciadas')
+        self.games_finished = registry.counter('othello_games_finished_total', 'Partidas terminadas por reglas')
+        self.resyncs = registry.counter(
+            'othello_backpressure_resyncs_total', 'Clientes atrasados resincronizados con el estado completo')
+        self.backpressure_disconnects = registry.counter(
+            'othello_backpressure_disconnects_total', 'Clientes atrasados desconectados')
+        self.resumes = registry.counter('othello_sessions_resumed_total', 'Sesiones retomadas tras un corte')
+        self.pings = registry.counter('othello_pings_sent_total', 'Pings a conexiones en silencio')
+        self.idle_disconnects = registry.counter(
+            'othello_idle_disconnects_total', 'Conexiones cerradas por inactividad (sin pong)')
+        self.handshake_timeouts = registry.counter(
+            'othello_handshake_timeouts_total', 'Conexiones cerradas sin haber mandado ningún mensaje')
+        self.move_timeouts = registry.counter('othello_move_timeouts_total', 'Partidas perdidas por tiempo de turno')
+
+        # Bots del servidor
+        self.bot_move_seconds = registry.histogram(
+            'othello_bot_move_seconds', 'Desde que un bot pide su movimiento al pool hasta que llega')
+        self.bot_games = registry.counter('othello_bot_games_total', 'Partidas con un bot sentado')
+        self.bot_fallbacks = registry.counter(
+            'othello_bot_fallbacks_total', 'Movimientos de bot al azar por no llegar dentro del presupuesto')
+
+        # Servicio de análisis
+        self.analysis_requests = registry.counter('othello_analysis_requests_total', 'Posiciones pedidas al análisis')
+        self.analysis_cache_hits = registry.counter(
+            'othello_analysis_cache_hits_total', 'Pedidos de análisis respondidos desde la caché')
+        self.analysis_coalesced = registry.counter(
+            'othello_analysis_coalesced_total', 'Pedidos de análisis que esperaron una posición ya en curso')
+        self.analysis_rejected = registry.counter(
+            'othello_analysis_rejected_total', 'Pedidos de análisis rechazados por cola llena')
+        self.analysis_batch_size = registry.histogram(
+            'othello_analysis_batch_size', 'Posiciones por lote enviado al pool', BUCKETS_PROFUNDIDAD)
+        self.analysis_batch_seconds = registry.histogram(
+            'othello_analysis_batch_seconds', 'Analizar un lote en el pool (con la espera por un proceso)')
+
+    def render(self):
+        return self.registry.render()
+
+
+class MetricsServer:
+    """Endpoint HTTP mínimo para el scraper (GET /metrics)"""
+
+    def __init__(self, render, host='0.0.0.0', port=9100):
+        self.render = render
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Descartar las cabeceras
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Solo /metrics\n'
+            writer.write(f'HTTP/1.0 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server:
+            self.server.close()
@@ -1,6 +1,9 @@
 # ia_n_jugadores.py - IA para Othello N jugadores
-import pygame
+#
+# Modo headless (sin ventana ni pygame) para correr muchos bots por máquina:
+#   python n_jugadores.py --headless --host localhost --port 5555 --bots 20
 import sys
+import argparse
 import numpy as np
 import socket
 import json
@@ -9,6 +12,20 @@ import time
 import random
 import copy
 
+from protocolo_binario import FrameReader
+
+# pygame se importa bajo demanda para que el modo headless no lo necesite
+pygame = None
+
+
+def cargar_pygame():
+    """Importa pygame solo cuando se usa la interfaz gráfica"""
+    global pygame
+    if pygame is None:
+        import pygame as _pygame
+        pygame = _pygame
+    return pygame
+
 # Constantes (igual que cliente_n_jugadores.py)
 WIDTH, HEIGHT = 800, 850
 BOARD_SIZE = 8
@@ -186,7 +203,7 @@ class OthelloAINPlayers:
 
 
 class AIGameClientNPlayers:
-    def __init__(self, host='localhost', port=5555, difficulty='medium', think_time=1.5):
+    def __init__(self, host='localhost', port=5555, difficulty='medium', think_time=1.5, headless=False):
         self.host = host
         self.port = port
         self.socket = None
@@ -199,11 +216,21 @@ class AIGameClientNPlayers:
         self.difficulty_name = difficulty.upper()
         self.think_time = think_time
         self.next_move_time = None
+        self.opponent_left = False
 
         # IA (se inicializará cuando sepamos num_players)
         self.ai = None
         self.difficulty = difficulty
 
+        self.headless = headless
+        self.receive_thread = None
+        # Se activa con cada mensaje o desconexión para despertar el bucle headless
+        self.state_changed = threading.Event()
+
+        if headless:
+            return
+
+        cargar_pygame()
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption(f"IA {self.difficulty_name} - Othello N Jugadores")
@@ -222,9 +249,9 @@ class AIGameClientNPlayers:
             self.connection_status = "Conectado"
             print("✅ Conectado!")
 
-            receive_thread = threading.Thread(target=self.receive_messages)
-            receive_thread.daemon = True
-            receive_thread.start()
+            self.receive_thread = threading.Thread(target=self.receive_messages)
+            self.receive_thread.daemon = True
+            self.receive_thread.start()
             return True
         except Exception as e:
             self.connection_status = f"Error: {e}"
@@ -232,27 +259,29 @@ class AIGameClientNPlayers:
             return False
 
     def receive_messages(self):
-        buffer = ""
+        frame_reader = FrameReader()
         while self.connected:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = self.socket.recv(4096)
                 if not data:
                     self.connected = False
+                    self.state_changed.set()
                     break
 
-                buffer += data
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    if message_str.strip():
-                        try:
-                            message = json.loads(message_str)
-                            self.handle_message(message)
-                        except json.JSONDecodeError:
-                            pass
+                frame_reader.feed(data)
+                while True:
+                    try:
+                        message = frame_reader.next_message()
+                    except ValueError:
+                        continue
+                    if message is None:
+                        break
+                    self.handle_message(message)
             except socket.timeout:
                 continue
             except:
                 self.connected = False
+                self.state_changed.set()
                 break
 
     def handle_message(self, message):
@@ -284,6 +313,21 @@ class AIGameClientNPlayers:
             self.waiting_for_opponent = False
             self.schedule_next_move()
 
+        elif msg_type == 'opponent_disconnected':
+            self.waiting_for_opponent = True
+            self.connection_status = "Oponente desconectado"
+            self.opponent_left = True
+            self.next_move_time = None
+            print("⚠️ Oponente desconectado")
+
+        self.state_changed.set()
+
+    def is_game_finished(self):
+        """Verifica si la partida actual terminó (fin de juego o abandono del oponente)"""
+        if self.opponent_left:
+            return True
+        return bool(self.game_state and self.game_state['game_over'])
+
     def schedule_next_move(self):
         if (self.game_state and
                 not self.game_state['game_over'] and
@@ -450,7 +494,58 @@ class AIGameClientNPlayers:
             self.screen.blit(surface, (WIDTH // 2 - 60, y - 10))
             y += 40
 
+    def run_headless(self, games=1):
+        """Juega sin interfaz: solo red y búsqueda (games=0 reencola siempre)"""
+        played = 0
+        while games == 0 or played < games:
+            if not self.connect():
+                return played
+
+            while self.connected and not self.is_game_finished():
+                timeout = None
+                if self.next_move_time:
+                    timeout = max(0.0, self.next_move_time - time.time())
+                self.state_changed.wait(timeout)
+                self.state_changed.clear()
+                self.check_and_make_move()
+
+            if not self.is_game_finished():
+                print("⚠️ Conexión perdida antes de terminar la partida")
+                return played
+
+            # Un abandono del oponente cuenta como partida terminada: se vuelve a encolar
+            played += 1
+            if self.game_state and self.game_state['game_over']:
+                print(f"🏁 Partida {played} terminada - {self.game_state['scores']}")
+
+            self.reset_for_requeue()
+
+        return played
+
+    def reset_for_requeue(self):
+        """Cierra la conexión y limpia el estado para volver a emparejar"""
+        self.connected = False
+        # El hilo receptor sale en su próximo timeout; esperarlo evita que lea del socket nuevo
+        if self.receive_thread:
+            self.receive_thread.join()
+            self.receive_thread = None
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+        self.player_number = None
+        self.num_players = None
+        self.game_state = None
+        self.waiting_for_opponent = True
+        self.next_move_time = None
+        self.opponent_left = False
+        self.connection_status = "Desconectado"
+        self.state_changed.clear()
+
     def run(self):
+        if self.headless:
+            self.run_headless()
+            return
+
         if not self.connect():
             print("⚠️ No conectado")
 
@@ -479,7 +574,44 @@ class AIGameClientNPlayers:
         sys.exit()
 
 
+def run_headless_bots(args):
+    """Lanza uno o más bots headless en este proceso (un hilo por bot)"""
+    def bot_worker():
+        client = AIGameClientNPlayers(args.host, args.port, args.difficulty,
+                                      think_time=args.think_time, headless=True)
+        client.run_headless(games=args.partidas)
+
+    threads = [threading.Thread(target=bot_worker, daemon=True) for _ in range(args.bots)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        print("\n⏹️  Deteniendo bots...")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="IA de Othello para N jugadores")
+    parser.add_argument('--headless', action='store_true',
+                        help="sin ventana ni pygame: solo red y búsqueda")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--difficulty', choices=['easy', 'medium', 'hard'], default='medium')
+    parser.add_argument('--think-time', type=float, default=1.5,
+                        help="segundos de espera antes de cada movimiento")
+    parser.add_argument('--partidas', type=int, default=1,
+                        help="partidas por bot antes de salir (0 = reencolar siempre)")
+    parser.add_argument('--bots', type=int, default=1, help="bots headless en este proceso")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.headless:
+        run_headless_bots(args)
+        sys.exit(0)
+
     print("="*50)
     print("🤖 IA OTHELLO N-JUGADORES")
     print("="*50)
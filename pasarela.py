@@ -0,0 +1,113 @@
+# pasarela.py - Un solo proceso para clientes TCP y WebSocket en las mismas salas
+#
+# cliente.py y lanzador.py hablan JSON por líneas (o marcos binarios) sobre
+# TCP; WebLanzador.py habla WebSocket. La pasarela escucha en los dos puertos
+# y sienta a todos en el mismo motor de salas (servidor_multisala.py), así que
+# un humano en escritorio puede jugar contra una IA web.
+#
+# Cada conexión es un ClientHandler de su transporte: lo que entra se decodifica
+# al mismo mensaje (dict) y lo que sale se codifica según la conexión. Las
+# difusiones son SharedMessage: cada formato (línea JSON, marco binario TCP,
+# texto o binario WebSocket) se codifica una sola vez por mensaje, y solo los
+# formatos que alguien de la sala usa.
+#
+# Uso:
+#   python pasarela.py                          # TCP en 5555, WebSocket en PORT o 8765
+#   python pasarela.py --tcp 5555 --ws 8080 --metricas 9100
+#   python pasarela.py --tcp 0 --ws 8080        # solo WebSocket
+#   python pasarela.py --bots 30 --bot-dificultad hard
+#   python pasarela.py --analisis 2             # pistas y revisión con 2 procesos
+import argparse
+import asyncio
+import os
+
+from analisis import ANALISIS_WORKERS
+from bots import ESPERA_BOT, MAX_PARTIDAS_BOT, PRESUPUESTOS
+from limitador import ACCIONES, DEMORAR, LIMITE_CONEXION
+from registro import get_logger
+from WebServidor import OthelloWebServer
+
+log = get_logger()
+
+PUERTO_TCP = 5555
+PUERTO_WS = 8765
+
+
+class OthelloGateway(OthelloWebServer):
+    """Servidor multi-sala que acepta conexiones TCP y WebSocket"""
+
+    def __init__(self, host='0.0.0.0', tcp_port=PUERTO_TCP, ws_port=PUERTO_WS, **options):
+        super().__init__(host, ws_port, **options)
+        self.tcp_port = tcp_port  # None o 0: sin TCP
+        self.ws_server = None
+
+    async def listen(self):
+        """WebSocket en self.ws_server; TCP (si está activo) en self.server"""
+        await super().listen()
+        self.ws_server = self.server
+        if self.tcp_port:
+            self.server = await asyncio.start_server(
+                self.handle_connection, self.host, self.tcp_port, backlog=self.backlog)
+        log.info('gateway_listening', host=self.host, tcp_port=self.tcp_port, ws_port=self.port)
+
+    def register_gauges(self):
+        super().register_gauges()
+        self.metrics.registry.gauge(
+            'othello_clients_websocket', 'Conexiones WebSocket abiertas (el resto son TCP)',
+            lambda: sum(1 for client in self.clients if client.transport == 'ws'))
+
+    def stop(self):
+        if self.ws_server is not None and self.ws_server is not self.server:
+            self.ws_server.close()
+        super().stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pasarela Othello: clientes TCP y WebSocket en las mismas salas")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--tcp', type=int, default=PUERTO_TCP, metavar='PUERTO',
+                        help="puerto TCP (0 = sin TCP)")
+    # Render define el puerto público en la variable de entorno PORT
+    parser.add_argument('--ws', type=int, default=int(os.environ.get("PORT", PUERTO_WS)), metavar='PUERTO',
+                        help="puerto WebSocket (por defecto PORT o 8765)")
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--contrapresion', choices=['resync', 'disconnect'], default='resync',
+                        help="qué hacer con clientes que no leen a tiempo")
+    parser.add_argument('--metricas', type=int, metavar='PUERTO', help="exponer /metrics en PUERTO")
+    parser.add_argument('--diario', metavar='DIR', default=os.environ.get("JOURNAL_DIR"),
+                        help="directorio del diario (las partidas sobreviven a un reinicio)")
+    parser.add_argument('--archivo', metavar='RUTA', default=os.environ.get("ARCHIVE_PATH"),
+                        help="archivo de partidas terminadas")
+    parser.add_argument('--tiempo-turno', type=float, metavar='SEG',
+                        help="segundos por turno; quien no mueve a tiempo pierde")
+    parser.add_argument('--handshake', type=float, metavar='SEG',
+                        help="cerrar conexiones que no mandan ningún mensaje en SEG segundos")
+    parser.add_argument('--limite', type=float, default=LIMITE_CONEXION[0], metavar='MSG/S',
+                        help="mensajes por segundo por conexión (ráfaga del doble, 0 = sin límite)")
+    parser.add_argument('--accion-limite', choices=ACCIONES, default=DEMORAR,
+                        help="qué hacer con los mensajes que exceden el límite")
+    parser.add_argument('--bots', type=float, nargs='?', const=ESPERA_BOT, metavar='SEG',
+                        help=f"sentar un bot tras SEG segundos sin oponente (por defecto {ESPERA_BOT})")
+    parser.add_argument('--bot-dificultad', choices=sorted(PRESUPUESTOS), default='medium')
+    parser.add_argument('--bot-partidas', type=int, default=MAX_PARTIDAS_BOT, metavar='N',
+                        help="máximo de partidas con bot a la vez")
+    parser.add_argument('--analisis', type=int, nargs='?', const=ANALISIS_WORKERS, metavar='N',
+                        help=f"atender 'hint' y 'analyze' con N procesos (por defecto {ANALISIS_WORKERS})")
+    parser.add_argument('--proxy', action='store_true', default=os.environ.get("TRUST_PROXY") == "1",
+                        help="tomar la IP de los clientes WebSocket de X-Forwarded-For")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    gateway = OthelloGateway(args.host, args.tcp, args.ws, backlog=args.backlog,
+                             backpressure=args.contrapresion, metrics_port=args.metricas,
+                             journal_dir=args.diario, archive_path=args.archivo,
+                             move_timeout=args.tiempo_turno, handshake_timeout=args.handshake,
+                             rate_limit=(args.limite, 2 * args.limite) if args.limite else None,
+                             rate_action=args.accion_limite, trust_proxy=args.proxy,
+                             bot_wait=args.bots, bot_difficulty=args.bot_dificultad,
+                             bot_options={'max_games': args.bot_partidas},
+                             analysis={'workers': args.analisis} if args.analisis else None)
+    print(f"🚀 Pasarela Othello: TCP en {args.tcp or '-'}, WebSocket en {args.ws}")
+    gateway.start()
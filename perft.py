@@ -0,0 +1,337 @@
+# perft.py - Benchmark perft y prueba de conformidad de los generadores de movimientos
+#
+# El proyecto tiene varios generadores de movimientos escritos por separado
+# (uno por servidor, uno por cliente IA y el de protocolo.py). Esta
+# herramienta cuenta las hojas del árbol de juego hasta una profundidad N,
+# verifica que todas las implementaciones coincidan nodo a nodo y reporta
+# nodos/segundo de cada una.
+#
+# Uso:
+#   python perft.py                      # todas las posiciones, profundidad 4
+#   python perft.py --depth 6 --posicion inicial
+#   python perft.py --impl servidor --divide
+import os
+import sys
+import time
+import argparse
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+
+
+# Posiciones de prueba: 64 casillas (fila a fila, '-' vacía, 'X' negro, 'O' blanco)
+# seguidas del jugador al que le toca mover.
+POSICIONES = {
+    'inicial': '---------------------------OX------XO--------------------------- X',
+    'apertura': '---------O---O---XOX-O-----OXO-----XOX-------OX----------------- X',
+    'medio_juego': '--O-----XXXXXXO-XXX-O-O--XOOOXO-XO-OOOO----O--OX---------------- X',
+    'medio_juego_2': '----OOX-----OO-XXO-OOOOXOXOOOOXO--XOOXO---OOXOOX-OOXXOX-OOXXXX-- X',
+    'final': 'OOOO-X-XOOOOOOXXOOOXOXXX-OOOXOX-OOOXOXXO-OX-XXXOOOOOOXXOXO--XXXX X',
+    'pase': 'XXXXXXXXXXXXXXXOXXXOOXOOXXXOXO-OXOOXOOOOXOOOOXO-X-OOOOXX----OXXX O',
+}
+
+# Valores de referencia publicados para la posición inicial (los pases cuentan
+# como una jugada y una partida terminada cuenta como hoja).
+PERFT_INICIAL = {1: 4, 2: 12, 3: 56, 4: 244, 5: 1396, 6: 8200, 7: 55092, 8: 390216, 9: 3005288}
+
+
+def parse_posicion(texto):
+    """Convierte una posición en texto a (tablero, jugador)"""
+    casillas, turno = texto.split()
+    if len(casillas) != 64:
+        raise ValueError(f"La posición debe tener 64 casillas, tiene {len(casillas)}")
+    valores = {'-': 0, 'X': 1, 'O': 2}
+    board = np.array([valores[ch] for ch in casillas], dtype=int).reshape(8, 8)
+    return board, 1 if turno == 'X' else 2
+
+
+def formatear_posicion(board, player):
+    """Convierte (tablero, jugador) a texto"""
+    casillas = ''.join('-XO'[int(v)] for v in np.asarray(board).flatten())
+    return f"{casillas} {'X' if player == 1 else 'O'}"
+
+
+# ==============================================================
+# Adaptadores: una interfaz común sobre cada generador
+# ==============================================================
+class Implementacion:
+    """Adaptador de un generador de movimientos a una interfaz común"""
+    nombre = None
+
+    def movimientos(self, board, player):
+        """Lista ordenada de (fila, columna) válidos"""
+        raise NotImplementedError
+
+    def jugar(self, board, row, col, player):
+        """Retorna un tablero nuevo con el movimiento aplicado"""
+        raise NotImplementedError
+
+
+class ImplOthelloGame(Implementacion):
+    """Adaptador para las clases OthelloGame de los servidores"""
+
+    def __init__(self, nombre, game_class):
+        self.nombre = nombre
+        self.game = game_class()
+
+    def movimientos(self, board, player):
+        self.game.board = board
+        self.game.invalidate_cache()  # El tablero cambió sin pasar por make_move
+        return sorted((int(r), int(c)) for r, c in self.game.get_valid_moves(player))
+
+    def jugar(self, board, row, col, player):
+        self.game.board = board.copy()
+        self.game.invalidate_cache()
+        if not self.game.make_move(row, col, player):
+            raise ValueError(f"{self.nombre} rechazó ({row}, {col})")
+        return self.game.board
+
+
+class ImplOthelloAI(Implementacion):
+    """Adaptador para OthelloAI (lanzador.py)"""
+    nombre = 'lanzador.OthelloAI'
+
+    def __init__(self, ai_class):
+        self.ai = ai_class()
+
+    def movimientos(self, board, player):
+        return sorted((int(r), int(c)) for r, c in self.ai.get_valid_moves_from_board(board, player))
+
+    def jugar(self, board, row, col, player):
+        return self.ai.simulate_move(board, row, col, player)
+
+
+class ImplLanzador(Implementacion):
+    """Adaptador para Lanzador (WebLanzador.py)"""
+    nombre = 'WebLanzador.Lanzador'
+
+    def __init__(self, lanzador_class):
+        self.lanzador = lanzador_class()
+
+    def movimientos(self, board, player):
+        return sorted((int(r), int(c)) for r, c in self.lanzador.obtener_movimientos_validos(board, player))
+
+    def jugar(self, board, row, col, player):
+        return self.lanzador.aplicar_movimiento(board, row, col, player)
+
+
+class ImplProtocolo(Implementacion):
+    """Adaptador para el generador de protocolo.py (usado al aplicar deltas)"""
+    nombre = 'protocolo'
+
+    def __init__(self, modulo):
+        self.modulo = modulo
+
+    def movimientos(self, board, player):
+        return sorted((r, c) for r, c in self.modulo.movimientos_validos(board.tolist(), player))
+
+    def jugar(self, board, row, col, player):
+        nuevo = board.copy()
+        nuevo[row][col] = player
+        for r, c in self.modulo.calcular_volteos(board, row, col, player):
+            nuevo[r][c] = player
+        return nuevo
+
+
+def cargar_implementaciones():
+    """Importa todas las implementaciones disponibles.
+
+    Retorna (implementaciones, omitidas) donde omitidas es una lista de
+    (nombre, motivo) para los módulos que no se pudieron importar.
+    """
+    implementaciones = []
+    omitidas = []
+
+    def intentar(nombre, fabrica):
+        try:
+            implementaciones.append(fabrica())
+        except ImportError as e:
+            omitidas.append((nombre, str(e)))
+
+    def servidor():
+        from servidor import OthelloGame
+        return ImplOthelloGame('servidor.OthelloGame', OthelloGame)
+
+    def multisala():
+        from servidor_multisala import OthelloGame
+        return ImplOthelloGame('servidor_multisala.OthelloGame', OthelloGame)
+
+    def othello_ai():
+        from lanzador import OthelloAI
+        return ImplOthelloAI(OthelloAI)
+
+    def web_lanzador():
+        from WebLanzador import Lanzador
+        return ImplLanzador(Lanzador)
+
+    def protocolo():
+        import protocolo
+        return ImplProtocolo(protocolo)
+
+    intentar('servidor.OthelloGame', servidor)
+    intentar('servidor_multisala.OthelloGame', multisala)
+    intentar('lanzador.OthelloAI', othello_ai)
+    intentar('WebLanzador.Lanzador', web_lanzador)
+    intentar('protocolo', protocolo)
+    return implementaciones, omitidas
+
+
+# ==============================================================
+# Perft
+# ==============================================================
+def perft(impl, board, player, depth, passed=False):
+    """Cuenta las hojas del árbol de juego hasta la profundidad dada.
+
+    Un pase cuenta como una jugada; si ambos jugadores pasan la partida
+    terminó y el nodo cuenta como hoja.
+    """
+    if depth == 0:
+        return 1
+
+    moves = impl.movimientos(board, player)
+    if not moves:
+        if passed:
+            return 1
+        return perft(impl, board, 3 - player, depth - 1, passed=True)
+
+    if depth == 1:
+        return len(moves)
+
+    total = 0
+    for row, col in moves:
+        total += perft(impl, impl.jugar(board, row, col, player), 3 - player, depth - 1)
+    return total
+
+
+def divide(impl, board, player, depth):
+    """Perft desglosado por jugada raíz (útil para localizar diferencias)"""
+    moves = impl.movimientos(board, player)
+    if not moves:
+        return {'pase': perft(impl, board, 3 - player, depth - 1, passed=True)}
+    return {(row, col): perft(impl, impl.jugar(board, row, col, player), 3 - player, depth - 1)
+            for row, col in moves}
+
+
+def verificar_conformidad(implementaciones, board, player, depth):
+    """Recorre el árbol y compara movimientos y tableros resultantes en cada nodo.
+
+    Retorna una lista de discrepancias (vacía si todas coinciden).
+    """
+    referencia = implementaciones[0]
+    discrepancias = []
+
+    def recorrer(board, player, depth, passed):
+        if depth == 0 or discrepancias:
+            return
+
+        moves = referencia.movimientos(board, player)
+        for impl in implementaciones[1:]:
+            otros = impl.movimientos(board, player)
+            if otros != moves:
+                discrepancias.append(
+                    f"{impl.nombre} vs {referencia.nombre} en {formatear_posicion(board, player)}: "
+                    f"{otros} != {moves}")
+                return
+
+        if not moves:
+            if not passed:
+                recorrer(board, 3 - player, depth - 1, True)
+            return
+
+        for row, col in moves:
+            hijo = referencia.jugar(board, row, col, player)
+            for impl in implementaciones[1:]:
+                otro = impl.jugar(board, row, col, player)
+                if not np.array_equal(np.asarray(otro), hijo):
+                    discrepancias.append(
+                        f"{impl.nombre} vs {referencia.nombre} jugando ({row}, {col}) en "
+                        f"{formatear_posicion(board, player)}: tableros distintos")
+                    return
+            recorrer(hijo, 3 - player, depth - 1, False)
+
+    recorrer(board, player, depth, False)
+    return discrepancias
+
+
+def medir(impl, board, player, depth):
+    """Ejecuta perft y retorna (nodos, segundos)"""
+    inicio = time.perf_counter()
+    nodos = perft(impl, board, player, depth)
+    return nodos, time.perf_counter() - inicio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft y conformidad de los generadores de movimientos")
+    parser.add_argument('--depth', type=int, default=4, help="profundidad (default 4)")
+    parser.add_argument('--posicion', action='append', choices=sorted(POSICIONES),
+                        help="posición a probar (repetible; default todas)")
+    parser.add_argument('--impl', action='append',
+                        help="filtrar implementaciones por subcadena del nombre (repetible)")
+    parser.add_argument('--divide', action='store_true', help="mostrar perft por jugada raíz")
+    parser.add_argument('--sin-conformidad', action='store_true',
+                        help="omitir la comparación nodo a nodo")
+    args = parser.parse_args(argv)
+
+    implementaciones, omitidas = cargar_implementaciones()
+    if args.impl:
+        implementaciones = [impl for impl in implementaciones
+                            if any(filtro in impl.nombre for filtro in args.impl)]
+    if not implementaciones:
+        print("❌ No hay implementaciones disponibles")
+        return 2
+
+    print("=" * 70)
+    print(f"🧮 PERFT - profundidad {args.depth}")
+    print("=" * 70)
+    for nombre, motivo in omitidas:
+        print(f"⚠️  {nombre} omitida: {motivo}")
+
+    errores = 0
+    for nombre_posicion in args.posicion or list(POSICIONES):
+        board, player = parse_posicion(POSICIONES[nombre_posicion])
+        print(f"\n📍 {nombre_posicion}: {POSICIONES[nombre_posicion]}")
+
+        resultados = {}
+        for impl in implementaciones:
+            nodos, segundos = medir(impl, board, player, args.depth)
+            resultados[impl.nombre] = nodos
+            nps = nodos / segundos if segundos > 0 else float('inf')
+            print(f"   {impl.nombre:<32} {nodos:>12,} nodos  {segundos:8.3f}s  {nps:>12,.0f} nodos/s")
+
+        if len(set(resultados.values())) > 1:
+            print("   ❌ Las implementaciones no coinciden en el conteo")
+            errores += 1
+
+        esperado = PERFT_INICIAL.get(args.depth) if nombre_posicion == 'inicial' else None
+        if esperado is not None:
+            for nombre, nodos in resultados.items():
+                if nodos != esperado:
+                    print(f"   ❌ {nombre}: {nodos} != {esperado} (valor de referencia)")
+                    errores += 1
+
+        if not args.sin_conformidad and len(implementaciones) > 1:
+            discrepancias = verificar_conformidad(implementaciones, board, player, args.depth)
+            if discrepancias:
+                errores += 1
+                for d in discrepancias:
+                    print(f"   ❌ {d}")
+            else:
+                print("   ✅ Todas las implementaciones coinciden nodo a nodo")
+
+        if args.divide:
+            for impl in implementaciones:
+                print(f"   ➗ {impl.nombre}")
+                for move, nodos in divide(impl, board, player, args.depth).items():
+                    print(f"      {move}: {nodos}")
+
+    print()
+    if errores:
+        print(f"❌ {errores} error(es) de conformidad")
+        return 1
+    print("✅ Conformidad OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
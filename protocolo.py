@@ -0,0 +1,97 @@
+# protocolo.py - Utilidades del protocolo compartidas por servidores y clientes
+#
+# Actualizaciones delta: en lugar de mandar el estado completo en cada
+# 'game_update', un cliente que anuncia la característica 'delta' en su
+# mensaje 'hello' recibe 'game_delta' con solo el número de secuencia, la
+# jugada, las fichas volteadas y el nuevo turno:
+#
+#   {"type": "game_delta", "seq": 12, "player": 1, "move": [2, 3],
+#    "flips": [[3, 3]], "current_player": 2, "game_over": false, "winner": null}
+#
+# El cliente aplica el delta sobre su copia del estado (aplicar_delta) y, si
+# detecta un hueco en la secuencia, pide el estado completo con {"type": "sync"}.
+
+DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Características que los servidores anuncian en 'welcome'
+# ('binary' se describe en protocolo_binario.py)
+FEATURES = ['delta', 'binary']
+
+
+def calcular_volteos(board, row, col, player):
+    """Lista de casillas [fila, columna] que voltearía jugar en (row, col)"""
+    if board[row][col] != 0:
+        return []
+
+    opponent = 3 - player
+    flips = []
+    for dr, dc in DIRECTIONS:
+        r, c = row + dr, col + dc
+        line = []
+        while 0 <= r < 8 and 0 <= c < 8 and board[r][c] == opponent:
+            line.append([r, c])
+            r += dr
+            c += dc
+        if line and 0 <= r < 8 and 0 <= c < 8 and board[r][c] == player:
+            flips.extend(line)
+    return flips
+
+
+def movimientos_validos(board, player):
+    """Movimientos válidos en el mismo orden que los servidores (por filas)"""
+    return [[row, col] for row in range(8) for col in range(8)
+            if board[row][col] == 0 and calcular_volteos(board, row, col, player)]
+
+
+def calcular_puntajes(board):
+    """Puntajes en el formato de game_state"""
+    black = sum(row.count(1) for row in board)
+    white = sum(row.count(2) for row in board)
+    return {'black': black, 'white': white}
+
+
+def crear_delta(game, player, row, col):
+    """Construye un mensaje game_delta a partir del último movimiento de game"""
+    return {
+        'type': 'game_delta',
+        'seq': game.seq,
+        'player': int(player),
+        'move': [int(row), int(col)],
+        'flips': game.last_flips,
+        'current_player': int(game.current_player),
+        'game_over': game.game_over,
+        'winner': getattr(game, 'winner', None),
+    }
+
+
+def quiere_delta(features):
+    """Verifica si un cliente pidió actualizaciones delta"""
+    return 'delta' in features
+
+
+def aplicar_delta(game_state, delta):
+    """Aplica un game_delta y retorna el nuevo game_state.
+
+    Retorna None si el delta no es el siguiente en la secuencia (el cliente
+    debe pedir un estado completo con {"type": "sync"}).
+    """
+    if not game_state or game_state.get('seq') is None or delta['seq'] != game_state['seq'] + 1:
+        return None
+
+    board = [list(row) for row in game_state['board']]
+    player = delta['player']
+    row, col = delta['move']
+    board[row][col] = player
+    for r, c in delta['flips']:
+        board[r][c] = player
+
+    current_player = delta['current_player']
+    return {
+        'board': board,
+        'current_player': current_player,
+        'valid_moves': [] if delta['game_over'] else movimientos_validos(board, current_player),
+        'scores': calcular_puntajes(board),
+        'game_over': delta['game_over'],
+        'winner': delta.get('winner'),
+        'seq': delta['seq'],
+    }
@@ -0,0 +1,357 @@
+# protocolo_binario.py - Protocolo binario compacto, negociado junto a JSON
+#
+# Negociación (siempre empieza en JSON):
+#   1. El servidor anuncia 'binary' en features del 'welcome'.
+#   2. El cliente manda {"type": "hello", "features": [..., "binary"]} en JSON y
+#      desde ese momento envía todo en binario.
+#   3. El servidor responde {"type": "hello_ack", "protocol": "binary"} como
+#      último mensaje JSON; todo lo que sigue llega en binario.
+#
+# Marco TCP:  longitud (uint32 big-endian) + opcode (1 byte) + payload
+# WebSocket:  un mensaje binario = opcode + payload (WebSocket ya delimita)
+#
+# El tablero viaja como dos máscaras de 64 bits (negras, blancas) con el bit
+# fila * 8 + columna; los movimientos válidos y las fichas volteadas también
+# son máscaras de 64 bits. Los mensajes sin codificación propia viajan como
+# OP_JSON, así que cualquier tipo de mensaje sigue funcionando.
+import json
+import struct
+
+from limitador import DESCARTAR
+from protocolo import calcular_puntajes
+
+OP_JSON = 0x01
+OP_MOVE = 0x02
+OP_STATE = 0x03
+OP_DELTA = 0x04
+OP_MOVE_RESPONSE = 0x05
+OP_SYNC = 0x06
+
+LENGTH = struct.Struct('>I')
+# tipo (0 game_start, 1 game_update), negras, blancas, turno, flags, ganador, seq, válidos
+STATE = struct.Struct('>BQQBBBIQ')
+# seq, jugador, casilla, turno, flags, ganador, volteadas
+DELTA = struct.Struct('>IBBBBBQ')
+
+FLAG_GAME_OVER = 0x01
+FLAG_HAS_WINNER = 0x02
+
+STATE_TYPES = {'game_start': 0, 'game_update': 1}
+STATE_NAMES = {0: 'game_start', 1: 'game_update'}
+
+
+class ProtocolError(ValueError):
+    """Marco binario mal formado"""
+
+
+class FrameTooLarge(ProtocolError):
+    """Mensaje más grande que el máximo permitido por FrameReader"""
+
+
+# ==============================================================
+# Máscaras de 64 bits
+# ==============================================================
+def board_to_masks(board):
+    """Tablero 8x8 (lista o numpy) -> (máscara negras, máscara blancas)"""
+    black = white = 0
+    bit = 1
+    for row in board:
+        for cell in row:
+            if cell == 1:
+                black |= bit
+            elif cell == 2:
+                white |= bit
+            bit <<= 1
+    return black, white
+
+
+def masks_to_board(black, white):
+    """(máscara negras, máscara blancas) -> tablero como lista de listas"""
+    board = []
+    for row in range(8):
+        line = []
+        for col in range(8):
+            bit = 1 << (row * 8 + col)
+            line.append(1 if black & bit else 2 if white & bit else 0)
+        board.append(line)
+    return board
+
+
+def squares_to_mask(squares):
+    mask = 0
+    for row, col in squares:
+        mask |= 1 << (int(row) * 8 + int(col))
+    return mask
+
+
+def mask_to_squares(mask):
+    """Casillas de la máscara en orden por filas (mismo orden que get_valid_moves)"""
+    squares = []
+    while mask:
+        low = mask & -mask
+        index = low.bit_length() - 1
+        squares.append([index // 8, index % 8])
+        mask ^= low
+    return squares
+
+
+def _flags(game_over, winner):
+    flags = FLAG_GAME_OVER if game_over else 0
+    if winner is not None:
+        flags |= FLAG_HAS_WINNER
+    return flags
+
+
+# ==============================================================
+# Codificación de mensajes (opcode + payload, sin longitud)
+# ==============================================================
+def encode_message(message):
+    """Mensaje (dict) -> bytes opcode + payload"""
+    msg_type = message.get('type')
+
+    if msg_type == 'move' and isinstance(message.get('row'), int) and isinstance(message.get('col'), int) \
+            and 0 <= message['row'] < 8 and 0 <= message['col'] < 8:
+        return bytes((OP_MOVE, message['row'], message['col']))
+
+    if msg_type in STATE_TYPES and set(message) <= {'type', 'game_state', 'message'}:
+        state = message['game_state']
+        black, white = board_to_masks(state['board'])
+        winner = state.get('winner')
+        return bytes((OP_STATE,)) + STATE.pack(
+            STATE_TYPES[msg_type], black, white, int(state['current_player']),
+            _flags(state['game_over'], winner), winner or 0, state.get('seq', 0),
+            squares_to_mask(state['valid_moves']))
+
+    if msg_type == 'game_delta':
+        row, col = message['move']
+        winner = message.get('winner')
+        return bytes((OP_DELTA,)) + DELTA.pack(
+            message['seq'], message['player'], row * 8 + col, message['current_player'],
+            _flags(message['game_over'], winner), winner or 0, squares_to_mask(message['flips']))
+
+    if msg_type == 'move_response' and set(message) <= {'type', 'success', 'message'}:
+        return bytes((OP_MOVE_RESPONSE, 1 if message.get('success') else 0)) + \
+            message.get('message', '').encode('utf-8')
+
+    if msg_type == 'sync' and len(message) == 1:
+        return bytes((OP_SYNC,))
+
+    return bytes((OP_JSON,)) + json.dumps(message).encode('utf-8')
+
+
+def decode_message(data):
+    """bytes opcode + payload -> mensaje (dict con el mismo formato que en JSON)"""
+    if not data:
+        raise ProtocolError("Marco vacío")
+    opcode = data[0]
+    payload = memoryview(data)[1:]
+
+    try:
+        if opcode == OP_JSON:
+            return json.loads(bytes(payload).decode('utf-8'))
+
+        if opcode == OP_MOVE:
+            return {'type': 'move', 'row': payload[0], 'col': payload[1]}
+
+        if opcode == OP_STATE:
+            kind, black, white, current, flags, winner, seq, valid = STATE.unpack(payload)
+            board = masks_to_board(black, white)
+            message = {
+                'type': STATE_NAMES[kind],
+                'game_state': {
+                    'board': board,
+                    'current_player': current,
+                    'valid_moves': mask_to_squares(valid),
+                    'scores': calcular_puntajes(board),
+                    'game_over': bool(flags & FLAG_GAME_OVER),
+                    'winner': winner if flags & FLAG_HAS_WINNER else None,
+                    'seq': seq,
+                }
+            }
+            if kind == 0:
+                message['message'] = '¡Juego iniciado!'
+            return message
+
+        if opcode == OP_DELTA:
+            seq, player, square, current, flags, winner, flips = DELTA.unpack(payload)
+            return {
+                'type': 'game_delta',
+                'seq': seq,
+                'player': player,
+                'move': [square // 8, square % 8],
+                'flips': mask_to_squares(flips),
+                'current_player': current,
+                'game_over': bool(flags & FLAG_GAME_OVER),
+                'winner': winner if flags & FLAG_HAS_WINNER else None,
+            }
+
+        if opcode == OP_MOVE_RESPONSE:
+            return {'type': 'move_response', 'success': bool(payload[0]),
+                    'message': bytes(payload[1:]).decode('utf-8')}
+
+        if opcode == OP_SYNC:
+            return {'type': 'sync'}
+    except (struct.error, IndexError, KeyError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"Marco inválido (opcode {opcode:#x}): {e}")
+
+    raise ProtocolError(f"Opcode desconocido: {opcode:#x}")
+
+
+# ==============================================================
+# Marcos sobre TCP
+# ==============================================================
+def frame(message):
+    """Mensaje -> marco TCP con prefijo de longitud"""
+    body = encode_message(message)
+    return LENGTH.pack(len(body)) + body
+
+
+def encode(message, binary):
+    """Codifica un mensaje para un socket TCP según el protocolo negociado"""
+    if isinstance(message, SharedMessage):
+        return message.tcp(binary)
+    if binary:
+        return frame(message)
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+class SharedMessage:
+    """Mensaje para muchos destinatarios, codificado una sola vez por formato.
+
+    Los servidores lo usan al difundir: la primera conexión que lo necesita en
+    un formato (JSON/binario, TCP/WebSocket) lo codifica y las demás reciben
+    los mismos bytes, que son inmutables y se comparten entre sus colas.
+    """
+    __slots__ = ('message', 'encoded')
+
+    def __init__(self, message):
+        self.message = message
+        self.encoded = {}
+
+    def tcp(self, binary):
+        """Bytes listos para un socket TCP (línea JSON o marco binario)"""
+        key = ('tcp', binary)
+        data = self.encoded.get(key)
+        if data is None:
+            data = frame(self.message) if binary else (json.dumps(self.message) + '\n').encode('utf-8')
+            self.encoded[key] = data
+        return data
+
+    def websocket(self, binary):
+        """Mensaje WebSocket: bytes (binario) o texto JSON"""
+        key = ('ws', binary)
+        data = self.encoded.get(key)
+        if data is None:
+            data = encode_message(self.message) if binary else json.dumps(self.message)
+            self.encoded[key] = data
+        return data
+
+
+class FrameReader:
+    """Separa mensajes de un flujo TCP en JSON por líneas o en marcos binarios.
+
+    Trabaja sobre un bytearray con un offset de lectura: consumir un mensaje
+    solo avanza el offset (el resto del buffer no se copia) y el espacio ya
+    leído se libera de vez en cuando en feed(). El salto de línea se busca en bytes y
+    se decodifica el mensaje completo, así que un carácter UTF-8 de varios
+    bytes partido entre dos recv() no es problema.
+
+    Un mensaje de más de max_frame bytes lanza FrameTooLarge y descarta el
+    buffer (el servidor debe cerrar la conexión).
+
+    El modo puede cambiar entre mensajes (binary = True tras la negociación):
+    los bytes que ya están en el buffer se interpretan con el modo nuevo.
+
+    Con limit (limitador.ConnectionLimit) cada marco completo se consulta
+    antes de decodificarlo: descartado, se salta; demorado, next_message
+    retorna None y deja en throttled los segundos a esperar antes de volver
+    a llamarlo (el marco sigue en el buffer).
+    """
+    MAX_FRAME = 64 * 1024
+    COMPACT_AT = 64 * 1024  # Bytes consumidos antes de compactar el buffer
+
+    def __init__(self, binary=False, max_frame=MAX_FRAME, limit=None):
+        self.binary = binary
+        self.max_frame = max_frame
+        self.limit = limit
+        self.throttled = 0.0
+        self.buffer = bytearray()
+        self.offset = 0  # Inicio del siguiente mensaje
+        self.scanned = 0  # Hasta dónde ya se buscó '\n' sin encontrarlo
+
+    def feed(self, data):
+        if self.offset:
+            if self.offset == len(self.buffer):
+                self.buffer.clear()
+                self.scanned = self.offset = 0
+            elif self.offset >= self.COMPACT_AT or self.offset * 2 >= len(self.buffer):
+                del self.buffer[:self.offset]
+                self.scanned -= self.offset
+                self.offset = 0
+        self.buffer += data
+
+    def pending(self):
+        """Bytes recibidos que todavía no forman un mensaje completo"""
+        return len(self.buffer) - self.offset
+
+    def reset(self):
+        self.buffer.clear()
+        self.scanned = self.offset = 0
+
+    def admit(self):
+        """Consulta el límite: True si el marco pasa, False si se descarta, None si espera"""
+        verdict = self.limit.check()
+        if verdict is None:
+            return True
+        if verdict == DESCARTAR:
+            return False
+        self.throttled = self.limit.wait
+        return None
+
+    def next_message(self):
+        """Retorna el siguiente mensaje completo, o None si falta data (o está demorado)"""
+        self.throttled = 0.0
+        while True:
+            start = self.offset
+            if self.binary:
+                if len(self.buffer) - start < LENGTH.size:
+                    return None
+                (length,) = LENGTH.unpack_from(self.buffer, start)
+                if length > self.max_frame:
+                    self.reset()
+                    raise FrameTooLarge(f"Marco de {length} bytes (máximo {self.max_frame})")
+                end = start + LENGTH.size + length
+                if len(self.buffer) < end:
+                    return None
+                if self.limit is not None:
+                    admitted = self.admit()
+                    if admitted is None:
+                        return None
+                    if not admitted:
+                        self.offset = self.scanned = end
+                        continue
+                self.offset = self.scanned = end
+                return decode_message(self.buffer[start + LENGTH.size:end])
+
+            end = self.buffer.find(b'\n', max(start, self.scanned))
+            if end < 0:
+                self.scanned = len(self.buffer)
+                if self.scanned - start > self.max_frame:
+                    self.reset()
+                    raise FrameTooLarge(f"Línea de más de {self.max_frame} bytes sin terminar")
+                return None
+            if end - start > self.max_frame:
+                self.offset = self.scanned = end + 1
+                raise FrameTooLarge(f"Línea de {end - start} bytes (máximo {self.max_frame})")
+            line = self.buffer[start:end]
+            if not line.strip():
+                self.offset = self.scanned = end + 1
+                continue
+            if self.limit is not None:
+                admitted = self.admit()
+                if admitted is None:
+                    self.scanned = end  # El '\n' se vuelve a encontrar al reintentar
+                    return None
+            self.offset = self.scanned = end + 1
+            if self.limit is None or admitted:
+                return json.loads(line)
@@ -0,0 +1,192 @@
+# registro.py - Registro estructurado (JSON lines) fuera del camino caliente
+#
+# Registrar un evento es armar una tupla y agregarla a un buffer circular: el
+# formateo (json.dumps) y la escritura los hace un hilo aparte que vacía el
+# buffer cada INTERVALO segundos con un solo write por lote. Si el buffer se
+# llena (el escritor no da abasto), se pisan los registros más viejos y se
+# cuentan en 'dropped'.
+#
+# Cada línea es un objeto JSON:
+#
+#   {"ts": 1712345678.123, "level": "info", "event": "game_started", "room": "3f2a...", ...}
+#
+# Configuración por variables de entorno (o configure()):
+#   LOG_LEVEL    debug | info | warning | error        (por defecto info)
+#   LOG_FORMAT   json | texto                          (texto: legible para desarrollo)
+#   LOG_FILE     archivo de salida (por defecto stdout)
+#   LOG_SAMPLE   fracción de salas con registro debug/info (por defecto 1.0)
+#
+# El muestreo es por sala y no por evento: una sala muestreada se registra
+# completa (útil para seguir una partida), el resto no registra debug/info.
+# Las advertencias y errores se registran siempre.
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+NIVELES = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+NOMBRES = {value: name for name, value in NIVELES.items()}
+
+CAPACIDAD = 65536  # Registros en el buffer antes de pisar los más viejos
+INTERVALO = 0.05  # Segundos entre vaciados del escritor
+
+
+class StructuredLogger:
+    """Logger con niveles, muestreo por sala y escritor en segundo plano"""
+
+    def __init__(self, stream=None, level=INFO, fmt='json', sample_rate=1.0,
+                 capacity=CAPACIDAD, interval=INTERVALO, fields=None):
+        self.stream = stream or sys.stdout
+        self.level = level
+        self.fmt = fmt
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.interval = interval
+        self.fields = dict(fields or {})  # Campos fijos en cada línea (p. ej. worker)
+
+        self.ring = deque(maxlen=capacity)
+        self.dropped = 0
+        self.written = 0
+
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.writer = threading.Thread(target=self.write_loop, name='registro', daemon=True)
+        self.writer.start()
+
+    # ----------------------------------------------------------
+    # Camino caliente
+    # ----------------------------------------------------------
+    def enabled(self, level, room=None):
+        """¿Se registraría un evento de este nivel (y sala)?"""
+        if level < self.level:
+            return False
+        return level >= WARNING or room is None or self.sampled(room)
+
+    def sampled(self, room):
+        """Decisión estable por sala: la misma sala siempre cae del mismo lado"""
+        if self.sample_rate >= 1.0:
+            return True
+        return zlib.crc32(room.encode()) % 10000 < self.sample_rate * 10000
+
+    def log(self, level, event, room=None, **fields):
+        if not self.enabled(level, room):
+            return
+        ring = self.ring
+        if len(ring) == self.capacity:
+            self.dropped += 1
+        ring.append((time.time(), level, event, room, fields))
+
+    def debug(self, event, room=None, **fields):
+        self.log(DEBUG, event, room, **fields)
+
+    def info(self, event, room=None, **fields):
+        self.log(INFO, event, room, **fields)
+
+    def warning(self, event, room=None, **fields):
+        self.log(WARNING, event, room, **fields)
+
+    def error(self, event, room=None, **fields):
+        self.log(ERROR, event, room, **fields)
+
+    # ----------------------------------------------------------
+    # Escritor
+    # ----------------------------------------------------------
+    def format(self, record):
+        ts, level, event, room, fields = record
+        if self.fmt == 'texto':
+            stamp = time.strftime('%H:%M:%S', time.localtime(ts)) + f'.{int(ts * 1000) % 1000:03d}'
+            parts = [stamp, NOMBRES[level].upper().ljust(7), event]
+            if room is not None:
+                parts.append(f'sala={room[:8]}')
+            parts.extend(f'{key}={value}' for key, value in {**self.fields, **fields}.items())
+            return ' '.join(parts)
+        line = {'ts': round(ts, 6), 'level': NOMBRES[level], 'event': event}
+        if room is not None:
+            line['room'] = room
+        line.update(self.fields)
+        line.update(fields)
+        return json.dumps(line, ensure_ascii=False, default=str)
+
+    def drain(self):
+        """Formatea y escribe lo acumulado con un solo write"""
+        ring = self.ring
+        lines = []
+        while ring:
+            try:
+                lines.append(self.format(ring.popleft()))
+            except IndexError:
+                break
+        if not lines:
+            return
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+            self.written += len(lines)
+        except (OSError, ValueError):
+            pass  # Salida cerrada: no hay dónde registrar
+
+    def write_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.drain()
+        self.drain()
+
+    def flush(self):
+        """Pide un vaciado inmediato (no espera a que termine)"""
+        self.wakeup.set()
+
+    def close(self):
+        """Vuelca lo pendiente y detiene el escritor"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join()
+
+    def stats(self):
+        return {'pending': len(self.ring), 'written': self.written, 'dropped': self.dropped}
+
+
+_logger = None
+
+
+def configure(**options):
+    """Configura el logger global; lo que no se pasa sale de las variables de entorno.
+
+    Si ya existe se actualiza en su lugar, así los módulos que guardaron la
+    referencia (log = get_logger()) ven la configuración nueva.
+    """
+    global _logger
+    path = options.pop('path', os.environ.get('LOG_FILE'))
+    if path and 'stream' not in options:
+        options['stream'] = open(path, 'a', encoding='utf-8', buffering=1 << 16)
+    options.setdefault('level', NIVELES.get(os.environ.get('LOG_LEVEL', 'info').lower(), INFO))
+    options.setdefault('fmt', os.environ.get('LOG_FORMAT', 'json'))
+    options.setdefault('sample_rate', float(os.environ.get('LOG_SAMPLE', '1.0')))
+    if _logger is None:
+        _logger = StructuredLogger(**options)
+    else:
+        for name, value in options.items():
+            setattr(_logger, name, dict(value) if name == 'fields' else value)
+    return _logger
+
+
+def get_logger():
+    """Logger global (se configura desde el entorno la primera vez)"""
+    return _logger or configure()
+
+
+@atexit.register
+def _close():
+    if _logger is not None:
+        _logger.close()
@@ -2,16 +2,25 @@ import socket
 import threading
 import asyncio
 import websockets
-import json
 import numpy as np
 import time
 
+from diario import Journal
+from cola_salida import OutboundQueue, POLITICA_RESYNC, POLITICAS, MAX_MENSAJES, MAX_BYTES
+from limitador import DEMORAR, LIMITE_CONEXION, LIMITE_IP, RateLimited, RateLimiter
+from protocolo import FEATURES, crear_delta, quiere_delta
+from protocolo_binario import FrameReader, FrameTooLarge, SharedMessage, encode
+from sesiones import GRACIA_SESION, MoveHistory, SessionTokens
+
 class OthelloGame:
     def __init__(self):
         self.board = np.zeros((8, 8), dtype=int)
         self.current_player = 1  # 1 = Negro, 2 = Blanco
         self.game_over = False
         self.winner = None
+        self.seq = 0  # Movimientos aceptados (número de secuencia de las actualizaciones)
+        self.last_flips = []  # Fichas volteadas por el último movimiento
+        self.cache = {}  # Datos derivados del tablero en esta jugada (ver invalidate_cache)
 
         # Configuración inicial del tablero
         self.board[3][3] = 2  # Blanco
@@ -19,13 +28,20 @@ class OthelloGame:
         self.board[3][4] = 1  # Negro
         self.board[4][3] = 1  # Negro
 
+    def invalidate_cache(self):
+        """Descarta los datos derivados (make_move lo llama al cambiar el tablero)"""
+        self.cache.clear()
+
     def get_valid_moves(self, player):
-        """Retorna lista de movimientos válidos para el jugador"""
-        valid_moves = []
-        for row in range(8):
-            for col in range(8):
-                if self.is_valid_move(row, col, player):
-                    valid_moves.append([row, col])
+        """Retorna lista de movimientos válidos para el jugador (se calcula una vez por jugada)"""
+        valid_moves = self.cache.get(('moves', player))
+        if valid_moves is None:
+            valid_moves = []
+            for row in range(8):
+                for col in range(8):
+                    if self.is_valid_move(row, col, player):
+                        valid_moves.append([row, col])
+            self.cache[('moves', player)] = valid_moves
         return valid_moves
 
     def is_valid_move(self, row, col, player):
@@ -58,8 +74,10 @@ class OthelloGame:
             return False
 
         self.board[row][col] = player
+        self.invalidate_cache()
         opponent = 3 - player
         directions = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+        self.last_flips = []
 
         for dr, dc in directions:
             r, c = row + dr, col + dc
@@ -73,24 +91,33 @@ class OthelloGame:
                 elif self.board[r][c] == player:
                     for flip_r, flip_c in pieces_to_flip:
                         self.board[flip_r][flip_c] = player
+                        self.last_flips.append([flip_r, flip_c])
                     break
                 else:
                     break
 
+        self.seq += 1
         return True
 
     def get_scores(self):
-        """Retorna los puntajes de cada jugador"""
-        black = np.sum(self.board == 1)
-        white = np.sum(self.board == 2)
-        return {'black': int(black), 'white': int(white)}
+        """Retorna los puntajes de cada jugador (una vez por jugada)"""
+        scores = self.cache.get('scores')
+        if scores is None:
+            black = np.sum(self.board == 1)
+            white = np.sum(self.board == 2)
+            scores = self.cache['scores'] = {'black': int(black), 'white': int(white)}
+        return scores
+
+    def is_terminal(self):
+        """Ningún jugador puede mover"""
+        return not self.get_valid_moves(1) and not self.get_valid_moves(2)
 
     def check_game_over(self):
         """Verifica si el juego ha terminado"""
-        valid_moves_p1 = self.get_valid_moves(1)
-        valid_moves_p2 = self.get_valid_moves(2)
+        if self.game_over:
+            return True
 
-        if not valid_moves_p1 and not valid_moves_p2:
+        if self.is_terminal():
             self.game_over = True
             scores = self.get_scores()
             if scores['black'] > scores['white']:
@@ -111,18 +138,46 @@ class OthelloGame:
             'valid_moves': self.get_valid_moves(self.current_player),
             'scores': self.get_scores(),
             'game_over': self.game_over,
-            'winner': self.winner
+            'winner': self.winner,
+            'seq': self.seq
         }
 
 
 class GameServer:
-    def __init__(self, host='0.0.0.0', port=5555):
+    # Este servidor tiene una sola partida: su "sala" en el diario
+    ROOM_ID = '00000000-0000-0000-0000-000000000001'
+    RESUME_WINDOW = 5  # Segundos que una conexión extra tiene para retomar una sesión
+
+    def __init__(self, host='0.0.0.0', port=5555, backpressure=POLITICA_RESYNC,
+                 max_outbound_messages=MAX_MENSAJES, max_outbound_bytes=MAX_BYTES,
+                 journal_dir=None, resume_grace=GRACIA_SESION, rate_limit=LIMITE_CONEXION,
+                 ip_rate_limit=LIMITE_IP, rate_action=DEMORAR):
+        if backpressure not in POLITICAS:
+            raise ValueError(f"Política de contrapresión desconocida: {backpressure}")
         self.host = host
         self.port = port
         self.server_socket = None
         self.clients = []
         self.game = None
         self.player_colors = {}  # socket: color
+        self.client_features = {}  # socket: características pedidas en 'hello'
+        self.frame_readers = {}  # socket: FrameReader (JSON o binario)
+        self.binary_clients = set()  # sockets que negociaron el protocolo binario
+        self.outbound = {}  # socket: OutboundQueue (la vacía un hilo escritor por cliente)
+        self.outbound_ready = {}  # socket: threading.Event que despierta al escritor
+        self.latest_snapshot = None  # (partida, seq, SharedMessage) del último estado completo
+        self.journal = Journal(journal_dir) if journal_dir else None
+        self.recovered_game = None  # Partida restaurada del diario, para los próximos 2 jugadores
+        self.history = MoveHistory()  # Últimos deltas, para quien retoma su sesión
+        self.away = {}  # color: threading.Timer, asientos guardados a jugadores desconectados
+        self.pending = set()  # Conexiones sin asiento que solo pueden mandar 'resume'
+        self.resume_grace = resume_grace
+        self.sessions = SessionTokens.load(journal_dir) if journal_dir else SessionTokens()
+        self.backpressure = backpressure  # Qué hacer con clientes atrasados
+        self.max_outbound_messages = max_outbound_messages
+        self.max_outbound_bytes = max_outbound_bytes
+        # Límite de mensajes por conexión y por IP (rate_limit=None lo desactiva)
+        self.limiter = RateLimiter(*rate_limit, *ip_rate_limit, action=rate_action) if rate_limit else None
         self.running = False
 
     def start(self):
@@ -131,6 +186,7 @@ class GameServer:
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(2)
+        self.recover_game()
         client_socket, address = self.server_socket.accept()
         self.running = True
 
@@ -142,7 +198,20 @@ class GameServer:
                 client_socket, address = self.server_socket.accept()
                 print(f"✅ Cliente conectado desde {address}")
 
-                if len(self.clients) < 2:
+                if self.game and not self.game.game_over and (self.away or len(self.clients) >= 2):
+                    # Puede ser un jugador que vuelve (aunque su conexión vieja aún no
+                    # se haya cerrado): tiene RESUME_WINDOW segundos para mandar 'resume'
+                    self.start_writer(client_socket)
+                    self.pending.add(client_socket)
+                    timer = threading.Timer(self.RESUME_WINDOW, self.reject_pending, args=(client_socket,))
+                    timer.daemon = True
+                    timer.start()
+                    client_thread = threading.Thread(target=self.handle_client, args=(client_socket,))
+                    client_thread.daemon = True
+                    client_thread.start()
+
+                elif len(self.clients) < 2:
+                    self.start_writer(client_socket)
                     self.clients.append(client_socket)
                     player_color = len(self.clients)  # 1 o 2
                     self.player_colors[client_socket] = player_color
@@ -151,7 +220,9 @@ class GameServer:
                     welcome_msg = {
                         'type': 'welcome',
                         'player_color': player_color,
-                        'message': f'Eres el jugador {"Negro" if player_color == 1 else "Blanco"}'
+                        'message': f'Eres el jugador {"Negro" if player_color == 1 else "Blanco"}',
+                        'session': self.sessions.issue(self.ROOM_ID, player_color),
+                        'features': FEATURES
                     }
                     self.send_message(client_socket, welcome_msg)
 
@@ -188,16 +259,42 @@ class GameServer:
                 print(f"❌ Error aceptando cliente: {e}")
                 break
 
+    def recover_game(self):
+        """Restaura del diario la partida que estaba en curso al reiniciar"""
+        if not self.journal:
+            return
+        recovered, replayed = self.journal.recover()
+        state = recovered.get(self.ROOM_ID)
+        if state and not state['game_over']:
+            game = OthelloGame()
+            game.board = np.array(state['board'], dtype=int)
+            game.invalidate_cache()
+            game.current_player = state['current_player']
+            game.seq = state['seq']
+            self.recovered_game = game
+            print(f"📒 Partida restaurada del diario (jugada {game.seq}, {replayed} registros reaplicados)")
+
     def start_game(self):
-        """Inicia una nueva partida"""
-        self.game = OthelloGame()
+        """Inicia una nueva partida (o retoma la restaurada del diario)"""
+        self.history.clear()
+        if self.recovered_game:
+            self.game = self.recovered_game
+            self.recovered_game = None
+        else:
+            self.game = OthelloGame()
+            if self.journal:
+                # Cada partida empieza con el diario compactado
+                self.journal.snapshot([])
+                self.journal.room_created(self.ROOM_ID)
+                self.journal.player_joined(self.ROOM_ID, 1)
+                self.journal.player_joined(self.ROOM_ID, 2)
 
         # Enviar estado inicial a ambos jugadores
-        game_start_msg = {
+        game_start_msg = SharedMessage({
             'type': 'game_start',
             'message': '¡Juego iniciado!',
             'game_state': self.game.get_state()
-        }
+        })
 
         for client in self.clients:
             self.send_message(client, game_start_msg)
@@ -207,26 +304,40 @@ class GameServer:
 
     def handle_client(self, client_socket):
         """Maneja mensajes de un cliente"""
-        buffer = ""
+        reader = self.frame_readers.get(client_socket)
+        if reader is None:
+            limit = self.limiter.connection(client_socket.getpeername()[0]) if self.limiter else None
+            reader = self.frame_readers[client_socket] = FrameReader(limit=limit)
 
         while self.running:
             try:
-                data = client_socket.recv(4096).decode('utf-8')
+                data = client_socket.recv(4096)
                 if not data:
                     print("🔌 Cliente desconectado")
                     self.handle_disconnect(client_socket)
                     break
 
-                buffer += data
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    if message_str.strip():
-                        try:
-                            message = json.loads(message_str)
-                            self.process_message(client_socket, message)
-                        except json.JSONDecodeError as e:
-                            print(f"❌ Error decodificando JSON: {e}")
-
+                reader.feed(data)
+                while True:
+                    try:
+                        message = reader.next_message()
+                    except FrameTooLarge:
+                        raise  # No se puede resincronizar el flujo: cerrar la conexión
+                    except ValueError as e:
+                        print(f"❌ Error decodificando mensaje: {e}")
+                        continue
+                    if message is None:
+                        if reader.throttled:
+                            # Sin fichas: este hilo deja de leer hasta que se rellenen
+                            time.sleep(reader.throttled)
+                            continue
+                        break
+                    self.process_message(client_socket, message)
+
+            except RateLimited as e:
+                print(f"🚫 Cliente excedió el límite de mensajes: {e}")
+                self.handle_disconnect(client_socket)
+                break
             except Exception as e:
                 print(f"❌ Error manejando cliente: {e}")
                 self.handle_disconnect(client_socket)
@@ -238,6 +349,75 @@ class GameServer:
 
         if msg_type == 'move':
             self.handle_move(client_socket, message)
+        elif msg_type == 'hello':
+            features = set(message.get('features', []))
+            self.client_features[client_socket] = features
+            if 'binary' in features and client_socket not in self.binary_clients:
+                # Último mensaje en JSON; el cliente ya envía en binario desde su hello
+                self.send_message(client_socket, {'type': 'hello_ack', 'protocol': 'binary'})
+                self.binary_clients.add(client_socket)
+                self.frame_readers[client_socket].binary = True
+        elif msg_type == 'sync':
+            # El cliente perdió un delta: reenviar el estado completo
+            if self.game:
+                self.send_message(client_socket, self.snapshot())
+        elif msg_type == 'resume':
+            self.resume(client_socket, message.get('session'), message.get('seq'))
+
+    def resume(self, client_socket, token, seq=None):
+        """Devuelve su asiento a un jugador reconectado y lo pone al día desde seq"""
+        seat = self.sessions.verify(token)
+        stale = next((sock for sock, color in self.player_colors.items() if color == seat[1]), None) \
+            if seat else None
+        if not seat or seat[0] != self.ROOM_ID or not self.game or client_socket in self.player_colors \
+                or (seat[1] not in self.away and stale is None):
+            self.send_message(client_socket, {
+                'type': 'resume_failed',
+                'message': 'Sesión no encontrada o expirada'
+            })
+            return
+
+        color = seat[1]
+        if stale is not None:
+            # La conexión vieja todavía no notó el corte: el token manda, se descarta
+            self.player_colors.pop(stale)
+            try:
+                stale.shutdown(socket.SHUT_RDWR)  # Su handle_client la limpia
+            except OSError:
+                pass
+        else:
+            self.away.pop(color).cancel()
+        if client_socket in self.pending:
+            self.pending.discard(client_socket)
+            self.clients.append(client_socket)
+        self.player_colors[client_socket] = color
+        self.send_message(client_socket, {
+            'type': 'resumed',
+            'room_id': self.ROOM_ID,
+            'player_color': color,
+            'session': token,
+            'seq': self.game.seq,
+            'features': FEATURES
+        })
+
+        # Solo lo que se perdió: deltas desde seq o un estado completo
+        if not quiere_delta(self.client_features.get(client_socket, ())):
+            missed = [] if seq == self.game.seq else None
+        else:
+            missed = self.history.since(seq, self.game.seq)
+        if missed is None:
+            self.send_message(client_socket, self.snapshot())
+        for message in missed or ():
+            self.send_message(client_socket, message)
+
+        for client in self.clients:
+            if client is not client_socket:
+                self.send_message(client, {
+                    'type': 'opponent_returned',
+                    'player_color': color,
+                    'message': 'Tu oponente volvió'
+                })
+        print(f"🔁 Jugador {color} retomó su sesión")
 
     def handle_move(self, client_socket, message):
         """Maneja un movimiento de un jugador"""
@@ -290,14 +470,19 @@ class GameServer:
             # Verificar fin del juego
             self.game.check_game_over()
 
-            # Enviar actualización a ambos jugadores
-            update_msg = {
-                'type': 'game_update',
-                'game_state': self.game.get_state()
-            }
+            if self.journal:
+                self.journal.move(self.ROOM_ID, player_color, row, col, self.game)
+
+            # Enviar actualización a ambos jugadores (delta a quien lo pidió)
+            # (cada formato se codifica una sola vez para todos los clientes)
+            delta_msg = SharedMessage(crear_delta(self.game, player_color, row, col))
+            self.history.append(self.game.seq, delta_msg)
 
             for client in self.clients:
-                self.send_message(client, update_msg)
+                if quiere_delta(self.client_features.get(client, ())):
+                    self.send_message(client, delta_msg)
+                else:
+                    self.send_message(client, self.snapshot())
 
             if self.game.game_over:
                 print(f"🏁 Juego terminado - Ganador: {self.game.winner}")
@@ -312,39 +497,177 @@ class GameServer:
 
     def handle_disconnect(self, client_socket):
         """Maneja la desconexión de un cliente"""
+        self.client_features.pop(client_socket, None)
+        reader = self.frame_readers.pop(client_socket, None)
+        if reader and reader.limit:
+            reader.limit.release()
+        self.binary_clients.discard(client_socket)
+        self.pending.discard(client_socket)
+        self.outbound.pop(client_socket, None)
+        ready = self.outbound_ready.pop(client_socket, None)
+        if ready:
+            ready.set()  # Despierta al escritor para que termine
         if client_socket in self.clients:
             self.clients.remove(client_socket)
+            color = self.player_colors.pop(client_socket, None)
+            if color is None:
+                return  # Esperaba un asiento guardado: no jugaba
+
+            if self.game and not self.game.game_over and self.running and self.resume_grace > 0:
+                # Se le guarda el asiento: puede volver con su token de sesión
+                timer = threading.Timer(self.resume_grace, self.expire_seat, args=(color,))
+                timer.daemon = True
+                self.away[color] = timer
+                timer.start()
+                for client in self.clients:
+                    self.send_message(client, {
+                        'type': 'opponent_away',
+                        'player_color': color,
+                        'grace': self.resume_grace,
+                        'message': 'Tu oponente perdió la conexión, se le guarda el asiento'
+                    })
+                print(f"⏸️  Jugador {color} desconectado, se le guarda el asiento {self.resume_grace}s")
+                return
+
+            self.abandon_game()
+
+    def reject_pending(self, client_socket):
+        """Una conexión extra no retomó ninguna sesión a tiempo: el servidor está lleno"""
+        if client_socket not in self.pending:
+            return
+        self.handle_disconnect(client_socket)  # Sin cola: el rechazo sale directo
+        self.send_message(client_socket, {
+            'type': 'error',
+            'message': 'El servidor ya tiene 2 jugadores'
+        })
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+            client_socket.close()
+        except OSError:
+            pass
+
+    def expire_seat(self, color):
+        """Terminó la gracia de un asiento: la partida queda abandonada"""
+        if self.away.pop(color, None) is not None:
+            self.abandon_game()
+
+    def abandon_game(self):
+        """Avisa al que queda y reinicia el juego"""
+        for timer in self.away.values():
+            timer.cancel()
+        self.away.clear()
+
+        # Notificar al otro jugador
+        disconnect_msg = SharedMessage({
+            'type': 'opponent_disconnected',
+            'message': 'Tu oponente se ha desconectado'
+        })
 
-            # Notificar al otro jugador
-            disconnect_msg = {
-                'type': 'opponent_disconnected',
-                'message': 'Tu oponente se ha desconectado'
-            }
+        for client in self.clients:
+            self.send_message(client, disconnect_msg)
 
-            for client in self.clients:
-                self.send_message(client, disconnect_msg)
+        # Reiniciar el juego (al detener el servidor, la partida queda en el diario)
+        if self.journal and self.game and self.running:
+            self.journal.room_closed(self.ROOM_ID)
+        self.game = None
+        self.player_colors = {}
 
-            # Reiniciar el juego
-            self.game = None
-            self.player_colors = {}
+        print("⚠️  Cliente desconectado, esperando nuevos jugadores...")
 
-            print("⚠️  Cliente desconectado, esperando nuevos jugadores...")
+        if not self.running:
+            return
+        # Quienes siguen conectados vuelven a sentarse en orden para la próxima partida
+        for player_color, client in enumerate(self.clients, start=1):
+            self.player_colors[client] = player_color
+            self.send_message(client, {
+                'type': 'welcome',
+                'player_color': player_color,
+                'message': f'Eres el jugador {"Negro" if player_color == 1 else "Blanco"}',
+                'session': self.sessions.issue(self.ROOM_ID, player_color),
+                'features': FEATURES
+            })
+        if len(self.clients) == 2:
+            self.start_game()
+
+    def snapshot(self):
+        """Estado completo de la partida, construido y codificado una vez por movimiento"""
+        game = self.game
+        cached = self.latest_snapshot
+        if cached is None or cached[0] is not game or cached[1] != game.seq:
+            cached = self.latest_snapshot = (game, game.seq, SharedMessage({
+                'type': 'game_update',
+                'game_state': game.get_state()
+            }))
+        return cached[2]
+
+    def start_writer(self, client_socket):
+        """Crea la cola de salida del cliente y su hilo escritor"""
+        self.outbound[client_socket] = OutboundQueue(self.max_outbound_messages, self.max_outbound_bytes)
+        self.outbound_ready[client_socket] = threading.Event()
+        writer_thread = threading.Thread(
+            target=self.write_client,
+            args=(client_socket, self.outbound[client_socket], self.outbound_ready[client_socket])
+        )
+        writer_thread.daemon = True
+        writer_thread.start()
+
+    def write_client(self, client_socket, queue, ready):
+        """Hilo escritor: manda todo lo pendiente del cliente en una sola escritura"""
+        while self.running and client_socket in self.outbound:
+            ready.wait()
+            ready.clear()
+            data = queue.drain()
+            if not data:
+                continue
+            try:
+                client_socket.sendall(data)
+            except Exception as e:
+                print(f"❌ Error enviando mensaje: {e}")
+                break
 
     def send_message(self, client_socket, message):
-        """Envía un mensaje a un cliente"""
+        """Encola un mensaje para el hilo escritor del cliente (no bloquea)"""
+        data = encode(message, client_socket in self.binary_clients)
+        queue = self.outbound.get(client_socket)
+        if queue is None:
+            # Conexión sin escritor (p. ej. rechazo por servidor lleno)
+            try:
+                client_socket.sendall(data)
+            except Exception as e:
+                print(f"❌ Error enviando mensaje: {e}")
+            return
+
+        if queue.push(data):
+            self.outbound_ready[client_socket].set()
+        else:
+            self.handle_backpressure(client_socket, queue)
+
+    def handle_backpressure(self, client_socket, queue):
+        """El cliente no lee a tiempo: resincronizar con el estado completo o desconectar"""
+        if self.backpressure == POLITICA_RESYNC and self.game:
+            queue.clear()
+            if queue.push(encode(self.snapshot(), client_socket in self.binary_clients)):
+                self.outbound_ready[client_socket].set()
+                print("⚠️ Cliente atrasado, resincronizado con el estado completo")
+                return
+
+        print(f"⚠️ Cliente atrasado ({len(queue)} mensajes pendientes), desconectando")
         try:
-            message_str = json.dumps(message) + '\n'
-            client_socket.send(message_str.encode('utf-8'))
-        except Exception as e:
-            print(f"❌ Error enviando mensaje: {e}")
+            client_socket.shutdown(socket.SHUT_RDWR)  # handle_client detecta el cierre
+        except OSError:
+            pass
 
     def stop(self):
         """Detiene el servidor"""
         self.running = False
+        for timer in self.away.values():
+            timer.cancel()
         for client in self.clients:
             client.close()
         if self.server_socket:
             self.server_socket.close()
+        if self.journal:
+            self.journal.close()
         print("🛑 Servidor detenido")
 
 
@@ -358,7 +681,8 @@ if __name__ == "__main__":
     # Render define el puerto en la variable de entorno PORT
     port = int(os.environ.get("PORT", 5555))
 
-    server = GameServer(host="0.0.0.0", port=port)
+    # JOURNAL_DIR activa el diario: la partida sobrevive a un reinicio
+    server = GameServer(host="0.0.0.0", port=port, journal_dir=os.environ.get("JOURNAL_DIR"))
 
     try:
         server.start()
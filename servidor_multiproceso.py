@@ -0,0 +1,548 @@
+# servidor_multiproceso.py - Servidor multi-sala repartido en varios procesos
+#
+# Un proceso de Python usa un solo núcleo (GIL). Este modo arranca N workers,
+# cada uno un OthelloServerMultiRoom con su propio bucle asyncio y su propio
+# socket de escucha en el mismo puerto (SO_REUSEPORT: el kernel reparte las
+# conexiones entre ellos). Cada sala vive en un único worker, así que las
+# jugadas nunca cruzan procesos.
+#
+# El proceso padre es el coordinador: lleva la cola de emparejamiento global
+# (FIFO por pool, igual que emparejamiento.Matchmaker). Habla con cada worker
+# por un socketpair Unix SOCK_SEQPACKET con mensajes JSON:
+#
+#   worker -> coordinador
+#     {"op": "match", "pool": p, "ticket": t}   conexión nueva sin sala
+#     {"op": "waiting", "pool": p, "room_id": r} sala local esperando (requeue)
+#     {"op": "cancel", "room_id": r}             la sala ya no espera (se sentó un bot)
+#     {"op": "closed", "room_id": r}             la sala se eliminó
+#     {"op": "handoff", "room_id": r, "worker": w} + fd del cliente
+#     {"op": "handoff", "room_id": r, "state": {...}} + fd (resume de la sala r)
+#     {"op": "stats", ...}                       estadísticas periódicas
+#
+#   coordinador -> worker
+#     {"op": "wait", "ticket": t, "room_id": r}  crear la sala r y esperar
+#     {"op": "join", "ticket": t, "room_id": r, "worker": w}
+#     {"op": "adopt", "room_id": r} + fd         cliente migrado a la sala r
+#     {"op": "adopt", "room_id": r, "state": {...}} + fd   cliente que retoma r
+#
+# Si el oponente espera en otro worker, la conexión nueva (que todavía no se
+# leyó) se pasa a ese worker con SCM_RIGHTS y se sienta en su sala.
+#
+# Para retomar una sesión (ver sesiones.py) todos los workers firman con el
+# mismo secreto y el coordinador sabe qué worker aloja cada sala (las anota
+# al crearlas con 'wait' o 'waiting' y las olvida con 'closed'). Un 'resume'
+# de una sala que el worker no tiene le pasa la conexión al coordinador junto
+# con su estado (protocolo negociado, perfil y los bytes ya leídos sin
+# procesar); el coordinador la manda al dueño, que sigue atendiéndola.
+#
+# Los workers no abren diario, no comparten archivo de partidas y no pueden
+# tener procesos propios (bots, análisis): start_workers rechaza journal_dir,
+# archive_path, bot_wait y analysis.
+#
+# Con --metricas PUERTO cada worker expone /metrics en PUERTO+id (etiqueta
+# worker="<id>"); el coordinador solo imprime el resumen agregado.
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import multiprocessing
+import os
+import secrets
+import selectors
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from limitador import ACCIONES, DEMORAR, LIMITE_CONEXION
+from registro import configure
+from servidor_multisala import ClientHandler, OthelloServerMultiRoom, log, raise_file_limit
+from sesiones import SessionTokens
+
+MAX_CONTROL = 65536  # Tamaño máximo de un mensaje de control
+STATS_INTERVAL = 30
+
+
+def send_control(sock, message, fds=()):
+    """Envía un mensaje de control (y descriptores) por el socketpair"""
+    data = json.dumps(message).encode('utf-8')
+    if fds:
+        socket.send_fds(sock, [data], list(fds))
+    else:
+        sock.send(data)
+
+
+def recv_control(sock):
+    """Recibe un mensaje de control; retorna (mensaje, fds) o (None, []) si se cerró"""
+    data, fds, _, _ = socket.recv_fds(sock, MAX_CONTROL, 1)
+    if not data:
+        return None, fds
+    return json.loads(data), fds
+
+
+def reuseport_socket(host, port, backlog):
+    """Socket de escucha compartible entre procesos con SO_REUSEPORT"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class OthelloWorker(OthelloServerMultiRoom):
+    """Un worker: salas locales, emparejamiento a través del coordinador"""
+
+    def __init__(self, worker_id, link, session_secret=None, **kwargs):
+        super().__init__(**kwargs)
+        self.worker_id = worker_id
+        self.link = link  # Socket hacia el coordinador
+        if session_secret:
+            # El mismo secreto en todos los workers: cualquiera verifica un token
+            self.sessions = SessionTokens(session_secret)
+        self.listen_socket = None
+        self.accept_task = None
+        self.tickets = itertools.count()
+        self.pending = {}  # {ticket: Future con la respuesta del coordinador}
+        self.migrated_out = 0
+        self.migrated_in = 0
+
+    def notify(self, message, fds=()):
+        """Envía un mensaje al coordinador"""
+        try:
+            send_control(self.link, message, fds)
+        except OSError as e:
+            log.error('coordinator_link_error', error=repr(e))
+
+    async def serve(self):
+        """Acepta conexiones del puerto compartido hasta que se llame a stop()"""
+        raise_file_limit()
+        loop = asyncio.get_running_loop()
+        self.listen_socket = reuseport_socket(self.host, self.port, self.backlog)
+        loop.add_reader(self.link.fileno(), self.on_control)
+        self.running = True
+        self.accept_task = asyncio.current_task()
+        self.stats_task = asyncio.create_task(self.report_stats())
+        log.info('worker_started', pid=os.getpid(), host=self.host, port=self.port)
+        self.timer_task = asyncio.create_task(self.run_timers())
+        await self.start_metrics()
+
+        try:
+            while self.running:
+                sock, _ = await loop.sock_accept(self.listen_socket)
+                asyncio.create_task(self.place(sock))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.remove_reader(self.link.fileno())
+            self.listen_socket.close()
+            self.stop()
+
+    def on_control(self):
+        """Mensajes del coordinador (se llama cuando el socketpair tiene datos)"""
+        message, fds = recv_control(self.link)
+        if message is None:
+            log.warning('coordinator_gone')
+            self.accept_task.cancel()
+            return
+
+        op = message['op']
+        if op in ('wait', 'join'):
+            if op == 'wait':
+                # Reservar la sala ya: otro jugador puede llegar antes que el primero
+                room = self.reserve_room(message['room_id'], message['pool'])
+            future = self.pending.pop(message['ticket'], None)
+            if future and not future.done():
+                future.set_result(message)
+            elif op == 'wait':
+                self.discard_if_empty(room)
+        elif op == 'adopt':
+            sock = socket.socket(fileno=fds[0])
+            self.migrated_in += 1
+            if 'state' in message:
+                asyncio.create_task(self.attach_resumed(sock, message['state']))
+            else:
+                asyncio.create_task(self.attach(sock, message['room_id']))
+
+    def reserve_room(self, room_id, pool):
+        """Abre una sala vacía que el coordinador ya anunció como esperando"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            # Como una sala local: registro en el diario y espera del bot
+            room = self.open_room(room_id)
+            room.pool = pool
+        return room
+
+    def discard_if_empty(self, room):
+        """Elimina una sala reservada que se quedó sin jugadores"""
+        if room.is_empty() and self.rooms.get(room.room_id) is room:
+            self.delete_room(room)
+
+    async def place(self, sock):
+        """Empareja una conexión nueva preguntando al coordinador"""
+        ticket = next(self.tickets)
+        future = self.pending[ticket] = asyncio.get_running_loop().create_future()
+        # Las conexiones nuevas aún no mandaron 'join': su pool sale de un perfil vacío
+        pool = self.matchmaker.pool_key(SimpleNamespace(profile={}))
+        self.notify({'op': 'match', 'pool': pool, 'ticket': ticket})
+        reply = await future
+
+        if reply['op'] == 'join' and reply['worker'] != self.worker_id:
+            # El oponente está en otro worker: pasarle el socket (todavía sin leer)
+            self.notify({'op': 'handoff', 'room_id': reply['room_id'], 'worker': reply['worker']},
+                        fds=[sock.fileno()])
+            sock.close()
+            self.migrated_out += 1
+            return
+
+        await self.attach(sock, reply['room_id'])
+
+    async def attach(self, sock, room_id):
+        """Crea el ClientHandler de un socket y lo sienta en la sala room_id"""
+        try:
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except OSError as e:
+            log.warning('attach_failed', room_id, error=repr(e))
+            sock.close()
+            room = self.rooms.get(room_id)
+            if room:
+                self.discard_if_empty(room)
+            return
+
+        start = time.perf_counter()
+        client_handler = ClientHandler(reader, writer, self)
+        self.register(client_handler)
+
+        room = self.rooms.get(room_id)
+        if room and not room.started and not room.is_full():
+            self.matchmaker.remove(room)
+            self.join_room(room, client_handler)
+        else:
+            # La sala desapareció mientras tanto (su jugador se fue)
+            self.match_player(client_handler)
+        self.metrics.accept_seconds.observe(time.perf_counter() - start)
+
+        await client_handler.receive_messages()
+
+    async def attach_resumed(self, sock, state):
+        """Conexión que otro worker traspasó con un 'resume' de una sala de este"""
+        try:
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except OSError as e:
+            log.warning('attach_failed', error=repr(e))
+            sock.close()
+            return
+
+        client_handler = ClientHandler(reader, writer, self)
+        client_handler.binary = client_handler.frame_reader.binary = state['binary']
+        client_handler.features = set(state['features'])
+        client_handler.heartbeat = state['heartbeat']
+        client_handler.profile = state['profile']
+        client_handler.connected_at = None  # Ya mandó su hello al otro worker
+        self.register(client_handler)
+
+        message = state['message']
+        super().resume(client_handler, message['session'], message['seq'])
+        if client_handler.room is None and client_handler.spectating is None:
+            # resume_failed: el otro worker ya le sacó el asiento provisional
+            self.match_player(client_handler)
+
+        # Lo que el cliente mandó después del resume y el otro worker ya había leído
+        client_handler.frame_reader.feed(base64.b64decode(state['unread']))
+        while client_handler.active:
+            try:
+                message = client_handler.frame_reader.next_message()
+            except ValueError as e:
+                log.warning('decode_error', client=client_handler.peer, error=str(e))
+                continue
+            if message is None:
+                break
+            client_handler.handle_message(message)
+
+        await client_handler.receive_messages()
+
+    def resume(self, client_handler, token, seq=None):
+        """Un 'resume' de una sala de otro worker se atiende allá: se le pasa la conexión"""
+        seat = self.sessions.verify(token)
+        if seat is None or seat[0] in self.rooms:
+            super().resume(client_handler, token, seq)
+            return
+
+        self.leave_seat(client_handler, forfeit=True)
+        if client_handler.spectating:
+            client_handler.spectating.remove_spectator(client_handler)
+        # No leer más: lo que ya llegó se manda con la conexión
+        client_handler.writer.transport.pause_reading()
+        client_handler.disconnect(close=False)
+        asyncio.create_task(self.transfer(client_handler, seat[0],
+                                          {'type': 'resume', 'session': token, 'seq': seq}))
+
+    async def transfer(self, client_handler, room_id, message):
+        """Pasa la conexión de un cliente que retoma su sesión al worker de room_id"""
+        reader, writer = client_handler.reader, client_handler.writer
+        try:
+            # Lo encolado (hello_ack, welcome provisional) sale antes que lo del otro worker
+            pending = client_handler.outbound.drain()
+            if pending:
+                writer.write(pending)
+            writer.transport.set_write_buffer_limits(0)
+            await writer.drain()
+
+            frame_reader = client_handler.frame_reader
+            reader.feed_eof()
+            unread = bytes(frame_reader.buffer[frame_reader.offset:]) + await reader.read()
+            state = {
+                'message': message,
+                'binary': client_handler.binary,
+                'features': sorted(client_handler.features),
+                'heartbeat': client_handler.heartbeat,
+                'profile': client_handler.profile,
+                'unread': base64.b64encode(unread).decode('ascii')
+            }
+            if len(unread) > MAX_CONTROL // 2:
+                raise ValueError(f"{len(unread)} bytes sin procesar")
+            fd = os.dup(writer.get_extra_info('socket').fileno())
+        except Exception as e:
+            log.warning('transfer_failed', room_id, client=client_handler.peer, error=repr(e))
+            client_handler.close()
+            return
+
+        try:
+            self.notify({'op': 'handoff', 'room_id': room_id, 'state': state}, fds=[fd])
+        finally:
+            os.close(fd)
+        client_handler.close()
+        self.migrated_out += 1
+        log.info('session_transferred', room_id, client=client_handler.peer)
+
+    def match_player(self, client_handler):
+        """Clientes que ya hablaron con este worker no se migran: esperan en una sala local"""
+        room = self.create_room(client_handler)
+        self.matchmaker.remove(room)  # La cola la lleva el coordinador
+        self.notify({'op': 'waiting', 'pool': room.pool, 'room_id': room.room_id})
+
+    def offer_bot(self, room):
+        super().offer_bot(room)
+        if room.started:
+            self.notify({'op': 'cancel', 'room_id': room.room_id})
+
+    def delete_room(self, room):
+        super().delete_room(room)
+        # El coordinador deja de esperarla y de rutear 'resume' hacia acá
+        self.notify({'op': 'closed', 'room_id': room.room_id})
+
+    async def report_stats(self):
+        """Manda estadísticas al coordinador periódicamente"""
+        while self.running:
+            await asyncio.sleep(STATS_INTERVAL / 3)
+            self.notify({
+                'op': 'stats',
+                'worker': self.worker_id,
+                'clients': len(self.clients),
+                'games': sum(1 for room in self.rooms.values() if room.started),
+                'rooms': len(self.rooms),
+                'migrated_in': self.migrated_in,
+                'migrated_out': self.migrated_out,
+            })
+
+
+class Coordinator:
+    """Emparejamiento global entre workers (corre en el proceso padre)"""
+
+    def __init__(self, links):
+        self.links = links  # {worker_id: socket}
+        self.selector = selectors.DefaultSelector()
+        self.waiting = {}  # {pool: OrderedDict{room_id: (worker_id, enqueued_at)}}
+        self.room_pool = {}  # {room_id: pool}
+        self.owners = {}  # {room_id: worker_id} de todas las salas vivas
+        self.worker_stats = {}
+        self.matched = 0
+        self.handoffs = 0
+        self.running = False
+
+    def run(self):
+        """Atiende a los workers hasta que todos terminen o Ctrl+C"""
+        for worker_id, link in self.links.items():
+            self.selector.register(link, selectors.EVENT_READ, worker_id)
+
+        self.running = True
+        next_stats = time.monotonic() + STATS_INTERVAL
+        while self.running and self.links:
+            for key, _ in self.selector.select(timeout=1.0):
+                self.handle(key.data, key.fileobj)
+            if time.monotonic() >= next_stats:
+                self.show_stats()
+                next_stats = time.monotonic() + STATS_INTERVAL
+
+    def handle(self, worker_id, link):
+        message, fds = recv_control(link)
+        if message is None:
+            log.warning('worker_exited', worker=worker_id)
+            self.selector.unregister(link)
+            link.close()
+            del self.links[worker_id]
+            self.forget_worker(worker_id)
+            return
+
+        op = message['op']
+        if op == 'match':
+            pool = message['pool']
+            queue = self.waiting.get(pool)
+            if queue:
+                room_id, (owner, _) = queue.popitem(last=False)
+                self.room_pool.pop(room_id, None)
+                self.matched += 1
+                send_control(link, {'op': 'join', 'ticket': message['ticket'],
+                                    'room_id': room_id, 'worker': owner})
+            else:
+                room_id = str(uuid.uuid4())
+                self.enqueue(pool, room_id, worker_id)
+                send_control(link, {'op': 'wait', 'ticket': message['ticket'],
+                                    'room_id': room_id, 'pool': pool})
+
+        elif op == 'waiting':
+            self.enqueue(message['pool'], message['room_id'], worker_id)
+
+        elif op in ('cancel', 'closed'):
+            pool = self.room_pool.pop(message['room_id'], None)
+            if pool is not None:
+                self.waiting[pool].pop(message['room_id'], None)
+            if op == 'closed':
+                self.owners.pop(message['room_id'], None)
+
+        elif op == 'handoff':
+            adopt = {'op': 'adopt', 'room_id': message['room_id']}
+            if 'state' in message:
+                adopt['state'] = message['state']
+                target = self.links.get(self.owners.get(message['room_id']))
+                if target is None:
+                    # La sala ya no existe: vuelve a su worker, que responde resume_failed
+                    target = link
+            else:
+                target = self.links.get(message['worker'])
+            try:
+                if target is not None:
+                    send_control(target, adopt, fds)
+                    self.handoffs += 1
+            finally:
+                for fd in fds:
+                    os.close(fd)
+
+        elif op == 'stats':
+            self.worker_stats[worker_id] = message
+
+    def enqueue(self, pool, room_id, worker_id):
+        self.waiting.setdefault(pool, OrderedDict())[room_id] = (worker_id, time.monotonic())
+        self.room_pool[room_id] = pool
+        self.owners[room_id] = worker_id
+
+    def forget_worker(self, worker_id):
+        """Quita de la cola las salas de un worker que terminó"""
+        self.worker_stats.pop(worker_id, None)
+        for room_id in [r for r, owner in self.owners.items() if owner == worker_id]:
+            del self.owners[room_id]
+        for queue in self.waiting.values():
+            for room_id in [r for r, (owner, _) in queue.items() if owner == worker_id]:
+                del queue[room_id]
+                self.room_pool.pop(room_id, None)
+
+    def show_stats(self):
+        """Estadísticas agregadas de todos los workers"""
+        def total(key):
+            return sum(stats.get(key, 0) for stats in self.worker_stats.values())
+
+        log.info('cluster_stats', workers=len(self.links), clients=total('clients'),
+                 games=total('games'), rooms=total('rooms'),
+                 waiting=sum(len(queue) for queue in self.waiting.values()),
+                 matched=self.matched, handoffs=self.handoffs,
+                 per_worker={worker_id: {'clients': stats['clients'], 'games': stats['games']}
+                             for worker_id, stats in sorted(self.worker_stats.items())})
+
+
+def run_worker(worker_id, link, host, port, backlog, server_options, metrics_port=None, session_secret=None):
+    """Punto de entrada de cada proceso worker"""
+    configure(fields={'worker': worker_id})
+    # Cada worker expone sus métricas en su propio puerto, etiquetadas con su id
+    if metrics_port is not None:
+        server_options = dict(server_options, metrics_port=metrics_port + worker_id,
+                              metrics_labels={'worker': str(worker_id)})
+    worker = OthelloWorker(worker_id, link, session_secret, host=host, port=port, backlog=backlog,
+                           **server_options)
+    worker.start()
+
+
+def start_workers(workers, host='0.0.0.0', port=5555, backlog=1024, metrics_port=None, **server_options):
+    """Arranca los workers y corre el coordinador en este proceso (bloquea)"""
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise RuntimeError("Este sistema no soporta SO_REUSEPORT; usa servidor_multisala.py")
+    # Cada worker escribiría su propio diario sin recuperarlo y todos al mismo
+    # archivo; y un worker (proceso daemon) no puede tener procesos de bots o análisis
+    for option in ('journal_dir', 'archive_path', 'bot_wait', 'analysis'):
+        if server_options.get(option) is not None:
+            raise ValueError(f"{option} no está soportado con varios workers; usa servidor_multisala.py")
+
+    # 'spawn': cada worker recibe solo su extremo del socketpair (con fork
+    # heredaría también los del coordinador y no vería cuando este termina)
+    context = multiprocessing.get_context('spawn')
+    session_secret = secrets.token_bytes(32)  # Compartido: un token vale en cualquier worker
+    links = {}
+    processes = []
+    for worker_id in range(workers):
+        parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = context.Process(
+            target=run_worker,
+            args=(worker_id, child_end, host, port, backlog, server_options, metrics_port, session_secret),
+            daemon=True
+        )
+        process.start()
+        child_end.close()
+        links[worker_id] = parent_end
+        processes.append(process)
+
+    log.info('cluster_started', workers=workers, host=host, port=port, metrics_port=metrics_port)
+
+    coordinator = Coordinator(links)
+    try:
+        coordinator.run()
+    except KeyboardInterrupt:
+        log.info('cluster_interrupted')
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=5)
+        log.info('cluster_stopped')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor Othello multi-sala en varios procesos")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="procesos worker (por defecto, uno por núcleo)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--contrapresion', choices=['resync', 'disconnect'], default='resync',
+                        help="qué hacer con clientes que no leen a tiempo")
+    parser.add_argument('--metricas', type=int, metavar='PUERTO',
+                        help="exponer /metrics: el worker N escucha en PUERTO+N")
+    parser.add_argument('--tiempo-turno', type=float, metavar='SEG',
+                        help="segundos por turno; quien no mueve a tiempo pierde")
+    parser.add_argument('--handshake', type=float, metavar='SEG',
+                        help="cerrar conexiones que no mandan ningún mensaje en SEG segundos")
+    parser.add_argument('--limite', type=float, default=LIMITE_CONEXION[0], metavar='MSG/S',
+                        help="mensajes por segundo por conexión (ráfaga del doble, 0 = sin límite)")
+    parser.add_argument('--accion-limite', choices=ACCIONES, default=DEMORAR,
+                        help="qué hacer con los mensajes que exceden el límite")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start_workers(args.workers, args.host, args.port, args.backlog, metrics_port=args.metricas,
+                  backpressure=args.contrapresion, move_timeout=args.tiempo_turno,
+                  handshake_timeout=args.handshake,
+                  rate_limit=(args.limite, 2 * args.limite) if args.limite else None,
+                  rate_action=args.accion_limite)
@@ -1,15 +1,37 @@
-import socket
-import json
-import threading
+import asyncio
+import os
 import time
 import numpy as np
 import uuid
 
+from analisis import AnalysisBusy, AnalysisService
+from archivo_partidas import GameArchive, FLAG_ABANDONED
+from bots import BotPool
+from diario import Journal, room_state
+from cola_salida import OutboundQueue, POLITICA_RESYNC, POLITICAS, MAX_MENSAJES, MAX_BYTES
+from emparejamiento import Matchmaker
+from limitador import DEMORAR, LIMITE_CONEXION, LIMITE_IP, RateLimited, RateLimiter
+from metricas import MetricsServer, ServerMetrics
+from protocolo import FEATURES, crear_delta, quiere_delta
+from protocolo_binario import FrameReader, FrameTooLarge, SharedMessage, encode
+from registro import get_logger
+from sesiones import GRACIA_SESION, MoveHistory, SessionTokens
+from temporizador import INACTIVIDAD, PING_INTERVALO, TimerWheel
+
+log = get_logger()
+
+# El heartbeat (ping/pong, ver temporizador.py) solo lo implementa este servidor
+FEATURES = FEATURES + ['heartbeat']
+
 class OthelloGame:
     def __init__(self):
         self.board = np.zeros((8, 8), dtype=int)
         self.current_player = 1  # 1 = Negro, 2 = Blanco
         self.game_over = False
+        self.seq = 0  # Movimientos aceptados (número de secuencia de las actualizaciones)
+        self.last_flips = []  # Fichas volteadas por el último movimiento
+        self.moves = []  # Casillas jugadas (fila * 8 + columna), para el archivo de partidas
+        self.cache = {}  # Datos derivados del tablero en esta jugada (ver invalidate_cache)
 
         # Configuración inicial
         self.board[3][3] = 2
@@ -17,13 +39,20 @@ class OthelloGame:
         self.board[3][4] = 1
         self.board[4][3] = 1
 
+    def invalidate_cache(self):
+        """Descarta los datos derivados (make_move lo llama al cambiar el tablero)"""
+        self.cache.clear()
+
     def get_valid_moves(self, player):
-        """Obtiene todos los movimientos válidos para un jugador"""
-        valid_moves = []
-        for row in range(8):
-            for col in range(8):
-                if self.is_valid_move(row, col, player):
-                    valid_moves.append([row, col])
+        """Obtiene todos los movimientos válidos para un jugador (se calcula una vez por jugada)"""
+        valid_moves = self.cache.get(('moves', player))
+        if valid_moves is None:
+            valid_moves = []
+            for row in range(8):
+                for col in range(8):
+                    if self.is_valid_move(row, col, player):
+                        valid_moves.append([row, col])
+            self.cache[('moves', player)] = valid_moves
         return valid_moves
 
     def is_valid_move(self, row, col, player):
@@ -62,14 +91,18 @@ class OthelloGame:
             return False
 
         self.board[row][col] = player
+        self.invalidate_cache()
         opponent = 3 - player
         directions = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
                       (0, 1), (1, -1), (1, 0), (1, 1)]
+        self.last_flips = []
 
         for dr, dc in directions:
             if self.check_direction(row, col, dr, dc, player, opponent):
                 self.flip_pieces(row, col, dr, dc, player, opponent)
 
+        self.moves.append(row * 8 + col)
+        self.seq += 1
         return True
 
     def flip_pieces(self, row, col, dr, dc, player, opponent):
@@ -83,6 +116,7 @@ class OthelloGame:
             elif self.board[r][c] == player:
                 for fr, fc in pieces_to_flip:
                     self.board[fr][fc] = player
+                    self.last_flips.append([fr, fc])
                 break
             else:
                 break
@@ -90,17 +124,21 @@ class OthelloGame:
             c += dc
 
     def get_scores(self):
-        """Calcula el puntaje actual"""
-        black = np.sum(self.board == 1)
-        white = np.sum(self.board == 2)
-        return {'black': int(black), 'white': int(white)}
+        """Calcula el puntaje actual (una vez por jugada)"""
+        scores = self.cache.get('scores')
+        if scores is None:
+            black = np.sum(self.board == 1)
+            white = np.sum(self.board == 2)
+            scores = self.cache['scores'] = {'black': int(black), 'white': int(white)}
+        return scores
+
+    def is_terminal(self):
+        """Ningún jugador puede mover"""
+        return not self.get_valid_moves(1) and not self.get_valid_moves(2)
 
     def check_game_over(self):
         """Verifica si el juego ha terminado"""
-        valid_moves_p1 = self.get_valid_moves(1)
-        valid_moves_p2 = self.get_valid_moves(2)
-
-        if len(valid_moves_p1) == 0 and len(valid_moves_p2) == 0:
+        if self.is_terminal():
             self.game_over = True
             return True
         return False
@@ -112,17 +150,85 @@ class OthelloGame:
             'current_player': self.current_player,
             'valid_moves': self.get_valid_moves(self.current_player),
             'game_over': self.game_over,
-            'scores': self.get_scores()
+            'scores': self.get_scores(),
+            'seq': self.seq
         }
 
 
 class GameRoom:
-    """Representa una sala de juego con 2 jugadores"""
-    def __init__(self, room_id):
+    """Representa una sala de juego con 2 jugadores y cualquier número de espectadores.
+
+    Cada sala es un actor: los movimientos llegan a su propia cola y una
+    única tarea los procesa en orden, así que self.game solo se modifica
+    desde esa tarea y las salas no se bloquean entre sí.
+
+    Los espectadores reciben lo mismo que los jugadores a través de sus
+    propias colas de salida: uno lento se resincroniza o se desconecta
+    (política de contrapresión) sin frenar la partida.
+    """
+    MAX_PENDING = 32  # Mensajes encolados por sala antes de rechazar
+
+    def __init__(self, room_id, metrics=None):
         self.room_id = room_id
+        self.metrics = metrics or ServerMetrics()  # Las del servidor (o propias, si la sala va suelta)
         self.game = OthelloGame()
         self.players = []  # Máximo 2 jugadores
+        self.spectators = set()  # ClientHandler de solo lectura
         self.started = False
+        self.pool = None  # Pool de emparejamiento mientras espera oponente
+        self.inbox = None  # asyncio.Queue, se crea con la tarea de la sala
+        self.task = None
+        self.latest_snapshot = None  # SharedMessage con el último estado completo
+        self.history = MoveHistory()  # Últimos deltas, para quien retoma su sesión
+        self.away = {}  # {color: TimerHandle} asientos guardados a jugadores desconectados
+        self.journal = None  # Journal del servidor (si está activado)
+        self.recovered = False  # Restaurada del diario, esperando a sus jugadores
+        self.archive = None  # GameArchive del servidor (si está activado)
+        self.archived = False
+        self.timers = None  # TimerWheel del servidor
+        self.move_timeout = None  # Segundos por turno (None = sin límite)
+        self.turn_timer = None
+
+    def submit(self, client_handler, message):
+        """Encola un mensaje para la tarea de la sala (no bloquea)"""
+        if self.task is None:
+            self.inbox = asyncio.Queue(maxsize=self.MAX_PENDING)
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        try:
+            self.inbox.put_nowait((client_handler, message))
+        except asyncio.QueueFull:
+            if client_handler is None:
+                return
+            client_handler.send_message({
+                'type': 'move_response',
+                'success': False,
+                'message': 'Demasiados mensajes pendientes'
+            })
+
+    async def run(self):
+        """Procesa los mensajes de la sala uno a la vez, en orden de llegada"""
+        while True:
+            client_handler, message = await self.inbox.get()
+            try:
+                msg_type = message.get('type')
+                if msg_type == 'move':
+                    self.handle_move(client_handler, message.get('row'), message.get('col'))
+                elif msg_type == 'sync':
+                    self.send_snapshot(client_handler)
+                elif msg_type == 'turn_timeout':
+                    self.turn_expired(message['seq'])
+                elif msg_type == 'forfeit':
+                    self.forfeit(message['player'])
+            except Exception as e:
+                log.error('room_message_error', self.room_id, error=repr(e))
+
+    def close(self):
+        """Detiene la tarea de la sala"""
+        if self.turn_timer:
+            self.turn_timer.cancel()
+        if self.task:
+            self.task.cancel()
+            self.task = None
 
     def add_player(self, client_handler):
         """Agrega un jugador a la sala"""
@@ -141,10 +247,50 @@ class GameRoom:
             return True
         return False
 
+    def reseat(self, client_handler, color):
+        """Devuelve su asiento a un jugador que retomó la sesión"""
+        handle = self.away.pop(color, None)
+        if handle:
+            handle.cancel()
+        client_handler.room = self
+        client_handler.player_color = color
+        self.players.append(client_handler)
+        self.players.sort(key=lambda player: player.player_color)
+        self.arm_turn_timer()
+
+    def catch_up(self, client_handler, seq):
+        """Manda solo lo que el cliente no vio desde seq (deltas o un estado completo)"""
+        if not quiere_delta(client_handler.features):
+            missed = [] if seq == self.game.seq else None
+        else:
+            missed = self.history.since(seq, self.game.seq)
+        if missed is None:
+            client_handler.send_message(self.snapshot())
+        for message in missed or ():
+            client_handler.send_message(message)
+
     def is_full(self):
         """Verifica si la sala está llena"""
         return len(self.players) >= 2
 
+    def add_spectator(self, client_handler):
+        """Agrega un espectador: recibe el estado actual (cacheado) y luego los deltas"""
+        self.spectators.add(client_handler)
+        client_handler.spectating = self
+        client_handler.send_message({
+            'type': 'spectating',
+            'room_id': self.room_id,
+            'message': 'Observando la partida',
+            'features': FEATURES
+        })
+        if self.started:
+            client_handler.send_message(self.snapshot())
+
+    def remove_spectator(self, client_handler):
+        """Quita un espectador de la sala"""
+        self.spectators.discard(client_handler)
+        client_handler.spectating = None
+
     def is_empty(self):
         """Verifica si la sala está vacía"""
         return len(self.players) == 0
@@ -153,32 +299,149 @@ class GameRoom:
         """Inicia el juego en esta sala"""
         if len(self.players) == 2 and not self.started:
             self.started = True
-            game_start_msg = {
+            self.metrics.games_started.inc()
+            game_start_msg = SharedMessage({
                 'type': 'game_start',
                 'message': '¡Juego iniciado!',
                 'game_state': self.game.get_game_state()
-            }
+            })
 
-            for player in self.players:
-                player.send_message(game_start_msg)
+            for client in self.audience():
+                client.send_message(game_start_msg)
 
-            print(f"🎮 Sala {self.room_id[:8]} - Juego iniciado")
+            self.arm_turn_timer()
+            log.info('game_started', self.room_id)
             return True
         return False
 
-    def broadcast(self, message, exclude=None):
-        """Envía un mensaje a todos los jugadores de la sala"""
-        for player in self.players:
+    def audience(self):
+        """Jugadores y espectadores (copia: un cliente atrasado puede desconectarse al enviarle)"""
+        return self.players + list(self.spectators)
+
+    def broadcast(self, message, exclude=None, spectators=False):
+        """Envía un mensaje a los jugadores de la sala (y espectadores); se codifica una vez"""
+        if not isinstance(message, SharedMessage):
+            message = SharedMessage(message)
+        for player in (self.audience() if spectators else list(self.players)):
             if player != exclude:
                 player.send_message(message)
 
+    def broadcast_update(self, player_color, row, col):
+        """Envía el movimiento: delta a quien lo pidió, estado completo al resto"""
+        start = time.perf_counter()
+        delta_msg = SharedMessage(crear_delta(self.game, player_color, row, col))
+        self.history.append(self.game.seq, delta_msg)
+        for player in self.audience():
+            if quiere_delta(player.features):
+                player.send_message(delta_msg)
+            else:
+                player.send_message(self.snapshot())
+        self.metrics.broadcast_seconds.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        """Estado completo de la partida, construido y codificado una vez por movimiento.
+
+        Lo reciben los clientes sin deltas, quien pide 'sync' y los clientes
+        resincronizados por contrapresión.
+        """
+        snapshot = self.latest_snapshot
+        if snapshot is None or snapshot.message['game_state']['seq'] != self.game.seq:
+            snapshot = self.latest_snapshot = SharedMessage({
+                'type': 'game_update',
+                'game_state': self.game.get_game_state()
+            })
+        return snapshot
+
+    def arm_turn_timer(self):
+        """(Re)inicia el reloj del turno actual"""
+        if self.turn_timer:
+            self.turn_timer.cancel()
+            self.turn_timer = None
+        if self.move_timeout and self.timers and self.started and not self.game.game_over:
+            # El vencimiento pasa por la cola de la sala: self.game solo se toca desde su tarea
+            self.turn_timer = self.timers.schedule(
+                self.move_timeout, self.submit, None, {'type': 'turn_timeout', 'seq': self.game.seq})
+
+    def turn_expired(self, seq):
+        """Venció el turno: quien debía mover pierde la partida"""
+        if self.game.game_over or seq != self.game.seq:
+            return  # Se movió mientras el vencimiento esperaba en la cola
+        color = self.game.current_player
+        if color in self.away:
+            return  # Está desconectado: decide el período de gracia de su asiento
+        self.game.game_over = True
+        self.game.winner = 3 - color
+        self.game.seq += 1  # Quien retome recibe el estado completo
+        self.metrics.move_timeouts.inc()
+        log.info('move_timeout', self.room_id, player=color)
+        if self.journal:
+            self.journal.room_closed(self.room_id)
+        self.archive_game(FLAG_ABANDONED)
+        self.broadcast({
+            'type': 'move_timeout',
+            'player_color': color,
+            'winner': 3 - color,
+            'message': f'Se acabó el tiempo del jugador {"Negro" if color == 1 else "Blanco"}'
+        }, spectators=True)
+        self.broadcast(self.snapshot(), spectators=True)
+
+    def forfeit(self, color):
+        """Un jugador dejó su partida en curso (retomó otra sesión): pierde"""
+        if self.game.game_over:
+            return
+        self.game.game_over = True
+        self.game.winner = 3 - color
+        self.game.seq += 1  # Quien retome recibe el estado completo
+        if self.turn_timer:
+            self.turn_timer.cancel()
+            self.turn_timer = None
+        log.info('game_forfeited', self.room_id, player=color)
+        if self.journal:
+            self.journal.room_closed(self.room_id)
+        self.archive_game(FLAG_ABANDONED)
+        self.broadcast({
+            'type': 'opponent_disconnected',
+            'winner': 3 - color,
+            'message': 'Tu oponente abandonó la partida'
+        })
+        for spectator in list(self.spectators):
+            spectator.send_message({
+                'type': 'player_disconnected',
+                'player_color': color,
+                'message': 'Un jugador abandonó la partida'
+            })
+        self.broadcast(self.snapshot(), spectators=True)
+
+    def archive_game(self, flags=None):
+        """Guarda la partida en el archivo (una sola vez)"""
+        if self.archive and self.started and self.game.moves and not self.archived:
+            self.archived = True
+            if flags is None:
+                self.archive.append(self.room_id, self.game)
+            else:
+                self.archive.append(self.room_id, self.game, flags)
+
+    def send_snapshot(self, client_handler):
+        """Envía el estado completo a un jugador (tras un hueco en los deltas)"""
+        if self.started:
+            client_handler.send_message(self.snapshot())
+
     def handle_move(self, client_handler, row, col):
         """Procesa un movimiento en esta sala"""
-        if not self.started:
+        # El jugador pudo desconectarse mientras su movimiento estaba en cola
+        if not self.started or client_handler not in self.players:
+            return False
+        if self.game.game_over:
+            client_handler.send_message({
+                'type': 'move_response',
+                'success': False,
+                'message': 'La partida terminó'
+            })
             return False
 
         # Verificar turno
         if client_handler.player_color != self.game.current_player:
+            self.metrics.moves_rejected.inc()
             response = {
                 'type': 'move_response',
                 'success': False,
@@ -187,30 +450,36 @@ class GameRoom:
             client_handler.send_message(response)
             return False
 
-        # Intentar hacer el movimiento
-        if self.game.make_move(row, col, client_handler.player_color):
-            print(f"✅ Sala {self.room_id[:8]} - Jugador {client_handler.player_color} jugó en ({row}, {col})")
+        # Intentar hacer el movimiento (coordenadas fuera del tablero son inválidas)
+        start = time.perf_counter()
+        on_board = isinstance(row, int) and isinstance(col, int) and 0 <= row < 8 and 0 <= col < 8
+        if on_board and self.game.make_move(row, col, client_handler.player_color):
+            log.debug('move', self.room_id, player=client_handler.player_color, row=row, col=col,
+                      seq=self.game.seq)
 
             # Cambiar turno
             self.game.current_player = 3 - self.game.current_player
 
-            # Verificar si hay movimientos válidos
+            # Verificar si hay movimientos válidos (memorizados para get_game_state)
             valid_moves = self.game.get_valid_moves(self.game.current_player)
             if len(valid_moves) == 0:
-                print(f"⚠️ Sala {self.room_id[:8]} - Jugador {self.game.current_player} sin movimientos, pasando turno")
+                log.debug('turn_passed', self.room_id, player=self.game.current_player)
                 self.game.current_player = 3 - self.game.current_player
                 valid_moves = self.game.get_valid_moves(self.game.current_player)
                 if len(valid_moves) == 0:
-                    print(f"🏁 Sala {self.room_id[:8]} - ¡Juego terminado!")
+                    log.info('game_over', self.room_id, **self.game.get_scores())
                     self.game.game_over = True
+                    self.metrics.games_finished.inc()
+                    self.archive_game()
+            self.metrics.move_seconds.observe(time.perf_counter() - start)
+            self.metrics.moves.inc()
 
-            # Enviar actualización a ambos jugadores
-            update_msg = {
-                'type': 'game_update',
-                'game_state': self.game.get_game_state()
-            }
+            if self.journal:
+                self.journal.move(self.room_id, client_handler.player_color, row, col, self.game)
+            self.arm_turn_timer()
 
-            self.broadcast(update_msg)
+            # Enviar actualización a ambos jugadores
+            self.broadcast_update(client_handler.player_color, row, col)
 
             # Respuesta al cliente que hizo el movimiento
             response = {
@@ -221,6 +490,8 @@ class GameRoom:
             client_handler.send_message(response)
             return True
         else:
+            self.metrics.move_seconds.observe(time.perf_counter() - start)
+            self.metrics.moves_rejected.inc()
             response = {
                 'type': 'move_response',
                 'success': False,
@@ -231,47 +502,127 @@ class GameRoom:
 
 
 class ClientHandler:
-    def __init__(self, socket, address, server):
-        self.socket = socket
-        self.address = address
+    """Conexión TCP (JSON por líneas o marcos binarios) de un jugador o espectador.
+
+    El transporte queda en encode, write_messages, receive_messages y
+    close: WebServidor.py los redefine para WebSocket y todo lo demás (salas,
+    sesiones, heartbeat, límites) se comparte.
+    """
+    transport = 'tcp'
+
+    def __init__(self, reader, writer, server, address=None):
+        self.reader = reader
+        self.writer = writer
+        self.address = address or writer.get_extra_info('peername')
+        self.peer = ':'.join(map(str, self.address[:2])) if self.address else '?'
         self.server = server
         self.player_color = None
         self.room = None
+        self.spectating = None  # Sala que observa (rol de espectador)
         self.active = True
+        self.profile = {}  # Datos opcionales del 'join' (name, kind, rating, pool)
+        self.features = set()  # Características pedidas en 'hello' (p. ej. 'delta')
+        self.binary = False  # Protocolo binario negociado
+        # Límite de mensajes (por conexión y por IP), aplicado antes de decodificar
+        self.limit = server.limiter.connection(self.address[0] if self.address else '?') \
+            if server.limiter else None
+        self.frame_reader = FrameReader(limit=self.limit)
+        self.outbound = OutboundQueue(server.max_outbound_messages, server.max_outbound_bytes)
+        self.outbound_ready = asyncio.Event()
+        self.writer_task = None
+        self.metrics = server.metrics
+        self.connected_at = self.last_seen = server.timers.now()  # last_seen: último dato recibido
+        self.heartbeat = False  # Contesta pings: se desconecta si se queda en silencio
+        self.idle_timer = None
 
     def send_message(self, message):
-        """Envía un mensaje JSON al cliente"""
+        """Encola un mensaje para el escritor de la conexión (no bloquea)"""
+        if not self.active:
+            return False
+        if not self.outbound.push(self.encode(message)):
+            return self.handle_backpressure()
+        self.outbound_ready.set()
+        return True
+
+    def encode(self, message):
+        """Bytes del mensaje para este socket según el protocolo negociado"""
+        return encode(message, self.binary)
+
+    def handle_backpressure(self):
+        """El cliente no lee a tiempo: resincronizar con el estado completo o desconectar"""
+        room = self.room or self.spectating
+        if self.server.backpressure == POLITICA_RESYNC and room and room.started:
+            self.outbound.clear()
+            if self.outbound.push(self.encode(room.snapshot())):
+                self.metrics.resyncs.inc()
+                self.outbound_ready.set()
+                log.warning('backpressure_resync', room.room_id, client=self.peer)
+                return False
+
+        log.warning('backpressure_disconnect', client=self.peer, pending=len(self.outbound))
+        self.metrics.backpressure_disconnects.inc()
+        self.disconnect()
+        return False
+
+    async def write_messages(self):
+        """Escribe lo encolado: todos los mensajes pendientes en una sola escritura"""
         try:
-            message_str = json.dumps(message) + '\n'
-            self.socket.send(message_str.encode('utf-8'))
-            return True
+            while self.active:
+                await self.outbound_ready.wait()
+                self.outbound_ready.clear()
+                depth = len(self.outbound)
+                data = self.outbound.drain()
+                if data:
+                    self.metrics.queue_depth.observe(depth)
+                    self.metrics.bytes_out.inc(len(data))
+                    self.writer.write(data)
+                    # Mientras el socket no acepta más, los mensajes se acumulan
+                    # en self.outbound (acotada) y no en el transporte
+                    await self.writer.drain()
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
-            print(f"❌ Error enviando mensaje a {self.address}: {e}")
-            return False
+            log.error('send_error', client=self.peer, error=repr(e))
+            self.disconnect()
 
-    def receive_messages(self):
-        """Recibe mensajes del cliente"""
-        buffer = ""
+    async def receive_messages(self):
+        """Recibe mensajes del cliente hasta que cierre la conexión"""
         while self.active:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = await self.reader.read(4096)
                 if not data:
-                    print(f"📭 Cliente {self.address} cerró conexión")
+                    log.info('client_closed', client=self.peer)
                     break
 
-                buffer += data
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    if message_str.strip():
-                        try:
-                            message = json.loads(message_str)
-                            self.handle_message(message)
-                        except json.JSONDecodeError as e:
-                            print(f"❌ Error decodificando JSON: {e}")
-            except socket.timeout:
-                continue
+                self.metrics.bytes_in.inc(len(data))
+                self.last_seen = self.server.timers.now()
+                self.frame_reader.feed(data)
+                while self.active:
+                    try:
+                        message = self.frame_reader.next_message()
+                    except FrameTooLarge:
+                        raise  # No se puede resincronizar el flujo: cerrar la conexión
+                    except ValueError as e:
+                        log.warning('decode_error', client=self.peer, error=str(e))
+                        continue
+                    if message is None:
+                        if self.frame_reader.throttled and self.active:
+                            # Sin fichas: no leer más de esta conexión hasta que se rellenen
+                            await asyncio.sleep(self.frame_reader.throttled)
+                            continue
+                        break
+                    self.handle_message(message)
+            except asyncio.CancelledError:
+                break
+            except RateLimited as e:
+                log.warning('rate_limited', client=self.peer, error=str(e))
+                break
+            except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError) as e:
+                # El cliente cortó sin cerrar: es normal (red móvil, pestaña cerrada)
+                log.info('client_closed', client=self.peer, error=repr(e))
+                break
             except Exception as e:
-                print(f"❌ Error recibiendo mensajes de {self.address}: {e}")
+                log.error('receive_error', client=self.peer, error=repr(e))
                 break
 
         self.disconnect()
@@ -281,191 +632,752 @@ class ClientHandler:
         msg_type = message.get('type')
 
         if msg_type == 'move':
-            row = message.get('row')
-            col = message.get('col')
             if self.room:
-                self.room.handle_move(self, row, col)
-
-    def disconnect(self):
-        """Desconecta al cliente"""
+                self.room.submit(self, message)
+            elif self.spectating:
+                self.send_message({
+                    'type': 'move_response',
+                    'success': False,
+                    'message': 'Los espectadores no pueden jugar'
+                })
+
+        elif msg_type == 'pong':
+            self.heartbeat = True
+
+        elif msg_type == 'ping':
+            self.send_message({'type': 'pong'})
+
+        elif msg_type == 'hello':
+            self.features = set(message.get('features', []))
+            self.heartbeat = self.heartbeat or 'heartbeat' in self.features
+            if 'binary' in self.features and not self.binary:
+                # Último mensaje en JSON; el cliente ya envía en binario desde su hello
+                self.send_message({'type': 'hello_ack', 'protocol': 'binary'})
+                self.binary = True
+                self.frame_reader.binary = True
+
+        elif msg_type == 'sync':
+            room = self.room or self.spectating
+            if room:
+                room.submit(self, message)
+
+        elif msg_type == 'resume':
+            self.server.resume(self, message.get('session'), message.get('seq'))
+
+        elif msg_type == 'spectate':
+            self.server.spectate(self, message.get('room_id'))
+
+        elif msg_type in ('hint', 'analyze'):
+            self.server.analyze(self, message)
+
+        elif msg_type == 'list_rooms':
+            self.send_message({'type': 'rooms', 'rooms': self.server.list_rooms()})
+
+        elif msg_type == 'join':
+            for key in ('name', 'kind', 'rating', 'pool'):
+                if key in message:
+                    self.profile[key] = message[key]
+            if 'bot' in message and self.server.bots:
+                self.choose_bot(message['bot'])
+            self.server.requeue(self)
+
+    def choose_bot(self, bot):
+        """'bot' del join: true (dificultad del servidor), false (sin bot) o una dificultad"""
+        budgets = self.server.bots.budgets
+        if bot is True:
+            bot = self.server.bots.difficulty
+        if bot is False or (isinstance(bot, str) and bot in budgets):
+            self.profile['bot'] = bot
+            return
+        self.send_message({
+            'type': 'error',
+            'message': f"'bot' debe ser true, false o una dificultad ({', '.join(sorted(budgets))})"
+        })
+
+    def disconnect(self, close=True):
+        """Desconecta al cliente (close=False deja el socket abierto para traspasarlo)"""
+        if not self.active:
+            return
         self.active = False
+        if self.idle_timer:
+            self.idle_timer.cancel()
+        if self.limit:
+            self.limit.release()
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        if close:
+            self.close()
+        self.server.remove_client(self)
+
+    def close(self):
+        """Cierra el transporte (receive_messages termina al notarlo)"""
         try:
-            self.socket.close()
-        except:
+            self.writer.close()
+        except Exception:
             pass
-        self.server.remove_client(self)
 
 
 class OthelloServerMultiRoom:
-    def __init__(self, host='0.0.0.0', port=5555):
+    """Servidor multi-sala sobre asyncio: un solo hilo atiende todas las conexiones.
+
+    Todo el estado (clientes, salas, partidas) se modifica desde el bucle de
+    eventos, así que no hace falta ningún lock.
+    """
+
+    def __init__(self, host='0.0.0.0', port=5555, backlog=1024, pool_key=None,
+                 backpressure=POLITICA_RESYNC, max_outbound_messages=MAX_MENSAJES,
+                 max_outbound_bytes=MAX_BYTES, journal_dir=None, snapshot_interval=60,
+                 recovery_grace=300, archive_path=None, resume_grace=GRACIA_SESION,
+                 metrics_port=None, metrics_labels=None, ping_interval=PING_INTERVALO,
+                 idle_timeout=INACTIVIDAD, handshake_timeout=None, move_timeout=None,
+                 rate_limit=LIMITE_CONEXION, ip_rate_limit=LIMITE_IP, rate_action=DEMORAR,
+                 bot_wait=None, bot_difficulty='medium', bot_options=None, analysis=None):
+        if backpressure not in POLITICAS:
+            raise ValueError(f"Política de contrapresión desconocida: {backpressure}")
         self.host = host
         self.port = port
-        self.server_socket = None
-        self.clients = []
+        self.backlog = backlog
+        self.backpressure = backpressure  # Qué hacer con clientes atrasados
+        self.max_outbound_messages = max_outbound_messages
+        self.max_outbound_bytes = max_outbound_bytes
+        self.server = None
+        self.clients = set()
         self.rooms = {}  # {room_id: GameRoom}
-        self.waiting_players = []  # Jugadores esperando emparejamiento
+        self.matchmaker = Matchmaker(pool_key)  # Salas esperando oponente (FIFO por pool)
         self.running = False
-        self.lock = threading.Lock()
+        self.journal_dir = journal_dir  # Directorio del diario (None = desactivado)
+        self.journal = None
+        self.snapshot_interval = snapshot_interval
+        self.recovery_grace = recovery_grace  # Segundos que se guardan las salas recuperadas
+        self.snapshot_task = None
+        self.archive = GameArchive(archive_path) if archive_path else None
+        self.resume_grace = resume_grace  # Segundos que se guarda el asiento de un desconectado
+        # Con diario el secreto persiste: los tokens sirven para las salas restauradas
+        self.sessions = SessionTokens.load(journal_dir) if journal_dir else SessionTokens()
+        # Una sola rueda para heartbeats, timeouts y asientos guardados
+        self.timers = TimerWheel(on_error=lambda e: log.error('timer_error', error=repr(e)))
+        self.timer_task = None
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout  # Silencio tolerado a clientes con heartbeat
+        self.handshake_timeout = handshake_timeout  # Hasta el primer mensaje (None = sin límite)
+        self.move_timeout = move_timeout  # Segundos por turno (None = sin límite)
+        # (mensajes por segundo, ráfaga) por conexión y por IP; rate_limit=None lo desactiva
+        self.limiter = RateLimiter(*rate_limit, *ip_rate_limit, action=rate_action) if rate_limit else None
+        self.metrics = ServerMetrics(metrics_labels)
+        # Bots para las salas que esperan más de bot_wait segundos (None = sin bots);
+        # bot_options: workers, max_games, budgets de BotPool
+        self.bot_wait = bot_wait
+        self.bots = BotPool(self.metrics, bot_difficulty, **(bot_options or {})) \
+            if bot_wait is not None else None
+        # Pistas y revisión ('hint' / 'analyze'); analysis: opciones de AnalysisService (None = sin análisis)
+        self.analysis = AnalysisService(self.metrics, **analysis) if analysis is not None else None
+        self.metrics_port = metrics_port  # Puerto del endpoint /metrics (None = sin endpoint)
+        self.metrics_server = None
+        self.register_gauges()
 
     def start(self):
-        """Inicia el servidor"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(100)  # Soportar muchas conexiones
-        self.running = True
+        """Inicia el servidor (bloquea hasta Ctrl+C)"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            log.info('server_interrupted')
 
-        print(f"🎮 Servidor Othello Multi-Sala")
-        print(f"📡 Iniciado en {self.host}:{self.port}")
-        print(f"♾️  Soporta partidas ilimitadas simultáneas")
-        print(f"⏳ Esperando jugadores...")
+    async def serve(self):
+        """Acepta conexiones hasta que se llame a stop()"""
+        raise_file_limit()
+        self.open_journal()
+        await self.listen()
+        self.running = True
 
-        accept_thread = threading.Thread(target=self.accept_clients)
-        accept_thread.daemon = True
-        accept_thread.start()
+        log.info('server_started', host=self.host, port=self.port)
 
-        # Thread para mostrar estadísticas
-        stats_thread = threading.Thread(target=self.show_stats)
-        stats_thread.daemon = True
-        stats_thread.start()
+        self.timer_task = asyncio.create_task(self.run_timers())
+        await self.start_metrics()
+        if self.bots:
+            self.bots.start()
+        if self.journal:
+            self.snapshot_task = asyncio.create_task(self.take_snapshots())
 
         try:
-            while self.running:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("\n🛑 Deteniendo servidor...")
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
             self.stop()
 
-    def accept_clients(self):
-        """Acepta conexiones de clientes"""
-        while self.running:
-            try:
-                client_socket, address = self.server_socket.accept()
-                client_socket.settimeout(0.5)
-
-                print(f"✅ Cliente conectado: {address}")
-
-                client_handler = ClientHandler(client_socket, address, self)
+    async def listen(self):
+        """Abre el socket de escucha (self.server)"""
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, backlog=self.backlog)
 
-                with self.lock:
-                    self.clients.append(client_handler)
+    async def handle_connection(self, reader, writer):
+        """Atiende una conexión nueva durante toda su vida"""
+        start = time.perf_counter()
+        client_handler = ClientHandler(reader, writer, self)
+        self.register(client_handler)
 
-                # Intentar emparejar inmediatamente
-                self.match_player(client_handler)
+        # Intentar emparejar inmediatamente
+        self.match_player(client_handler)
+        self.metrics.accept_seconds.observe(time.perf_counter() - start)
 
-                # Iniciar hilo de recepción
-                receive_thread = threading.Thread(target=client_handler.receive_messages)
-                receive_thread.daemon = True
-                receive_thread.start()
+        await client_handler.receive_messages()
 
-            except Exception as e:
-                if self.running:
-                    print(f"❌ Error aceptando cliente: {e}")
+    def register(self, client_handler):
+        """Da de alta una conexión: su tarea escritora y su control de vida"""
+        log.info('client_connected', client=client_handler.peer, transport=client_handler.transport)
+        self.clients.add(client_handler)
+        self.metrics.connections.inc()
+        client_handler.writer_task = asyncio.create_task(client_handler.write_messages())
+        self.watch(client_handler)
 
     def match_player(self, client_handler):
-        """Empareja a un jugador (matchmaking)"""
-        with self.lock:
-            # Buscar una sala disponible
-            available_room = None
-            for room_id, room in self.rooms.items():
-                if not room.is_full() and not room.started:
-                    available_room = room
-                    break
+        """Empareja a un jugador (matchmaking) en O(1)"""
+        # La sala que más tiempo lleva esperando en el pool del jugador
+        available_room = self.matchmaker.find_room(client_handler)
 
-            if available_room:
-                # Agregar a sala existente
-                available_room.add_player(client_handler)
-
-                # Enviar mensaje de bienvenida
-                welcome_msg = {
-                    'type': 'welcome',
-                    'message': f'Bienvenido! Eres el jugador {"Negro" if client_handler.player_color == 1 else "Blanco"}',
-                    'player_color': client_handler.player_color
-                }
-                client_handler.send_message(welcome_msg)
-
-                print(f"🎯 Cliente {client_handler.address} asignado a sala {available_room.room_id[:8]} como jugador {client_handler.player_color}")
-
-                # Si la sala está llena, iniciar juego
-                if available_room.is_full():
-                    available_room.start_game()
-                else:
-                    waiting_msg = {
-                        'type': 'waiting',
-                        'message': 'Esperando oponente...'
-                    }
-                    client_handler.send_message(waiting_msg)
-            else:
-                # Crear nueva sala
-                new_room_id = str(uuid.uuid4())
-                new_room = GameRoom(new_room_id)
-                self.rooms[new_room_id] = new_room
+        if available_room:
+            self.join_room(available_room, client_handler)
+        else:
+            self.create_room(client_handler)
+
+    def join_room(self, room, client_handler):
+        """Sienta a un jugador en una sala existente; inicia el juego si se llena"""
+        room.add_player(client_handler)
+        if self.journal:
+            self.journal.player_joined(room.room_id, client_handler.player_color)
+
+        # Enviar mensaje de bienvenida
+        welcome_msg = {
+            'type': 'welcome',
+            'message': f'Bienvenido! Eres el jugador {"Negro" if client_handler.player_color == 1 else "Blanco"}',
+            'player_color': client_handler.player_color,
+            'session': self.sessions.issue(room.room_id, client_handler.player_color),
+            'features': FEATURES
+        }
+        client_handler.send_message(welcome_msg)
 
-                new_room.add_player(client_handler)
+        log.info('player_seated', room.room_id, client=client_handler.peer, player=client_handler.player_color)
 
-                # Enviar mensaje de bienvenida
-                welcome_msg = {
-                    'type': 'welcome',
-                    'message': f'Bienvenido! Eres el jugador Negro',
-                    'player_color': 1
-                }
-                client_handler.send_message(welcome_msg)
+        # Si la sala está llena, iniciar juego
+        if room.is_full():
+            room.start_game()
+        else:
+            waiting_msg = {
+                'type': 'waiting',
+                'message': 'Esperando oponente...'
+            }
+            client_handler.send_message(waiting_msg)
+
+    def create_room(self, client_handler, room_id=None):
+        """Crea una sala nueva con el jugador esperando oponente"""
+        new_room_id = room_id or str(uuid.uuid4())
+        new_room = self.open_room(new_room_id)
+
+        new_room.add_player(client_handler)
+        if self.journal:
+            self.journal.player_joined(new_room_id, 1)
+        self.matchmaker.enqueue(new_room, client_handler)
+
+        # Enviar mensaje de bienvenida
+        welcome_msg = {
+            'type': 'welcome',
+            'message': f'Bienvenido! Eres el jugador Negro',
+            'player_color': 1,
+            'session': self.sessions.issue(new_room_id, 1),
+            'features': FEATURES
+        }
+        client_handler.send_message(welcome_msg)
 
-                waiting_msg = {
-                    'type': 'waiting',
-                    'message': 'Esperando oponente...'
-                }
-                client_handler.send_message(waiting_msg)
+        waiting_msg = {
+            'type': 'waiting',
+            'message': 'Esperando oponente...'
+        }
+        client_handler.send_message(waiting_msg)
+
+        log.info('room_created', new_room_id, client=client_handler.peer, pool=new_room.pool)
+        return new_room
+
+    def open_room(self, room_id):
+        """Sala nueva y vacía del servidor: registrada en el diario y con la espera del bot"""
+        room = self.rooms[room_id] = self.make_room(room_id)
+        if self.journal:
+            self.journal.room_created(room_id)
+        if self.bots:
+            self.timers.schedule(self.bot_wait, self.offer_bot, room)
+        return room
+
+    def make_room(self, room_id):
+        """GameRoom conectada al diario, archivo, métricas y temporizadores del servidor"""
+        room = GameRoom(room_id, self.metrics)
+        room.journal = self.journal
+        room.archive = self.archive
+        room.timers = self.timers
+        room.move_timeout = self.move_timeout
+        return room
+
+    def spectate(self, client_handler, room_id=None):
+        """Convierte al cliente en espectador de room_id (o de la partida más reciente).
+
+        Toda conexión nueva se empareja al llegar, así que quien quiere
+        observar puede dejar su asiento mientras no se haya jugado: si ya
+        tenía oponente, este vuelve a la cola de emparejamiento.
+        """
+        current = client_handler.room
+        room = self.rooms.get(room_id) if room_id else next(
+            (room for room in reversed(self.rooms.values()) if room.started and room is not current), None)
+        if room is None or room is current:
+            client_handler.send_message({'type': 'error', 'message': 'Sala no encontrada'})
+            return
+
+        if not self.leave_seat(client_handler):
+            client_handler.send_message({
+                'type': 'error',
+                'message': 'Un jugador no puede ser espectador con su partida en curso'
+            })
+            return
+
+        if client_handler.spectating:
+            client_handler.spectating.remove_spectator(client_handler)
+        room.add_spectator(client_handler)
+        log.info('spectator_joined', room.room_id, client=client_handler.peer, spectators=len(room.spectators))
+
+    def leave_seat(self, client_handler, forfeit=False):
+        """Libera el asiento que el cliente recibió al conectarse.
+
+        Mientras no se haya jugado, si ya tenía oponente este vuelve a la cola
+        de emparejamiento. Con la partida en curso solo se puede con forfeit:
+        el cliente la pierde y la sala queda para su oponente. Retorna False
+        si no se pudo.
+        """
+        current = client_handler.room
+        if current is None:
+            return True
+        if current.started and current.game.seq > 0:
+            if not forfeit:
+                return False
+            current.remove_player(client_handler)
+            # El fin de la partida pasa por la cola de la sala: self.game solo se toca desde su tarea
+            current.submit(None, {'type': 'forfeit', 'player': client_handler.player_color})
+            return True
+        opponents = [player for player in current.players if player is not client_handler]
+        for player in list(current.players):
+            current.remove_player(player)
+        self.delete_room(current)
+        for player in opponents:
+            if player.transport == 'bot':
+                player.leave()
+            else:
+                self.match_player(player)
+        return True
 
-                print(f"🆕 Nueva sala {new_room_id[:8]} creada para {client_handler.address}")
+    def resume(self, client_handler, token, seq=None):
+        """Devuelve a un jugador reconectado su asiento y lo pone al día desde seq"""
+        seat = self.sessions.verify(token)
+        room = self.rooms.get(seat[0]) if seat else None
+        stale = next((player for player in room.players if player.player_color == seat[1]), None) \
+            if room else None
+        if room is None or (seat[1] not in room.away and stale is None) or room is client_handler.room:
+            client_handler.send_message({
+                'type': 'resume_failed',
+                'message': 'Sesión no encontrada o expirada'
+            })
+            return
+        # El asiento provisional de la conexión nueva se deja aunque su oponente
+        # ya haya movido: esa partida la pierde y vuelve a la que retoma
+        self.leave_seat(client_handler, forfeit=True)
+        if client_handler.spectating:
+            client_handler.spectating.remove_spectator(client_handler)
+
+        if stale is not None:
+            # La conexión vieja todavía no notó el corte: el token manda, se descarta
+            room.remove_player(stale)
+            stale.disconnect()
+
+        room_id, color = seat
+        room.reseat(client_handler, color)
+        self.metrics.resumes.inc()
+        client_handler.send_message({
+            'type': 'resumed',
+            'room_id': room_id,
+            'player_color': color,
+            'session': token,
+            'seq': room.game.seq,
+            'features': FEATURES
+        })
+        room.catch_up(client_handler, seq)
+        room.broadcast({
+            'type': 'opponent_returned',
+            'player_color': color,
+            'message': 'Tu oponente volvió'
+        }, exclude=client_handler, spectators=True)
+        log.info('session_resumed', room_id, client=client_handler.peer, player=color)
+
+    def expire_seat(self, room, color):
+        """Terminó la gracia de un asiento: la partida queda abandonada como antes"""
+        if room.away.pop(color, None) is None or self.rooms.get(room.room_id) is not room:
+            return
+        room.broadcast({
+            'type': 'opponent_disconnected',
+            'message': 'Tu oponente se desconectó'
+        })
+        for spectator in list(room.spectators):
+            spectator.send_message({
+                'type': 'player_disconnected',
+                'player_color': color,
+                'message': 'Un jugador se desconectó'
+            })
+        if room.is_empty() and not room.away:
+            self.delete_room(room)
+            log.info('room_expired', room.room_id, recovered=room.recovered)
+
+    def offer_bot(self, room):
+        """Venció la espera de una sala: se sienta un bot si el jugador lo acepta y hay cupo"""
+        if self.rooms.get(room.room_id) is not room or room.started or len(room.players) != 1:
+            return
+        player = room.players[0]
+        difficulty = player.profile.get('bot', self.bots.difficulty)
+        if difficulty is False:
+            return  # El jugador no quiere bot (el join ya validó el valor)
+        if not self.bots.available():
+            self.timers.schedule(self.bot_wait, self.offer_bot, room)
+            return
+        self.matchmaker.remove(room)
+        bot = self.bots.seat(self, difficulty)
+        log.info('bot_seated', room.room_id, client=player.peer, difficulty=difficulty)
+        self.join_room(room, bot)
+
+    def remove_bot(self, bot):
+        """Un bot deja su sala (partida terminada u oponente ido); la sala vacía se elimina"""
+        room = bot.room
+        if room is None:
+            return
+        room.remove_player(bot)
+        if room.is_empty() and not room.away and self.rooms.get(room.room_id) is room:
+            self.delete_room(room)
+            log.info('room_deleted', room.room_id)
+
+    def analyze(self, client_handler, message):
+        """'hint' (posición actual de su sala) o 'analyze' (la posición del mensaje).
+
+        Se responde 'analysis' cuando el servicio tenga el resultado; 'id' se
+        devuelve tal cual para que el cliente empareje pedidos y respuestas.
+        """
+        reply = {'type': 'analysis'}
+        if 'id' in message:
+            reply['id'] = message['id']
+        if self.analysis is None:
+            client_handler.send_message({**reply, 'type': 'error', 'message': 'Análisis no disponible'})
+            return
+
+        if message.get('type') == 'hint':
+            room = client_handler.room or client_handler.spectating
+            if room is None or not room.started or room.game.game_over:
+                client_handler.send_message({**reply, 'type': 'error', 'message': 'No hay partida en curso'})
+                return
+            board, player = room.game.board, room.game.current_player
+            reply['seq'] = room.game.seq
+        else:
+            board, player = message.get('board'), message.get('player')
+
+        try:
+            future = self.analysis.request(board, player, message.get('depth'))
+        except (ValueError, TypeError) as e:
+            client_handler.send_message({**reply, 'type': 'error', 'message': f'Posición inválida: {e}'})
+            return
+        except AnalysisBusy as e:
+            client_handler.send_message({**reply, 'type': 'error', 'message': str(e)})
+            return
+
+        def deliver(future):
+            if future.cancelled() or future.exception() is not None:
+                client_handler.send_message({**reply, 'type': 'error', 'message': 'Falló el análisis'})
+            else:
+                client_handler.send_message({**reply, **future.result()})
+        future.add_done_callback(deliver)
+
+    def list_rooms(self):
+        """Partidas en curso, para elegir cuál observar"""
+        return [{
+            'room_id': room.room_id,
+            'seq': room.game.seq,
+            'scores': room.game.get_scores(),
+            'spectators': len(room.spectators),
+        } for room in self.rooms.values() if room.started]
+
+    def requeue(self, client_handler):
+        """Vuelve a emparejar a un jugador que espera si su pool cambió (tras un 'join')"""
+        if client_handler.spectating:
+            # Un espectador que manda 'join' deja de observar y pasa a jugar
+            client_handler.spectating.remove_spectator(client_handler)
+            self.match_player(client_handler)
+            return
+
+        room = client_handler.room
+        if not room or room.started or len(room.players) != 1:
+            return
+        if self.matchmaker.pool_key(client_handler) == room.pool:
+            return
+
+        room.remove_player(client_handler)
+        self.delete_room(room)
+        self.match_player(client_handler)
+
+    def delete_room(self, room):
+        """Elimina una sala (y la cierra en el diario)"""
+        for spectator in list(room.spectators):
+            room.remove_spectator(spectator)
+            spectator.send_message({'type': 'room_closed', 'room_id': room.room_id})
+        for handle in room.away.values():
+            handle.cancel()
+        room.away.clear()
+        self.matchmaker.remove(room)
+        room.close()
+        del self.rooms[room.room_id]
+        # Al detener el servidor las salas no se cierran: se recuperan al volver
+        if self.running:
+            room.archive_game(FLAG_ABANDONED)
+            if self.journal:
+                self.journal.room_closed(room.room_id)
 
     def remove_client(self, client_handler):
         """Remueve un cliente desconectado"""
-        with self.lock:
-            if client_handler in self.clients:
-                self.clients.remove(client_handler)
-                print(f"📤 Cliente {client_handler.address} removido")
-
-            # Si estaba en una sala, notificar al otro jugador
-            if client_handler.room:
-                room = client_handler.room
-                room.remove_player(client_handler)
-
-                # Notificar a los otros jugadores de la sala
-                disconnect_msg = {
-                    'type': 'opponent_disconnected',
-                    'message': 'Tu oponente se desconectó'
-                }
-                room.broadcast(disconnect_msg, exclude=client_handler)
-
-                # Si la sala quedó vacía, eliminarla
-                if room.is_empty():
-                    del self.rooms[room.room_id]
-                    print(f"🗑️  Sala {room.room_id[:8]} eliminada (vacía)")
-
-    def show_stats(self):
-        """Muestra estadísticas periódicamente"""
+        if client_handler in self.clients:
+            self.clients.remove(client_handler)
+            log.info('client_removed', client=client_handler.peer)
+
+        if client_handler.spectating:
+            client_handler.spectating.remove_spectator(client_handler)
+
+        # Si estaba en una sala, notificar al otro jugador
+        if client_handler.room:
+            room = client_handler.room
+            room.remove_player(client_handler)
+
+            if room.started and not room.game.game_over and self.running and self.resume_grace > 0:
+                # Se le guarda el asiento: puede volver con su token de sesión
+                color = client_handler.player_color
+                room.away[color] = self.timers.schedule(self.resume_grace, self.expire_seat, room, color)
+                room.broadcast({
+                    'type': 'opponent_away',
+                    'player_color': color,
+                    'grace': self.resume_grace,
+                    'message': 'Tu oponente perdió la conexión, se le guarda el asiento'
+                }, spectators=True)
+                return
+
+            # Notificar a los otros jugadores de la sala
+            disconnect_msg = {
+                'type': 'opponent_disconnected',
+                'message': 'Tu oponente se desconectó'
+            }
+            room.broadcast(disconnect_msg, exclude=client_handler)
+            for spectator in list(room.spectators):
+                spectator.send_message({
+                    'type': 'player_disconnected',
+                    'player_color': client_handler.player_color,
+                    'message': 'Un jugador se desconectó'
+                })
+
+            # Si la sala quedó vacía, eliminarla
+            if room.is_empty() and not room.away:
+                self.delete_room(room)
+                log.info('room_deleted', room.room_id)
+
+    async def run_timers(self):
+        """Avanza la rueda de temporizadores una vez por tick"""
         while self.running:
-            time.sleep(30)  # Cada 30 segundos
-            with self.lock:
-                active_games = sum(1 for room in self.rooms.values() if room.started)
-                waiting_rooms = sum(1 for room in self.rooms.values() if not room.started)
-                total_clients = len(self.clients)
-
-                print(f"\n📊 ESTADÍSTICAS:")
-                print(f"   👥 Clientes conectados: {total_clients}")
-                print(f"   🎮 Partidas activas: {active_games}")
-                print(f"   ⏳ Salas esperando: {waiting_rooms}")
-                print(f"   🏠 Salas totales: {len(self.rooms)}\n")
+            await asyncio.sleep(self.timers.tick)
+            self.timers.advance()
+
+    def watch(self, client_handler):
+        """Agenda el primer control de vida de una conexión nueva"""
+        first = self.ping_interval
+        if self.handshake_timeout is not None:
+            first = min(first, self.handshake_timeout)
+        client_handler.idle_timer = self.timers.schedule(first, self.check_idle, client_handler)
+
+    def check_idle(self, client_handler):
+        """Control de vida: ping si está en silencio, desconexión si no contesta.
+
+        Recibir datos solo actualiza last_seen; el temporizador se re-arma
+        acá para el próximo vencimiento posible, así que una conexión activa
+        cuesta un control cada ping_interval y no un re-agendado por mensaje.
+        """
+        if not client_handler.active:
+            return
+        now = self.timers.now()
+        silent = now - client_handler.last_seen
+        waiting_hello = self.handshake_timeout is not None and \
+            client_handler.last_seen == client_handler.connected_at
+
+        if waiting_hello and silent >= self.handshake_timeout:
+            self.metrics.handshake_timeouts.inc()
+            log.info('handshake_timeout', client=client_handler.peer)
+            client_handler.disconnect()
+            return
+        if client_handler.heartbeat and silent >= self.idle_timeout:
+            self.metrics.idle_disconnects.inc()
+            log.info('idle_disconnect', client=client_handler.peer, silent=round(silent, 1))
+            client_handler.disconnect()
+            return
+
+        if silent >= self.ping_interval:
+            self.metrics.pings.inc()
+            client_handler.send_message({'type': 'ping'})
+            deadlines = [self.ping_interval]
+        else:
+            deadlines = [self.ping_interval - silent]
+        if client_handler.heartbeat:
+            deadlines.append(self.idle_timeout - silent)
+        if waiting_hello:
+            deadlines.append(self.handshake_timeout - silent)
+        client_handler.idle_timer = self.timers.schedule(
+            max(min(deadlines), self.timers.tick), self.check_idle, client_handler)
+
+    def register_gauges(self):
+        """Gauges que se calculan al consultar /metrics (nada que mantener en el camino caliente)"""
+        registry = self.metrics.registry
+        rooms = self.rooms
+        registry.gauge('othello_clients', 'Conexiones abiertas', lambda: len(self.clients))
+        registry.gauge('othello_spectators', 'Espectadores',
+                       lambda: sum(len(room.spectators) for room in rooms.values()))
+        registry.gauge('othello_games_active', 'Partidas en curso',
+                       lambda: sum(1 for room in rooms.values() if room.started))
+        registry.gauge('othello_rooms_waiting', 'Salas esperando oponente',
+                       lambda: sum(1 for room in rooms.values() if not room.started))
+        registry.gauge('othello_seats_away', 'Asientos guardados a jugadores desconectados',
+                       lambda: sum(len(room.away) for room in rooms.values()))
+        registry.gauge('othello_outbound_pending_messages', 'Mensajes encolados sin escribir',
+                       lambda: sum(len(client.outbound) for client in self.clients))
+        registry.gauge('othello_matchmaking_queue_depth', 'Salas en las colas de emparejamiento',
+                       lambda: sum(self.matchmaker.queue_depth().values()))
+        registry.gauge('othello_matchmaking_wait_p95_seconds', 'Espera para emparejar (p95)',
+                       self.matchmaker.p95_wait)
+        registry.gauge('othello_journal_records', 'Registros escritos en el diario',
+                       lambda: self.journal.records if self.journal else 0)
+        registry.gauge('othello_journal_commits', 'Escrituras (fsync) del diario',
+                       lambda: self.journal.commits if self.journal else 0)
+        if self.limiter:
+            limiter = self.limiter
+            registry.counter('othello_rate_limited_dropped_total', 'Mensajes descartados por límite',
+                             lambda: limiter.dropped)
+            registry.counter('othello_rate_limited_delayed_total', 'Esperas por límite de mensajes',
+                             lambda: limiter.delayed)
+            registry.counter('othello_rate_limited_disconnects_total', 'Conexiones cerradas por límite',
+                             lambda: limiter.disconnected)
+        if self.bots:
+            bots = self.bots
+            registry.gauge('othello_bot_games_active', 'Partidas con bot en curso', lambda: bots.games)
+            registry.gauge('othello_bot_moves_pending', 'Movimientos de bot esperando al pool',
+                           lambda: bots.pending)
+        if self.analysis:
+            analysis = self.analysis
+            registry.gauge('othello_analysis_queue_length', 'Posiciones esperando un proceso de análisis',
+                           lambda: len(analysis.queue))
+            registry.gauge('othello_analysis_computing', 'Posiciones analizándose en el pool',
+                           lambda: analysis.computing)
+            registry.gauge('othello_analysis_cache_entries', 'Posiciones en la caché de análisis',
+                           lambda: len(analysis.cache))
+        registry.gauge('othello_timers_pending', 'Temporizadores agendados en la rueda', lambda: len(self.timers))
+        registry.gauge('othello_log_pending', 'Registros esperando al escritor', lambda: len(log.ring))
+        registry.gauge('othello_log_dropped', 'Registros perdidos por buffer lleno', lambda: log.dropped)
+
+    async def start_metrics(self):
+        """Abre el endpoint /metrics en su propio puerto"""
+        if self.metrics_port is None:
+            return
+        self.metrics_server = MetricsServer(self.metrics.render, self.host, self.metrics_port)
+        await self.metrics_server.start()
+        log.info('metrics_listening', host=self.host, port=self.metrics_port)
+
+    def open_journal(self):
+        """Abre el diario y restaura las partidas que estaban en curso"""
+        if not self.journal_dir:
+            return
+        self.journal = Journal(self.journal_dir)
+        recovered, replayed = self.journal.recover()
+
+        restored = 0
+        for state in recovered.values():
+            if state['game_over'] or len(state['players']) < 2:
+                # Partidas terminadas o que nunca empezaron: nada que retomar
+                self.journal.room_closed(state['room_id'])
+                continue
+            room = self.make_room(state['room_id'])
+            room.game.moves = state.get('moves', [])
+            room.game.board = np.array(state['board'], dtype=int)
+            room.game.invalidate_cache()
+            room.game.current_player = state['current_player']
+            room.game.seq = state['seq']
+            room.started = True
+            room.recovered = True
+            # Los dos asientos esperan a que sus jugadores vuelvan con su sesión
+            for color in (1, 2):
+                room.away[color] = self.timers.schedule(self.recovery_grace, self.expire_seat, room, color)
+            self.rooms[room.room_id] = room
+            restored += 1
+
+        log.info('journal_recovered', directory=self.journal_dir, replayed=replayed, restored=restored)
+
+    async def take_snapshots(self):
+        """Instantánea periódica de las salas: acota el diario que hay que reaplicar"""
+        while self.running:
+            await asyncio.sleep(self.snapshot_interval)
+            self.journal.snapshot(self.snapshot_states())
+
+    def snapshot_states(self):
+        """Estado de todas las salas vivas para la instantánea del diario.
+
+        También van las que esperan oponente: la instantánea borra los
+        segmentos con su ROOM_CREATED, y sin él los registros de la partida
+        que empiece después se descartarían al recuperar.
+        """
+        return [
+            room_state(room.room_id, room.game,
+                       [player.player_color for player in room.players] + list(room.away))
+            for room in self.rooms.values()
+        ]
 
     def stop(self):
         """Detiene el servidor"""
+        if not self.running:
+            return
         self.running = False
-        for client in self.clients[:]:
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.timer_task:
+            self.timer_task.cancel()
+        if self.bots:
+            self.bots.close()
+        if self.analysis:
+            self.analysis.close()
+        if self.snapshot_task:
+            self.snapshot_task.cancel()
+        for client in list(self.clients):
             client.disconnect()
-        if self.server_socket:
-            self.server_socket.close()
-        print("👋 Servidor detenido")
+        if self.journal:
+            self.journal.close()
+        if self.archive:
+            self.archive.close()
+        if self.server:
+            self.server.close()
+        log.info('server_stopped')
+
+
+def raise_file_limit():
+    """Sube el límite de descriptores abiertos al máximo permitido (una conexión = un fd)"""
+    try:
+        import resource
+    except ImportError:
+        return  # Windows
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = 1048576 if hard == resource.RLIM_INFINITY else hard
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            pass
 
 
 if __name__ == "__main__":
@@ -479,5 +1391,28 @@ if __name__ == "__main__":
     port_input = input("\nPuerto [5555]: ").strip()
     port = int(port_input) if port_input.isdigit() else 5555
 
-    server = OthelloServerMultiRoom(host='0.0.0.0', port=port)
-    server.start()
\ No newline at end of file
+    # JOURNAL_DIR activa el diario: las partidas sobreviven a un reinicio
+    # ARCHIVE_PATH guarda cada partida terminada en el archivo de partidas
+    # METRICS_PORT expone /metrics (Prometheus) en ese puerto
+    # LOG_LEVEL, LOG_FORMAT, LOG_FILE y LOG_SAMPLE configuran el registro (ver registro.py)
+    # MOVE_TIMEOUT (segundos por turno) y HANDSHAKE_TIMEOUT (hasta el primer mensaje)
+    # RATE_LIMIT_ACTION: drop | delay | disconnect con los mensajes que exceden el límite
+    # BOT_WAIT (segundos esperando oponente antes de sentar un bot; vacío = sin bots)
+    # y BOT_DIFFICULTY (easy | medium | hard, si el jugador no pide otra)
+    # ANALYSIS_WORKERS (procesos del servicio de análisis: 'hint' y 'analyze'; vacío = sin análisis)
+    metrics_port = os.environ.get("METRICS_PORT")
+    move_timeout = os.environ.get("MOVE_TIMEOUT")
+    handshake_timeout = os.environ.get("HANDSHAKE_TIMEOUT")
+    bot_wait = os.environ.get("BOT_WAIT")
+    analysis_workers = os.environ.get("ANALYSIS_WORKERS")
+    server = OthelloServerMultiRoom(host='0.0.0.0', port=port,
+                                    journal_dir=os.environ.get("JOURNAL_DIR"),
+                                    archive_path=os.environ.get("ARCHIVE_PATH"),
+                                    metrics_port=int(metrics_port) if metrics_port else None,
+                                    move_timeout=float(move_timeout) if move_timeout else None,
+                                    handshake_timeout=float(handshake_timeout) if handshake_timeout else None,
+                                    rate_action=os.environ.get("RATE_LIMIT_ACTION", DEMORAR),
+                                    bot_wait=float(bot_wait) if bot_wait else None,
+                                    bot_difficulty=os.environ.get("BOT_DIFFICULTY", "medium"),
+                                    analysis={'workers': int(analysis_workers)} if analysis_workers else None)
+    server.start()
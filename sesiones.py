@@ -0,0 +1,102 @@
+# sesiones.py - Sesiones para retomar una partida tras una desconexión
+#
+# El 'welcome' trae un token de sesión que identifica el asiento del jugador:
+#
+#   {"type": "welcome", "player_color": 1, "session": "<sala>.<color>.<firma>", ...}
+#
+# La firma es un HMAC-SHA256 de "sala:color" con un secreto del servidor, así
+# que no hace falta una tabla de sesiones: basta verificar la firma y buscar
+# la sala. Con diario, el secreto se guarda en su directorio y los tokens
+# siguen valiendo después de un reinicio (las salas restauradas esperan a sus
+# jugadores).
+#
+# Cuando un jugador se desconecta a mitad de partida, el servidor le guarda
+# el asiento durante un período de gracia y avisa al oponente con
+# 'opponent_away'. Para volver, el cliente abre una conexión nueva y manda
+# enseguida su hello (ya conoce las características del servidor) y:
+#
+#   {"type": "resume", "session": "<token>", "seq": 17}
+#
+# con el seq del último estado que vio, sin esperar el welcome: el servidor
+# empareja cada conexión al llegar y el resume deja ese asiento provisional
+# (si su nuevo oponente ya movió, esa partida se cierra y la gana él). Si la
+# conexión vieja sigue abierta (el servidor aún no notó el corte), el token
+# la reemplaza.
+#
+# El cliente recibe {"type": "resumed", ...} y luego solo lo que se perdió:
+# los game_delta con seq > 17 si pidió deltas y siguen en el historial de la
+# sala, o un único estado completo. Si la sesión expiró (o la partida terminó
+# mientras estaba desconectado) recibe 'resume_failed'.
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from collections import deque
+
+GRACIA_SESION = 60  # Segundos que se guarda el asiento de un jugador desconectado
+HISTORIAL = 64  # Deltas que guarda cada sala para ponerse al día
+
+SECRET_FILE = 'sesiones.key'
+
+
+class SessionTokens:
+    """Emite y verifica tokens de asiento firmados con HMAC"""
+
+    def __init__(self, secret=None):
+        self.secret = secret or secrets.token_bytes(32)
+
+    @classmethod
+    def load(cls, directory):
+        """Secreto persistente en directory (se crea la primera vez)"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, SECRET_FILE)
+        try:
+            with open(path, 'rb') as f:
+                return cls(f.read())
+        except FileNotFoundError:
+            tokens = cls()
+            with open(path, 'wb') as f:
+                f.write(tokens.secret)
+            return tokens
+
+    def sign(self, room_id, color):
+        digest = hmac.new(self.secret, f'{room_id}:{color}'.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:18]).decode()
+
+    def issue(self, room_id, color):
+        return f'{room_id}.{color}.{self.sign(room_id, color)}'
+
+    def verify(self, token):
+        """Retorna (room_id, color) o None si el token no es válido"""
+        try:
+            room_id, color, signature = token.rsplit('.', 2)
+            color = int(color)
+        except (AttributeError, ValueError):
+            return None
+        if color not in (1, 2) or not hmac.compare_digest(signature, self.sign(room_id, color)):
+            return None
+        return room_id, color
+
+
+class MoveHistory:
+    """Últimos deltas de una partida (SharedMessage ya codificados) por seq"""
+
+    def __init__(self, maxlen=HISTORIAL):
+        self.deltas = deque(maxlen=maxlen)
+
+    def append(self, seq, message):
+        self.deltas.append((seq, message))
+
+    def clear(self):
+        self.deltas.clear()
+
+    def since(self, seq, current_seq):
+        """Deltas posteriores a seq, o None si el historial no cubre el hueco"""
+        if seq is None or seq > current_seq:
+            return None
+        if seq == current_seq:
+            return []
+        if not self.deltas or self.deltas[0][0] > seq + 1:
+            return None
+        return [message for delta_seq, message in self.deltas if delta_seq > seq]
@@ -0,0 +1,135 @@
+# temporizador.py - Rueda de temporizadores jerárquica para miles de conexiones
+#
+# Heartbeats, timeouts de inactividad y de turno, asientos guardados: cada
+# conexión tiene uno o más temporizadores y casi ninguno llega a vencer (se
+# cancela o se re-arma antes). Una rueda los agenda y cancela en O(1) y, en
+# cada tick, solo toca los que vencen ahí: detectar miles de conexiones
+# muertas cuesta O(vencidos), no O(conexiones).
+#
+# Niveles de SLOTS casillas: el nivel 0 tiene una casilla por tick, el nivel 1
+# una por cada SLOTS ticks, etc. Un temporizador lejano espera en un nivel
+# alto y baja (cascada) al nivel 0 cuando su casilla se acerca. Con tick de
+# 0.1 s, 256 casillas y 3 niveles se cubren ~19 días.
+#
+# La rueda no tiene hilo propio: quien la usa llama a advance() en cada tick
+# (el servidor multi-sala lo hace desde una tarea de asyncio).
+#
+# Heartbeat del servidor multi-sala (característica 'heartbeat'): a una
+# conexión que lleva PING_INTERVALO segundos sin mandar nada se le envía
+# {"type": "ping"} y el cliente contesta {"type": "pong"} (cualquier mensaje
+# cuenta como señal de vida). Los clientes que anuncian 'heartbeat' en su
+# hello (o que alguna vez contestaron un ping) se desconectan tras INACTIVIDAD
+# segundos de silencio; a los demás se los sigue pingueando y una conexión
+# medio abierta termina fallando al escribir.
+import time
+
+TICK = 0.1  # Segundos por tick
+SLOTS = 256  # Casillas por nivel
+NIVELES = 3
+
+PING_INTERVALO = 15  # Segundos de silencio antes de mandar un ping
+INACTIVIDAD = 45  # Segundos de silencio para dar por muerta una conexión con heartbeat
+
+
+class Timer:
+    """Temporizador agendado en una rueda; cancel() es O(1)"""
+    __slots__ = ('deadline', 'callback', 'args', 'slot')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline  # En ticks de la rueda
+        self.callback = callback
+        self.args = args
+        self.slot = None  # Casilla (set) donde está agendado
+
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+
+    def active(self):
+        return self.slot is not None
+
+
+class TimerWheel:
+    """Rueda de temporizadores jerárquica con resolución de un tick"""
+
+    def __init__(self, tick=TICK, slots=SLOTS, levels=NIVELES, clock=time.monotonic, on_error=None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.origin = clock()
+        self.current = 0  # Último tick procesado
+        self.fired = 0
+        self.on_error = on_error  # on_error(e) si un callback falla (None = propagar)
+
+    def __len__(self):
+        return sum(len(slot) for wheel in self.wheels for slot in wheel)
+
+    def now(self):
+        return self.clock()
+
+    def schedule(self, delay, callback, *args):
+        """Llama a callback(*args) dentro de delay segundos (redondeado al tick siguiente)"""
+        ticks = max(1, -int(-delay // self.tick))
+        timer = Timer(self.current + ticks, callback, args)
+        self.place(timer)
+        return timer
+
+    def place(self, timer):
+        """Pone el temporizador en el nivel que corresponde a su distancia"""
+        distance = timer.deadline - self.current
+        span = self.slots
+        for level in range(self.levels):
+            if distance < span or level == self.levels - 1:
+                index = (timer.deadline // (span // self.slots)) % self.slots
+                slot = self.wheels[level][index]
+                slot.add(timer)
+                timer.slot = slot
+                return
+            span *= self.slots
+
+    def advance(self, now=None):
+        """Procesa los ticks transcurridos hasta now; retorna cuántos vencieron"""
+        target = int(((self.clock() if now is None else now) - self.origin) / self.tick)
+        fired = 0
+        while self.current < target:
+            self.current += 1
+            self.cascade()
+            slot = self.wheels[0][self.current % self.slots]
+            if not slot:
+                continue
+            expired = list(slot)
+            slot.clear()
+            for timer in expired:
+                timer.slot = None
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    if self.on_error is None:
+                        raise
+                    self.on_error(e)
+            fired += len(expired)
+        self.fired += fired
+        return fired
+
+    def cascade(self):
+        """Al completar una vuelta de un nivel, baja la casilla siguiente del nivel superior.
+
+        Los niveles altos van primero: lo que baja de ellos puede caer en la
+        casilla del nivel 1 que se está bajando en este mismo tick.
+        """
+        spans = []
+        span = self.slots
+        for level in range(1, self.levels):
+            if self.current % span:
+                break
+            spans.append((level, span))
+            span *= self.slots
+        for level, span in reversed(spans):
+            slot = self.wheels[level][(self.current // span) % self.slots]
+            timers = list(slot)
+            slot.clear()
+            for timer in timers:
+                self.place(timer)